@@ -8,10 +8,21 @@ interface Point {
   z: number;
 }
 
+interface ScanSubscription {
+  scan_id: string | null;
+  resync: 'incremental' | 'snapshot';
+}
+
 interface ServerMessage {
-  type: 'initial_state' | 'new_points' | 'scan_cleared' | 'clear_response';
-  data?: Point[];
+  type:
+    | 'initial_state'
+    | 'new_points'
+    | 'scan_cleared'
+    | 'clear_response'
+    | 'scan_subscribed';
+  data?: Point[] | ScanSubscription;
   success?: boolean;
+  sequence?: number;
 }
 
 export const useLidar = () => {
@@ -23,6 +34,9 @@ export const useLidar = () => {
   const [lastUpdate, setLastUpdate] = useState<Date | null>(null);
   const [isClearing, setIsClearing] = useState(false);
   const wsRef = useRef<WebSocket | null>(null);
+  // Escaneo y último batch recibidos, para pedir sólo lo perdido al reconectar
+  const scanIdRef = useRef<string | null>(null);
+  const lastSequenceRef = useRef<number | null>(null);
 
   const connectWebSocket = () => {
     if (wsRef.current?.readyState === WebSocket.OPEN) {
@@ -48,16 +62,40 @@ export const useLidar = () => {
           color: 'success',
         });
 
-        // Registrarse como cliente web
-        ws.send(JSON.stringify({ type: 'register', client: 'web' }));
+        // Registrarse como cliente web; si ya tenemos puntos, sólo los que faltan
+        const register: Record<string, unknown> = {
+          type: 'register',
+          client: 'web',
+        };
+        if (scanIdRef.current !== null && lastSequenceRef.current !== null) {
+          register.scan = scanIdRef.current;
+          register.since = lastSequenceRef.current;
+          register.follow_latest = true;
+        }
+        ws.send(JSON.stringify(register));
       };
 
       ws.onmessage = (event) => {
         try {
           const message: ServerMessage = JSON.parse(event.data);
           console.log('Mensaje recibido:', message);
+          if (typeof message.sequence === 'number') {
+            lastSequenceRef.current = message.sequence;
+          }
 
           switch (message.type) {
+            case 'scan_subscribed': {
+              const subscription = message.data as ScanSubscription;
+              if (subscription.scan_id !== scanIdRef.current) {
+                lastSequenceRef.current = null;
+              }
+              scanIdRef.current = subscription.scan_id;
+              console.log(
+                `Suscrito a ${subscription.scan_id} (${subscription.resync})`
+              );
+              break;
+            }
+
             case 'initial_state':
               // Al conectarse, recibir el estado completo desde el servidor
               if (Array.isArray(message.data)) {
@@ -72,17 +110,16 @@ export const useLidar = () => {
             case 'new_points':
               // Agregar nuevos puntos a los existentes
               if (Array.isArray(message.data)) {
-                setPoints((prevPoints) => [
-                  ...prevPoints,
-                  ...(message.data ?? []),
-                ]);
+                const newPoints = message.data;
+                setPoints((prevPoints) => [...prevPoints, ...newPoints]);
                 setLastUpdate(new Date());
-                console.log(`Nuevos puntos agregados: ${message.data.length}`);
+                console.log(`Nuevos puntos agregados: ${newPoints.length}`);
               }
               break;
 
             case 'scan_cleared':
               // Limpiar todos los puntos cuando el servidor notifica limpieza
+              lastSequenceRef.current = null;
               setPoints([]);
               setLastUpdate(new Date());
               console.log('Escaneo limpiado por otro cliente');
@@ -0,0 +1,1148 @@
+"""Micro-benchmarks del servidor LiDAR.
+
+Uso:
+    python bench.py                 # todos los casos
+    python bench.py binary_decode   # un caso concreto
+    python bench.py stage_parse stage_process stage_redis stage_broadcast
+    python bench.py storage         # escritura y lectura de cada backend
+    python bench.py resync          # reconexión incremental frente al estado completo
+    python bench.py --save --label antes        # agrega la corrida al historial
+    python bench.py --compare --threshold 0.1   # compara contra la última guardada
+
+Las entradas son fijas (semillas constantes y capturas de ``data/``) y cada
+tiempo es el mejor de varias rondas. ``stage_redis`` y el backend redis de
+``storage`` usan ``REDIS_URL``.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import csv
+import json
+import os
+import platform
+import random
+import struct
+import subprocess
+import sys
+import tempfile
+import timeit
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import redis.asyncio as redis
+
+import main
+import parse
+from point_batch import (
+    CARTESIAN_COLUMNS,
+    decode_chunk,
+    encode_chunk,
+    encode_web_frame,
+)
+from device_link import DeviceLink
+from fanout import WebClient
+from scan_archive import (
+    ARCHIVE_RECORD_DTYPE,
+    ScanArchive,
+    archive_batch_bounds,
+    open_scan_archive,
+    scan_archive_path,
+)
+from payload_codecs import CODEC_IDS, available_codecs
+from storage import (
+    REDIS_SCANS_KEY,
+    STORAGE_BACKENDS,
+    MemoryScanStore,
+    RedisScanStore,
+    create_scan_store,
+    scan_chunks_key,
+    scan_points_key,
+)
+from voxel_lod import VoxelLods
+from sensor_protocol import (
+    BINARY_BATCH_HEADER_SIZE,
+    BINARY_BATCH_MAGIC,
+    BINARY_BATCH_VERSION,
+    BINARY_POINT_DTYPE,
+    BINARY_POINT_RECORD_SIZE,
+    compress_binary_batch,
+    decode_binary_sensor_batch,
+    encode_binary_sensor_batch_v2,
+    parse_binary_sensor_data,
+    unpack_binary_batch_header,
+)
+from tests.helpers import (
+    DEFAULT_SEED,
+    convert_scalar_loop,
+    make_binary_payload,
+    make_json_message,
+    make_mixed_traffic,
+    make_point_batch,
+    make_stage_batches,
+    make_text_message,
+    NullSocket,
+    parse_text_v2,
+    process_quietly,
+    reconnect,
+    route_sniffed,
+    route_speculative,
+)
+
+BENCH_SEED = DEFAULT_SEED
+# Capturas reales del LD19 (pan_deg, distance_mm, intensity, servo_deg)
+LD19_POINTS_GLOB = "experiments/ld19_precision/*/*_points.csv"
+DATA_ROOT = Path(__file__).resolve().parents[2] / "data"
+BENCH_HISTORY = (
+    DATA_ROOT / "services/lidar-server/performance_reports/bench_history.json"
+)
+BENCH_REGRESSION_THRESHOLD = 0.10
+STAGE_BATCH_SIZES = (100, 1000)
+STAGE_WEB_CLIENTS = (1, 10, 100)
+# Tiempos (case, impl, batch_size) -> us/batch de la corrida actual
+RESULTS = {}
+
+
+def report(case, impl, batch_size, seconds_per_batch):
+    points_s = batch_size / seconds_per_batch if seconds_per_batch > 0 else 0
+    RESULTS[(case, impl, batch_size)] = seconds_per_batch * 1e6
+    print(
+        "BENCH"
+        f"|case={case}"
+        f"|impl={impl}"
+        f"|batch_size={batch_size}"
+        f"|us_batch={seconds_per_batch * 1e6:.2f}"
+        f"|points_s={points_s:.0f}"
+    )
+
+
+def measure(func, repeat=5):
+    """Mejor tiempo por llamada (s) entre ``repeat`` rondas"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def _parse_binary_struct_loop(payload):
+    """Decodificador original: un ``struct.unpack_from`` y un dict por punto"""
+    header = unpack_binary_batch_header(payload)
+    inclination_tenths = header["inclination_tenths"]
+    point_count = header["point_count"]
+
+    inclination = inclination_tenths / 10.0
+    all_points = []
+
+    offset = BINARY_BATCH_HEADER_SIZE
+    for _ in range(point_count):
+        distance, intensity, pan_angle_tenths = struct.unpack_from(
+            "<HBH", payload, offset
+        )
+        offset += BINARY_POINT_RECORD_SIZE
+
+        all_points.append(
+            {
+                "inclination": inclination,
+                "distance": float(distance),
+                "intensity": float(intensity),
+                "pan_angle": pan_angle_tenths / 10.0,
+            }
+        )
+
+    return all_points
+
+
+def bench_binary_decode():
+    for batch_size in (100, 1000, 10000):
+        payload = make_binary_payload(batch_size)
+        reference = _parse_binary_struct_loop(payload)
+        batch = parse_binary_sensor_data(payload)
+        assert [point["distance"] for point in reference] == batch.distance.tolist()
+        assert [point["pan_angle"] for point in reference] == batch.pan_angle.tolist()
+
+        report(
+            "binary_decode",
+            "struct_loop",
+            batch_size,
+            measure(lambda: _parse_binary_struct_loop(payload)),
+        )
+        report(
+            "binary_decode",
+            "point_batch",
+            batch_size,
+            measure(lambda: parse_binary_sensor_data(payload)),
+        )
+        report(
+            "binary_decode",
+            "numpy_columns",
+            batch_size,
+            measure(lambda: decode_binary_sensor_batch(payload)),
+        )
+
+
+def bench_text_parse():
+    for batch_size in (100, 1000, 10000):
+        message = make_text_message(batch_size)
+        report(
+            "text_parse",
+            "v2_dicts",
+            batch_size,
+            measure(lambda: parse_text_v2(message)),
+        )
+        report(
+            "text_parse",
+            "token_loop",
+            batch_size,
+            measure(lambda: parse.parse_sensor_data_tokens(message)),
+        )
+        report(
+            "text_parse",
+            "numpy_bulk",
+            batch_size,
+            measure(lambda: parse.parse_sensor_data(message)),
+        )
+
+
+def _parse_json_stdlib(message):
+    """Camino original: ``json.loads`` y ``float()`` por campo de cada punto"""
+    return parse.parse_json_sensor_data_fields(json.loads(message))
+
+
+def bench_json_decode():
+    decoders = [
+        parse.JsonMessageDecoder(name) for name in parse.available_json_decoders()
+    ]
+    for batch_size in (100, 1000, 10000):
+        message = make_json_message(batch_size)
+        report(
+            "json_decode",
+            "stdlib_fields",
+            batch_size,
+            measure(lambda: _parse_json_stdlib(message)),
+        )
+        for decoder in decoders:
+            report(
+                "json_decode",
+                f"{decoder.backend}_columns",
+                batch_size,
+                measure(
+                    lambda: parse.parse_json_sensor_data(decoder.decode(message))
+                ),
+            )
+
+
+def bench_sniff():
+    messages = make_mixed_traffic()
+    decode = main.json_decoder.decode
+    routes = [route_sniffed(message, decode) for message in messages]
+    counts = {name: routes.count(name) for name in sorted(set(routes))}
+    print(
+        "BENCH|case=sniff_mix"
+        f"|decoder={main.json_decoder.backend}"
+        + "".join(f"|{name}={count}" for name, count in counts.items())
+    )
+
+    # Por tipo de trama y para la mezcla completa; µs por mensaje
+    groups = {
+        name: [message for message, r in zip(messages, routes) if r == name]
+        for name in counts
+    }
+    groups["mix"] = messages
+    for group, group_messages in groups.items():
+        for impl, route in (
+            ("speculative_json", route_speculative),
+            ("sniff", route_sniffed),
+        ):
+            seconds = measure(
+                lambda: [route(message, decode) for message in group_messages],
+                repeat=3,
+            )
+            report(f"sniff_{group}", impl, 1, seconds / len(group_messages))
+
+
+def make_sweep_columns(point_count, segments=1, seed=BENCH_SEED):
+    """Barrido del LD19: paneo creciente ~0.8° por punto y ``segments`` servos"""
+    rng = np.random.default_rng(seed)
+    pan = (rng.integers(0, 3600) + np.cumsum(rng.integers(6, 10, point_count))) % 3600
+    inclination = np.repeat(
+        rng.integers(-900, 900, segments), -(-point_count // segments)
+    )[:point_count]
+    return (
+        inclination.astype(np.int16),
+        rng.integers(20, 12000, point_count).astype(np.uint16),
+        rng.integers(0, 256, point_count).astype(np.uint8),
+        pan.astype(np.uint16),
+    )
+
+
+def bench_binary_v2():
+    for segments in (1, 4):
+        inclination, distance, intensity, pan = make_sweep_columns(1000, segments)
+        payload = encode_binary_sensor_batch_v2(
+            7, 123_456, inclination, distance, intensity, pan
+        )
+        header = unpack_binary_batch_header(payload)
+        assert header["sequence"] == 7 and header["timestamp_us"] == 123_456
+        assert header["pan_base_tenths"] is not None
+        batch = parse_binary_sensor_data(payload)
+        assert batch.inclination_tenths.tolist() == inclination.tolist()
+        assert batch.pan_angle_tenths.tolist() == pan.tolist()
+        assert batch.distance.tolist() == distance.tolist()
+
+    # Saltos de paneo que no entran en int8: paneo absoluto
+    payload = encode_binary_sensor_batch_v2(0, 0, 450, [1, 2], [3, 4], [0, 1800])
+    assert unpack_binary_batch_header(payload)["pan_base_tenths"] is None
+    assert parse_binary_sensor_data(payload).pan_angle_tenths.tolist() == [0, 1800]
+
+    link = DeviceLink()
+    for sequence in [0, 1, 2, 5, 3, 6, 6, 7, 0, 1]:
+        link.observe(sequence, sequence * 1000, 100 + sequence / 1000)
+    assert link.stats() == {
+        "received": 10,
+        "lost": 1,
+        "reordered": 1,
+        "duplicated": 1,
+        "resets": 1,
+    }, link.stats()
+
+    for batch_size in (100, 1000, 10000):
+        v1 = make_binary_payload(batch_size)
+        inclination, distance, intensity, pan = make_sweep_columns(batch_size, 4)
+        v2 = encode_binary_sensor_batch_v2(
+            1, 0, inclination, distance, intensity, pan
+        )
+        print(
+            "BENCH|case=binary_v2_size"
+            f"|batch_size={batch_size}"
+            f"|v1_bytes_point={len(v1) / batch_size:.3f}"
+            f"|v2_bytes_point={len(v2) / batch_size:.3f}"
+        )
+        report(
+            "binary_v2",
+            "v1_point_batch",
+            batch_size,
+            measure(lambda: parse_binary_sensor_data(v1)),
+        )
+        report(
+            "binary_v2",
+            "v2_point_batch",
+            batch_size,
+            measure(lambda: parse_binary_sensor_data(v2)),
+        )
+
+
+def load_ld19_columns(point_count, seed=BENCH_SEED):
+    """``(origen, columnas v2)`` de ``point_count`` puntos de capturas reales.
+
+    Si hacen falta más puntos que los capturados se repiten (origen
+    ``ld19_repeated``, que comprime mejor que lo real). Si no están los CSV de
+    ``data/`` se sintetiza un barrido por una sala rectangular con ruido.
+    """
+    rows = []
+    for path in sorted(DATA_ROOT.glob(LD19_POINTS_GLOB)):
+        with path.open(newline="", encoding="utf-8") as fh:
+            rows += [row for row in csv.DictReader(fh) if row.get("event") == "point"]
+
+    if rows:
+        source = "ld19" if len(rows) >= point_count else "ld19_repeated"
+        rows = (rows * (-(-point_count // len(rows))))[:point_count]
+        return source, (
+            np.array([round(float(row["servo_deg"]) * 10) for row in rows], np.int16),
+            np.array([int(row["distance_mm"]) for row in rows], np.uint16),
+            np.array([int(row["intensity"]) for row in rows], np.uint8),
+            np.array(
+                [round(float(row["pan_deg"]) * 10) % 3600 for row in rows], np.uint16
+            ),
+        )
+
+    rng = np.random.default_rng(seed)
+    inclination, _, _, pan = make_sweep_columns(point_count, 4, seed)
+    angle = np.radians(pan / 10.0)
+    # Distancia a las paredes de una sala de 6 x 4 m centrada en el sensor
+    wall = np.minimum(
+        3000 / np.maximum(np.abs(np.cos(angle)), 1e-3),
+        2000 / np.maximum(np.abs(np.sin(angle)), 1e-3),
+    )
+    distance = np.clip(wall + rng.normal(0, 15, point_count), 20, 12000)
+    intensity = np.clip(200 - wall / 40 + rng.normal(0, 5, point_count), 0, 255)
+    return "synthetic", (
+        inclination,
+        distance.astype(np.uint16),
+        intensity.astype(np.uint8),
+        pan,
+    )
+
+
+def bench_compression():
+    codecs = available_codecs()
+    for batch_size in (100, 1000, 10000):
+        source, columns = load_ld19_columns(batch_size)
+        payloads = {
+            "v1": make_binary_payload(batch_size),
+            "v2": encode_binary_sensor_batch_v2(0, 0, *columns),
+        }
+        # v1 con los mismos puntos reales (inclinación única)
+        v1 = bytearray(payloads["v1"][: BINARY_BATCH_HEADER_SIZE])
+        records = np.empty(batch_size, dtype=BINARY_POINT_DTYPE)
+        records["distance"], records["intensity"] = columns[1], columns[2]
+        records["pan_angle_tenths"] = columns[3]
+        payloads["v1"] = bytes(v1) + records.tobytes()
+
+        for version, payload in payloads.items():
+            reference = parse_binary_sensor_data(payload)
+            for codec in codecs:
+                compressed = compress_binary_batch(payload, CODEC_IDS[codec])
+                batch = parse_binary_sensor_data(compressed)
+                assert batch.distance.tolist() == reference.distance.tolist()
+                assert batch.pan_angle_tenths.tolist() == (
+                    reference.pan_angle_tenths.tolist()
+                )
+                print(
+                    "BENCH|case=compression_size"
+                    f"|source={source}|format={version}|codec={codec}"
+                    f"|batch_size={batch_size}"
+                    f"|raw_bytes={len(payload)}|compressed_bytes={len(compressed)}"
+                    f"|ratio={len(payload) / len(compressed):.3f}"
+                )
+                report(
+                    f"compression_{version}",
+                    f"{codec}_decode",
+                    batch_size,
+                    measure(lambda: parse_binary_sensor_data(compressed)),
+                )
+            report(
+                f"compression_{version}",
+                "raw_decode",
+                batch_size,
+                measure(lambda: parse_binary_sensor_data(payload)),
+            )
+
+
+def bench_cartesian():
+    for batch_size in (100, 1000, 10000):
+        batch = make_point_batch(batch_size)
+        report(
+            "cartesian",
+            "scalar_loop",
+            batch_size,
+            measure(lambda: convert_scalar_loop(batch)),
+        )
+        report(
+            "cartesian",
+            "numpy_batch",
+            batch_size,
+            measure(
+                lambda: main.quantize_coordinates(
+                    *main.convert_to_cartesian_batch(
+                        batch.inclination, batch.pan_angle, batch.distance
+                    )
+                )
+            ),
+        )
+
+
+def make_binary_stream(total_points, batch_size=100, seed=BENCH_SEED):
+    rng = np.random.default_rng(seed)
+    payloads = []
+    for batch_index in range(total_points // batch_size):
+        records = np.empty(batch_size, dtype=BINARY_POINT_DTYPE)
+        records["distance"] = rng.integers(20, 12000, batch_size)
+        records["intensity"] = rng.integers(0, 256, batch_size)
+        records["pan_angle_tenths"] = rng.integers(0, 3600, batch_size)
+        header = struct.pack(
+            "<2sBBhH",
+            BINARY_BATCH_MAGIC,
+            BINARY_BATCH_VERSION,
+            0,
+            batch_index % 1800 - 900,
+            batch_size,
+        )
+        payloads.append(header + records.tobytes())
+    return payloads
+
+
+def _process_binary_stream(payloads, convert):
+    for payload in payloads:
+        batch = parse_binary_sensor_data(payload)
+        main.quantize_coordinates(*convert(batch))
+
+
+def _convert_with_trig(batch):
+    return main.convert_to_cartesian_batch(
+        batch.inclination, batch.pan_angle, batch.distance
+    )
+
+
+def _convert_with_lut(batch):
+    return main.convert_tenths_to_cartesian_batch(
+        batch.inclination_tenths, batch.pan_angle_tenths, batch.distance
+    )
+
+
+def bench_trig_lut(total_points=1_000_000):
+    for batch_size in (100, 1000):
+        _bench_trig_lut_stream(total_points, batch_size)
+
+
+def _bench_trig_lut_stream(total_points, batch_size):
+    payloads = make_binary_stream(total_points, batch_size)
+
+    batch = parse_binary_sensor_data(payloads[0])
+    error = np.abs(
+        np.column_stack(_convert_with_trig(batch))
+        - np.column_stack(_convert_with_lut(batch))
+    ).max()
+    assert error < 1e-9, f"error LUT {error}"
+
+    for impl, convert in (("trig", _convert_with_trig), ("lut", _convert_with_lut)):
+        seconds = min(
+            timeit.repeat(
+                lambda: _process_binary_stream(payloads, convert), repeat=3, number=1
+            )
+        )
+        report(f"trig_lut_{total_points}", impl, batch_size, seconds / len(payloads))
+
+
+def _legacy_redis_entries(batch):
+    """Pares (campo, valor) que el HSET por punto original escribía en Redis"""
+    entries = []
+    for point in batch.to_client_points():
+        point_id = str(uuid.uuid4())
+        point_data = {**point, "id": point_id, "timestamp": datetime.now().isoformat()}
+        entries.append((point_id, json.dumps(point_data)))
+    return entries
+
+
+def bench_redis_footprint():
+    for batch_size in (100, 1000):
+        batch = main.process_sensor_points(make_point_batch(batch_size))
+        batch.device = "192.168.1.50:51234"
+        batch.received_at = 1_700_000_000.0
+
+        entries = _legacy_redis_entries(batch)
+        legacy_bytes = sum(len(key) + len(value) for key, value in entries)
+        chunk = encode_chunk(batch)
+        _, records = decode_chunk(chunk)
+        assert np.allclose(records["x"], batch.x, atol=1e-3)
+
+        for impl, commands, payload_bytes in (
+            ("hset_per_point", len(entries), legacy_bytes),
+            ("chunk_pipeline", 2, len(chunk)),
+        ):
+            print(
+                "BENCH"
+                "|case=redis_footprint"
+                f"|impl={impl}"
+                f"|batch_size={batch_size}"
+                f"|commands_batch={commands}"
+                f"|round_trips_batch={1 if impl == 'chunk_pipeline' else commands}"
+                f"|bytes_point={payload_bytes / batch_size:.1f}"
+            )
+
+        report(
+            "redis_encode",
+            "hset_per_point",
+            batch_size,
+            measure(lambda: _legacy_redis_entries(batch)),
+        )
+        report("redis_encode", "chunk", batch_size, measure(lambda: encode_chunk(batch)))
+
+
+def _encode_json_frame(batch):
+    return json.dumps({"type": "new_points", "data": batch.to_client_points()})
+
+
+def _encode_binary_frame(batch):
+    return encode_web_frame("new_points", batch.to_records())
+
+
+def bench_web_encoding():
+    for batch_size in (100, 1000):
+        batch = main.process_sensor_points(make_point_batch(batch_size))
+
+        for impl, encode in (("json", _encode_json_frame), ("binary", _encode_binary_frame)):
+            frame = encode(batch)
+            print(
+                "BENCH"
+                "|case=web_frame_size"
+                f"|impl={impl}"
+                f"|batch_size={batch_size}"
+                f"|bytes_point={len(frame) / batch_size:.1f}"
+            )
+            report("web_encoding", impl, batch_size, measure(lambda: encode(batch)))
+
+
+def make_rescanned_scene(
+    scene_points=20_000, sweeps=10, noise_mm=1.0, seed=BENCH_SEED
+):
+    """La misma escena barrida ``sweeps`` veces con ruido, como un escaneo largo"""
+    rng = np.random.default_rng(seed)
+    payloads = make_binary_stream(scene_points, 1000, seed)
+    scene = np.concatenate(
+        [
+            main.process_sensor_points(parse_binary_sensor_data(payload)).to_records()
+            for payload in payloads
+        ]
+    )
+    records = np.tile(scene, sweeps)
+    for axis in CARTESIAN_COLUMNS:
+        records[axis] += rng.normal(0, noise_mm, len(records)).astype(np.float32)
+    return records
+
+
+def bench_voxel_lod():
+    """Costo de actualizar los LOD y centroides enviados frente al stream crudo"""
+    records = make_rescanned_scene()
+
+    lods = VoxelLods(main.VOXEL_LOD_SIZES_MM)
+    sent = dict.fromkeys(lods.voxel_sizes, 0)
+    for start in range(0, len(records), 1000):
+        for voxel_size, centroids in lods.add(records[start : start + 1000]).items():
+            sent[voxel_size] += len(centroids)
+    for voxel_size, centroid_count in sent.items():
+        print(
+            "BENCH"
+            "|case=voxel_lod_points"
+            f"|impl={voxel_size:g}mm"
+            f"|raw_points={len(records)}"
+            f"|centroids_sent={centroid_count}"
+            f"|ratio={centroid_count / len(records):.3f}"
+        )
+
+    # Todas las resoluciones configuradas, como en publish_voxel_lods
+    for batch_size in (100, 1000):
+        batches = [
+            records[i : i + batch_size] for i in range(0, len(records), batch_size)
+        ]
+
+        def update():
+            lods = VoxelLods(main.VOXEL_LOD_SIZES_MM)
+            for batch in batches:
+                lods.add(batch)
+
+        seconds = min(timeit.repeat(update, repeat=3, number=1))
+        report("voxel_lod", "lods_add", batch_size, seconds / len(batches))
+
+
+def stage_inputs(batch_size):
+    """Mismos puntos en los tres protocolos, sintéticos y de capturas reales"""
+    sources = [("synthetic", make_sweep_columns(batch_size, 4))]
+    source, columns = load_ld19_columns(batch_size)
+    if source != "synthetic":
+        sources.append((source, columns))
+
+    for source, (inclination, distance, intensity, pan) in sources:
+        # Un grupo de texto por cambio de inclinación, como el firmware
+        changes = np.flatnonzero(np.diff(inclination)) + 1
+        groups = []
+        for start, stop in zip(
+            np.concatenate(([0], changes)), np.append(changes, batch_size)
+        ):
+            triples = ";".join(
+                f"{d};{i};{a / 10:g}"
+                for d, i, a in zip(
+                    distance[start:stop].tolist(),
+                    intensity[start:stop].tolist(),
+                    pan[start:stop].tolist(),
+                )
+            )
+            if stop < batch_size:
+                triples += f";{inclination[stop] / 10:g}"
+            groups.append(triples)
+        text = f"{inclination[0] / 10:g};" + "|".join(groups)
+
+        # JSON con una inclinación por mensaje, como network_exp.py
+        message = json.dumps(
+            {
+                "inclination": inclination[0] / 10,
+                "points": [
+                    {"a": a / 10, "d": d, "i": i}
+                    for d, i, a in zip(
+                        distance.tolist(), intensity.tolist(), pan.tolist()
+                    )
+                ],
+            }
+        )
+        binary = encode_binary_sensor_batch_v2(
+            0, 0, inclination, distance, intensity, pan
+        )
+        yield source, {"text": text, "json": message, "binary": binary}
+
+
+def bench_stage_parse():
+    decoder = parse.JsonMessageDecoder()
+    parsers = {
+        "text": parse.parse_sensor_data,
+        "json": lambda message: parse.parse_json_sensor_data(decoder.decode(message)),
+        "binary": parse_binary_sensor_data,
+    }
+    for batch_size in STAGE_BATCH_SIZES:
+        for source, messages in stage_inputs(batch_size):
+            batches = {
+                kind: parsers[kind](message) for kind, message in messages.items()
+            }
+            for kind, batch in batches.items():
+                assert len(batch) == batch_size, f"{kind}/{source}: {len(batch)}"
+                assert np.allclose(batch.distance, batches["binary"].distance)
+            for kind, message in messages.items():
+                parser = parsers[kind]
+                impl = f"{kind}_{decoder.backend}" if kind == "json" else kind
+                report(
+                    "stage_parse",
+                    f"{impl}/{source}",
+                    batch_size,
+                    measure(lambda: parser(message)),
+                )
+
+
+def bench_stage_process():
+    for batch_size in STAGE_BATCH_SIZES:
+        for source, messages in stage_inputs(batch_size):
+            batch = parse_binary_sensor_data(messages["binary"])
+            # Incluye formatear los prints por batch, como en el servidor
+            seconds = measure(lambda: process_quietly(batch))
+            report("stage_process", f"binary/{source}", batch_size, seconds)
+
+
+async def _measure_async(func, number, repeat=5):
+    """Mejor tiempo por llamada (s) de una corrutina entre ``repeat`` rondas"""
+    best = None
+    for _ in range(repeat):
+        started_at = timeit.default_timer()
+        for _ in range(number):
+            await func()
+        elapsed = (timeit.default_timer() - started_at) / number
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+async def _bench_stage_redis():
+    main.redis_client = redis.from_url(main.REDIS_URL, decode_responses=False)
+    main.scan_store = RedisScanStore(main.redis_client)
+    try:
+        await main.redis_client.ping()
+    except Exception as e:
+        print(f"BENCH|case=stage_redis|skipped={type(e).__name__}|url={main.REDIS_URL}")
+        return
+
+    scan_id = f"bench-{uuid.uuid4().hex[:8]}"
+    failures = main.network_stats["redis_failures"]
+    try:
+        for batch_size in STAGE_BATCH_SIZES:
+            # Un batch por pipeline, y ocho como cuando la cola de persist se llena
+            for group in (1, 8):
+                batches = make_stage_batches(batch_size, group, scan_id)
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(
+                    devnull
+                ):
+                    seconds = await _measure_async(
+                        lambda: main.store_batches(batches), number=50
+                    )
+                report(
+                    "stage_redis", f"pipeline_{group}", batch_size, seconds / group
+                )
+        assert main.network_stats["redis_failures"] == failures, "fallos de Redis"
+    finally:
+        await main.redis_client.delete(
+            scan_chunks_key(scan_id), scan_points_key(scan_id)
+        )
+        await main.redis_client.aclose()
+
+
+def bench_stage_redis():
+    asyncio.run(_bench_stage_redis())
+
+
+async def _bench_stage_broadcast():
+    scan_id = "bench-broadcast"
+    for encoding in ("json", "binary"):
+        for client_count in STAGE_WEB_CLIENTS:
+            clients = {}
+            for _ in range(client_count):
+                ws = NullSocket()
+                clients[ws] = WebClient(ws, encoding, scan_id=scan_id)
+                clients[ws].start()
+            main.web_clients.update(clients)
+
+            async def broadcast_and_drain():
+                # Cada broadcast crea su mensaje y lo codifica de nuevo
+                await main.broadcast_to_web_clients(batch, scan_id=scan_id)
+                while any(client.pending for client in clients.values()):
+                    await asyncio.sleep(0)
+
+            try:
+                for batch_size in STAGE_BATCH_SIZES:
+                    batch = process_quietly(make_point_batch(batch_size))
+                    number = 200 if client_count < 100 else 20
+                    seconds = await _measure_async(broadcast_and_drain, number)
+                    report(
+                        "stage_broadcast",
+                        f"{encoding}_{client_count}_clients",
+                        batch_size,
+                        seconds,
+                    )
+                assert all(ws.sent_bytes for ws in clients), "cliente sin envíos"
+            finally:
+                for ws, client in clients.items():
+                    main.web_clients.pop(ws, None)
+                    await client.close()
+
+
+def bench_stage_broadcast():
+    asyncio.run(_bench_stage_broadcast())
+
+
+def _read_archive(path):
+    """Lectura de un exportador: mapear el archivo y recorrer una columna"""
+    _, records = open_scan_archive(path)
+    return float(records["x"].sum())
+
+
+async def _bench_scan_archive(directory, batch_size, batch_count=200):
+    scan_id = f"bench-{batch_size}"
+    batches = make_stage_batches(batch_size, batch_count, scan_id)
+    archive = ScanArchive(directory, flush_bytes=1 << 62)
+    path = scan_archive_path(directory, scan_id)
+
+    started_at = timeit.default_timer()
+    for batch in batches:
+        archive.append(batch, 1_700_000_000.0)
+    append_s = timeit.default_timer() - started_at
+    started_at = timeit.default_timer()
+    await archive.flush()
+    flush_s = timeit.default_timer() - started_at
+
+    _, records = open_scan_archive(path)
+    bounds = archive_batch_bounds(records)
+    assert len(bounds) == batch_count
+    start, end = bounds[-1]
+    assert np.array_equal(records["x"][start:end], batches[-1].x.astype(np.float32))
+    assert records["received_ms"][end - 1] == (batch_count - 1) * 1000
+    read_s = measure(lambda: _read_archive(path))
+
+    # Corte a mitad de un registro: se ignora al leer y se recorta al reabrir
+    await archive.stop()
+    with path.open("ab") as fh:
+        fh.write(b"\xff" * (ARCHIVE_RECORD_DTYPE.itemsize // 2))
+    assert open_scan_archive(path)[0]["point_count"] == len(records)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        archive.append(batches[0], 1_700_000_000.0)
+        await archive.flush()
+    _, reopened = open_scan_archive(path)
+    assert len(reopened) == len(records) + batch_size
+    assert reopened["batch"][-1] == batch_count
+
+    archive.reset(scan_id)
+    await archive.stop()
+    assert not path.exists()
+
+    report("scan_archive", "append", batch_size, append_s / batch_count)
+    report("scan_archive", "write_fsync", batch_size, flush_s / batch_count)
+    report("scan_archive", "memmap_read", batch_size, read_s / batch_count)
+
+
+def bench_scan_archive():
+    with tempfile.TemporaryDirectory() as directory:
+        for batch_size in STAGE_BATCH_SIZES:
+            asyncio.run(_bench_scan_archive(Path(directory), batch_size))
+
+
+async def _collect_chunks(store, scan_id, start=0, stop=None, batch_size=None):
+    return [
+        chunk
+        async for chunk in store.iter_chunks(scan_id, start, stop, batch_size)
+    ]
+
+
+async def _open_scan_store(backend, directory):
+    """El store listo para usar, o None si su servicio no está disponible"""
+    if backend != "redis":
+        store = create_scan_store(backend, directory=directory)
+        await store.open()
+        return store
+
+    client = redis.from_url(main.REDIS_URL, decode_responses=False)
+    try:
+        await client.ping()
+    except Exception as e:
+        await client.aclose()
+        print(f"BENCH|case=storage|impl=redis|skipped={type(e).__name__}")
+        return None
+    store = RedisScanStore(client)
+    await store.open()
+    return store
+
+
+async def _close_scan_store(store, scan_ids):
+    if isinstance(store, RedisScanStore):
+        await store.client.zrem(REDIS_SCANS_KEY, *scan_ids)
+    await store.close()
+    if isinstance(store, RedisScanStore):
+        await store.client.aclose()
+
+
+async def _bench_storage(backend, directory, batch_size, batch_count=200):
+    prefix = f"bench-{uuid.uuid4().hex[:8]}"
+    store = await _open_scan_store(backend, directory)
+    if store is None:
+        return
+    scan_ids = [f"{prefix}-t"]
+    try:
+        # Ocho batches por escritura, como cuando la cola de persist se llena
+        batches = make_stage_batches(batch_size, batch_count, scan_ids[0])
+        started_at = timeit.default_timer()
+        for start in range(0, batch_count, 8):
+            await store.append_batches(batches[start : start + 8])
+        append_s = timeit.default_timer() - started_at
+        started_at = timeit.default_timer()
+        await _collect_chunks(store, scan_ids[0])
+        read_s = timeit.default_timer() - started_at
+        await store.clear(scan_ids[0])
+    finally:
+        await _close_scan_store(store, scan_ids)
+
+    report("storage", f"{backend}_append", batch_size, append_s / batch_count)
+    report("storage", f"{backend}_read", batch_size, read_s / batch_count)
+
+
+def bench_storage():
+    with tempfile.TemporaryDirectory() as directory:
+        for backend in STORAGE_BACKENDS:
+            for batch_size in STAGE_BATCH_SIZES:
+                asyncio.run(_bench_storage(backend, directory, batch_size))
+
+
+async def _bench_resync(batch_size, batch_count=1500):
+    scan_id = f"bench-resync-{batch_size}"
+    batches = make_stage_batches(batch_size, batch_count, scan_id)
+    previous_store = main.scan_store
+    main.scan_store = MemoryScanStore()
+    try:
+        await main.scan_store.append_batches(batches)
+        for source in ("cache", "store"):
+            if source == "cache":
+                main.scan_cache.append_batches(main.scan_cache.reset(scan_id), batches)
+            else:
+                main.scan_cache.scans.pop(scan_id, None)
+
+            last = batch_count - 1
+            # Costo por batch reenviado; el total crece con el corte, no con
+            # el tamaño del escaneo como el estado completo (since=None)
+            for missed in (10, main.RESYNC_MAX_BATCHES, None):
+                impl = f"{source}_missed_{missed}" if missed else f"{source}_snapshot"
+                since = None if missed is None else last - missed
+                started_at = timeit.default_timer()
+                ws = await reconnect(scan_id, since)
+                seconds = timeit.default_timer() - started_at
+                report("resync", impl, batch_size, seconds / (missed or batch_count))
+                print(
+                    f"BENCH|case=resync|impl={impl}|sent_bytes={ws.sent_bytes}"
+                    f"|reconnect_ms={seconds * 1000:.3f}"
+                )
+    finally:
+        main.scan_cache.scans.pop(scan_id, None)
+        main.scan_store = previous_store
+
+
+def bench_resync():
+    for batch_size in STAGE_BATCH_SIZES:
+        asyncio.run(_bench_resync(batch_size))
+
+
+CASES = {
+    "binary_decode": bench_binary_decode,
+    "binary_v2": bench_binary_v2,
+    "compression": bench_compression,
+    "text_parse": bench_text_parse,
+    "json_decode": bench_json_decode,
+    "sniff": bench_sniff,
+    "cartesian": bench_cartesian,
+    "trig_lut": bench_trig_lut,
+    "redis_footprint": bench_redis_footprint,
+    "web_encoding": bench_web_encoding,
+    "voxel_lod": bench_voxel_lod,
+    "stage_parse": bench_stage_parse,
+    "stage_process": bench_stage_process,
+    "stage_redis": bench_stage_redis,
+    "stage_broadcast": bench_stage_broadcast,
+    "scan_archive": bench_scan_archive,
+    "storage": bench_storage,
+    "resync": bench_resync,
+}
+
+
+def bench_environment():
+    """Código y máquina de la corrida: sólo se comparan corridas del mismo equipo"""
+    service_root = Path(__file__).resolve().parent
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=service_root,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        dirty = bool(
+            subprocess.run(
+                ["git", "status", "--porcelain", "--", "."],
+                cwd=service_root,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+
+    return {
+        "commit": commit,
+        "dirty": dirty,
+        "host": platform.node(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "json_decoder": parse.available_json_decoders()[0],
+        "codecs": available_codecs(),
+    }
+
+
+def load_history(path):
+    if not path.exists():
+        return []
+    with path.open(encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def save_history(path, history):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with tmp_path.open("w", encoding="utf-8") as fh:
+        json.dump(history, fh, indent=2)
+    os.replace(tmp_path, path)
+
+
+def find_baseline(history, label=None):
+    for entry in reversed(history):
+        if label is None or entry.get("label") == label:
+            return entry
+    return None
+
+
+def compare_results(baseline, results, threshold=BENCH_REGRESSION_THRESHOLD):
+    """Imprime la comparación por medición y devuelve las regresiones.
+
+    Una medición es regresión si tarda más de ``1 + threshold`` veces lo que
+    tardaba en ``baseline``; sólo se comparan las presentes en ambas.
+    """
+    previous = {
+        (row["case"], row["impl"], row["batch_size"]): row["us_batch"]
+        for row in baseline["results"]
+    }
+    regressions = []
+    for key, current_us in results.items():
+        baseline_us = previous.get(key)
+        if not baseline_us:
+            continue
+        change = current_us / baseline_us - 1
+        if change > threshold:
+            status = "regression"
+            regressions.append(key)
+        elif change < -threshold:
+            status = "improved"
+        else:
+            status = "same"
+        case, impl, batch_size = key
+        print(
+            "BENCH|event=compare"
+            f"|case={case}"
+            f"|impl={impl}"
+            f"|batch_size={batch_size}"
+            f"|baseline_us={baseline_us:.2f}"
+            f"|current_us={current_us:.2f}"
+            f"|change={change:+.1%}"
+            f"|status={status}"
+        )
+    return regressions
+
+
+def run(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("cases", nargs="*", help=f"casos: {', '.join(CASES)}")
+    parser.add_argument("--history", type=Path, default=BENCH_HISTORY)
+    parser.add_argument("--save", action="store_true", help="agregar al historial")
+    parser.add_argument("--label", help="nombre de la corrida en el historial")
+    parser.add_argument(
+        "--compare", action="store_true", help="comparar contra el historial"
+    )
+    parser.add_argument(
+        "--baseline", help="label de la corrida base (por defecto la última)"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=BENCH_REGRESSION_THRESHOLD,
+        help="aumento relativo de tiempo que cuenta como regresión",
+    )
+    args = parser.parse_args(argv)
+
+    unknown = set(args.cases) - set(CASES)
+    if unknown:
+        parser.error(f"casos desconocidos: {', '.join(sorted(unknown))}")
+
+    history = load_history(args.history) if args.save or args.compare else []
+    baseline = None
+    if args.compare:
+        baseline = find_baseline(history, args.baseline)
+        if baseline is None:
+            parser.error(f"sin corrida base en {args.history}")
+
+    for name in args.cases or CASES:
+        CASES[name]()
+
+    environment = bench_environment()
+    regressions = []
+    if baseline is not None:
+        for field in ("host", "machine", "python", "numpy"):
+            if baseline["environment"].get(field) != environment[field]:
+                print(
+                    f"Aviso: {field} distinto de la corrida base "
+                    f"({baseline['environment'].get(field)} != {environment[field]})"
+                )
+        regressions = compare_results(baseline, RESULTS, args.threshold)
+        print(
+            "BENCH|event=compare_summary"
+            f"|baseline={baseline.get('label') or baseline['timestamp']}"
+            f"|baseline_commit={baseline['environment'].get('commit')}"
+            f"|threshold={args.threshold:.1%}"
+            f"|regressions={len(regressions)}"
+        )
+
+    if args.save:
+        history.append(
+            {
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "label": args.label,
+                "cases": args.cases or list(CASES),
+                "environment": environment,
+                "results": [
+                    {
+                        "case": case,
+                        "impl": impl,
+                        "batch_size": batch_size,
+                        "us_batch": round(us_batch, 3),
+                    }
+                    for (case, impl, batch_size), us_batch in RESULTS.items()
+                ],
+            }
+        )
+        save_history(args.history, history)
+        print(f"Corrida guardada en {args.history} ({len(RESULTS)} mediciones)")
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    run()
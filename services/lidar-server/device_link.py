@@ -0,0 +1,92 @@
+SEQUENCE_MODULUS = 1 << 32
+SEQUENCE_HALF_RANGE = 1 << 31
+# Secuencias de un hueco que se recuerdan para reconocer llegadas tardías
+LINK_MISSING_WINDOW = 1024
+
+
+class DeviceLink:
+    """Pérdida, reordenamiento y reloj de las tramas v2 de una conexión.
+
+    La secuencia es de 32 bits y da la vuelta. Un salto hacia adelante cuenta
+    las secuencias salteadas como perdidas; si una de ellas llega después se
+    descuenta de las perdidas y cuenta como reordenada. Una secuencia vieja
+    que no estaba en el hueco es un duplicado, salvo ``0``, que se toma como
+    reinicio del dispositivo.
+
+    El timestamp del dispositivo es monotónico y su reloj no está
+    sincronizado con el del servidor: el desfase se estima como el mínimo de
+    ``recepción - envío`` visto en la conexión, así que las latencias son
+    relativas a la trama más rápida (incluyen la deriva entre relojes).
+    """
+
+    __slots__ = (
+        "expected",
+        "missing",
+        "received",
+        "lost",
+        "reordered",
+        "duplicated",
+        "resets",
+        "clock_offset_us",
+    )
+
+    def __init__(self):
+        self.expected = None
+        self.missing = set()
+        self.received = 0
+        self.lost = 0
+        self.reordered = 0
+        self.duplicated = 0
+        self.resets = 0
+        self.clock_offset_us = None
+
+    def observe(self, sequence, timestamp_us, received_at):
+        """Registra una trama; devuelve la hora estimada de envío (reloj local)"""
+        self.received += 1
+        self._observe_sequence(sequence)
+
+        offset_us = int(received_at * 1_000_000) - timestamp_us
+        if self.clock_offset_us is None or offset_us < self.clock_offset_us:
+            self.clock_offset_us = offset_us
+        return (timestamp_us + self.clock_offset_us) / 1_000_000
+
+    def _observe_sequence(self, sequence):
+        if self.expected is None:
+            self.expected = (sequence + 1) % SEQUENCE_MODULUS
+            return
+
+        ahead = (sequence - self.expected) % SEQUENCE_MODULUS
+        if ahead == 0:
+            self.expected = (sequence + 1) % SEQUENCE_MODULUS
+        elif ahead < SEQUENCE_HALF_RANGE:
+            self.lost += ahead
+            for offset in range(max(0, ahead - LINK_MISSING_WINDOW), ahead):
+                self.missing.add((self.expected + offset) % SEQUENCE_MODULUS)
+            self.expected = (sequence + 1) % SEQUENCE_MODULUS
+        elif sequence in self.missing:
+            self.missing.discard(sequence)
+            self.lost -= 1
+            self.reordered += 1
+        elif sequence == 0:
+            self.resets += 1
+            self.missing.clear()
+            self.expected = 1
+        else:
+            self.duplicated += 1
+
+        if len(self.missing) > LINK_MISSING_WINDOW:
+            # Las más viejas ya no se van a reconocer como tardías
+            recent = sorted(self.missing, key=self._age)[:LINK_MISSING_WINDOW]
+            self.missing = set(recent)
+
+    def _age(self, sequence):
+        return (self.expected - sequence) % SEQUENCE_MODULUS
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "lost": self.lost,
+            "reordered": self.reordered,
+            "duplicated": self.duplicated,
+            "resets": self.resets,
+        }
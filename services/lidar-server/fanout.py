@@ -0,0 +1,376 @@
+import asyncio
+import json
+from collections import deque
+
+import numpy as np
+import websockets
+
+from point_batch import (
+    WEB_FRAME_TYPES,
+    PointBatch,
+    encode_web_frame,
+    records_to_client_points,
+)
+
+OVERFLOW_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+SLOW_CLIENT_CLOSE_CODE = 1013
+# Puntos en vivo que un cliente puede retener mientras recibe el snapshot
+WEB_CLIENT_MAX_HELD_POINTS = 2_000_000
+
+
+class BroadcastMessage:
+    """Mensaje para clientes web que serializa cada codificación una sola vez.
+
+    ``data`` puede ser un ``PointBatch`` procesado, registros
+    ``POINT_RECORD_DTYPE`` o cualquier valor JSON. El mismo objeto se encola
+    en todos los clientes, así que el buffer codificado se comparte entre los
+    suscriptores de cada codificación.
+    """
+
+    __slots__ = ("message_type", "data", "progress", "_sequence", "_encoded")
+
+    def __init__(self, message_type, data, progress=None, sequence=None):
+        self.message_type = message_type
+        self.data = data
+        # (puntos enviados, total) para los mensajes del estado inicial
+        self.progress = progress
+        # Secuencia del último batch de registros que no viajan en un
+        # PointBatch (de otro worker o del estado inicial)
+        self._sequence = sequence
+        self._encoded = {}
+
+    @property
+    def carries_points(self):
+        return self.message_type in WEB_FRAME_TYPES
+
+    @property
+    def coalescible(self):
+        return self.message_type == "new_points" and isinstance(
+            self.data, (PointBatch, np.ndarray)
+        )
+
+    @property
+    def sequence(self):
+        if isinstance(self.data, PointBatch):
+            return self.data.sequence
+        return self._sequence
+
+    @classmethod
+    def merge(cls, messages):
+        """Un único ``new_points`` con los puntos de ``messages``"""
+        if all(isinstance(message.data, PointBatch) for message in messages):
+            return cls(
+                "new_points", PointBatch.concatenate([m.data for m in messages])
+            )
+
+        sequences = [message.sequence for message in messages]
+        return cls(
+            "new_points",
+            np.concatenate(
+                [
+                    m.data.to_records() if isinstance(m.data, PointBatch) else m.data
+                    for m in messages
+                ]
+            ),
+            sequence=None if None in sequences else max(sequences),
+        )
+
+    def encode(self, encoding):
+        message = self._encoded.get(encoding)
+        if message is None:
+            message = self._encode(encoding)
+            self._encoded[encoding] = message
+        return message
+
+    def _encode(self, encoding):
+        data = self.data
+        if isinstance(data, PointBatch):
+            data = data.to_records()
+
+        if not isinstance(data, np.ndarray):
+            return json.dumps({"type": self.message_type, "data": data})
+        if encoding == "binary" and self.message_type in WEB_FRAME_TYPES:
+            return encode_web_frame(
+                self.message_type, data, self.progress, self.sequence
+            )
+
+        # Los clientes JSON existentes sólo conocen initial_state/new_points:
+        # la continuación del estado inicial viaja como new_points.
+        message_type = self.message_type
+        if message_type == "initial_state_chunk":
+            message_type = "new_points"
+        message = {"type": message_type, "data": records_to_client_points(data)}
+        if self.sequence is not None:
+            message["sequence"] = self.sequence
+        if self.progress is not None:
+            sent, total = self.progress
+            message["progress"] = {"sent": sent, "total": total, "done": sent >= total}
+        return json.dumps(message)
+
+
+class WebClient:
+    """Cliente web con cola de envío acotada y tarea de envío propia.
+
+    ``enqueue`` nunca espera: cuando la cola está llena aplica la política de
+    desborde (``drop_oldest``, ``coalesce`` o ``disconnect``), de modo que un
+    navegador lento no frena la ingesta del sensor. Sólo se descartan
+    mensajes de puntos; si la cola está llena de mensajes de control el
+    cliente se desconecta.
+
+    El estado inicial llega por ``attach_snapshot``: un iterador async de
+    mensajes que la tarea de envío consume de a uno, intercalado con los
+    ``new_points`` en vivo. Así no ocupa la cola ni se descarta, y se lee
+    sólo al ritmo que el cliente acepta. Hasta que sale su ``initial_state``
+    (o se agota un snapshot incremental, que no lo tiene) los mensajes en
+    vivo esperan, porque el cliente los borraría al reemplazar sus puntos.
+    Esos mensajes retenidos no se pueden descartar sin dejar un hueco entre
+    el snapshot y lo que sigue: con la cola llena se fusionan, sea cual sea
+    la política, y el cliente se desconecta sólo si superan
+    ``max_held_points``.
+    """
+
+    __slots__ = (
+        "ws",
+        "encoding",
+        "max_queue",
+        "overflow_policy",
+        "max_held_points",
+        "pending",
+        "wakeup",
+        "task",
+        "closed",
+        "sent",
+        "dropped",
+        "coalesced",
+        "max_depth",
+        "send_failures",
+        "shared_stats",
+        "snapshot",
+        "holding_live",
+        "live_from_sequence",
+        "lod",
+        "scan_id",
+        "follow_latest",
+    )
+
+    def __init__(
+        self,
+        ws,
+        encoding="json",
+        max_queue=64,
+        overflow_policy="drop_oldest",
+        shared_stats=None,
+        lod=None,
+        scan_id=None,
+        follow_latest=False,
+        max_held_points=WEB_CLIENT_MAX_HELD_POINTS,
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy: {overflow_policy}")
+
+        self.ws = ws
+        self.encoding = encoding
+        self.max_queue = max(1, max_queue)
+        self.overflow_policy = overflow_policy
+        self.max_held_points = max_held_points
+        self.pending = deque()
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self.send_failures = 0
+        # Contadores agregados compartidos (p. ej. network_stats)
+        self.shared_stats = shared_stats if shared_stats is not None else {}
+        self.snapshot = None
+        self.holding_live = False
+        # Los batches en vivo con secuencia menor ya vienen en el snapshot
+        self.live_from_sequence = None
+        # Tamaño de vóxel (mm) del stream LOD; None recibe los puntos crudos
+        self.lod = lod
+        # Escaneo suscrito; con follow_latest se cambia al iniciar uno nuevo
+        self.scan_id = scan_id
+        self.follow_latest = follow_latest
+
+    @property
+    def depth(self):
+        return len(self.pending)
+
+    def attach_snapshot(self, messages, live_from_sequence=None):
+        self.snapshot = messages
+        self.holding_live = True
+        self.live_from_sequence = live_from_sequence
+        self.wakeup.set()
+
+    def discard_pending_points(self):
+        """Descarta los mensajes de puntos encolados, p. ej. al cambiar de escaneo"""
+        self.pending = deque(
+            message for message in self.pending if not message.carries_points
+        )
+
+    def _already_in_snapshot(self, message):
+        sequence = message.sequence
+        return (
+            self.live_from_sequence is not None
+            and sequence is not None
+            and sequence < self.live_from_sequence
+        )
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    def enqueue(self, message, front=False):
+        """Encola ``message``; devuelve False si el cliente debe desconectarse"""
+        if self.closed:
+            return False
+
+        if len(self.pending) >= self.max_queue and not self._make_room(message):
+            return False
+
+        if front:
+            self.pending.appendleft(message)
+        else:
+            self.pending.append(message)
+        self.max_depth = max(self.max_depth, len(self.pending))
+        self.wakeup.set()
+        return True
+
+    def _make_room(self, message):
+        """Descarta puntos hasta que haya lugar; False si sólo quedan de control"""
+        if self.holding_live:
+            return self._make_room_held(message)
+
+        if self.overflow_policy == "disconnect":
+            return False
+
+        if self.overflow_policy == "coalesce":
+            self._coalesce()
+
+        while len(self.pending) >= self.max_queue:
+            # Perder un scan_started o scan_cleared dejaría al cliente
+            # mostrando otro escaneo: esos sólo se pierden desconectándolo.
+            index = next(
+                (i for i, message in enumerate(self.pending) if message.carries_points),
+                None,
+            )
+            if index is None:
+                return False
+            del self.pending[index]
+            self.dropped += 1
+            self._count("web_dropped_messages")
+        return True
+
+    def _make_room_held(self, incoming):
+        """Fusiona los mensajes retenidos durante el snapshot sin perder puntos"""
+        self.pending = deque(
+            message
+            for message in self.pending
+            if not self._already_in_snapshot(message)
+        )
+        self._coalesce()
+        held_points = sum(
+            len(message.data)
+            for message in (*self.pending, incoming)
+            if message.coalescible
+        )
+        return (
+            len(self.pending) < self.max_queue
+            and held_points <= self.max_held_points
+        )
+
+    def _count(self, name, amount=1):
+        self.shared_stats[name] = self.shared_stats.get(name, 0) + amount
+
+    def _coalesce(self):
+        """Fusiona cada racha de ``new_points`` encolados en un único mensaje"""
+        merged = deque()
+        run = []
+
+        def flush_run():
+            if len(run) > 1:
+                self.coalesced += len(run) - 1
+                self._count("web_coalesced_messages", len(run) - 1)
+                merged.append(BroadcastMessage.merge(run))
+            elif run:
+                merged.append(run[0])
+            run.clear()
+
+        for message in self.pending:
+            if message.coalescible:
+                run.append(message)
+            else:
+                flush_run()
+                merged.append(message)
+        flush_run()
+        self.pending = merged
+
+    async def _run(self):
+        try:
+            while not self.closed:
+                if self.pending and not self.holding_live:
+                    message = self.pending.popleft()
+                    if not self._already_in_snapshot(message):
+                        await self.ws.send(message.encode(self.encoding))
+                        self.sent += 1
+
+                if self.snapshot is not None:
+                    try:
+                        message = await anext(self.snapshot)
+                    except StopAsyncIteration:
+                        self.snapshot = None
+                        self.holding_live = False
+                        continue
+                    await self.ws.send(message.encode(self.encoding))
+                    self.sent += 1
+                    if message.message_type == "initial_state":
+                        self.holding_live = False
+                    continue
+
+                if not self.pending:
+                    self.wakeup.clear()
+                    await self.wakeup.wait()
+        except websockets.exceptions.ConnectionClosed:
+            self.send_failures += 1
+        except Exception as e:
+            self.send_failures += 1
+            print(f"Error enviando a cliente web: {e}")
+        finally:
+            self.closed = True
+            if self.snapshot is not None:
+                snapshot, self.snapshot = self.snapshot, None
+                try:
+                    await snapshot.aclose()
+                except Exception:
+                    pass
+
+    async def close(self, code=None, reason=""):
+        self.closed = True
+        self.pending.clear()
+        self.wakeup.set()
+        if self.task is not None and self.task is not asyncio.current_task():
+            self.task.cancel()
+            try:
+                await self.task
+            except (asyncio.CancelledError, Exception):
+                pass
+        if code is not None:
+            try:
+                await self.ws.close(code=code, reason=reason)
+            except Exception:
+                pass
+
+    def stats(self):
+        return {
+            "encoding": self.encoding,
+            "lod": self.lod,
+            "scan_id": self.scan_id,
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "catching_up": self.snapshot is not None,
+        }
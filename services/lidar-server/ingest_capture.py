@@ -0,0 +1,188 @@
+"""Grabación de las tramas que recibe el servidor, para reproducirlas después.
+
+Una captura es una cabecera ``CAPTURE_HEADER`` seguida de un registro por
+evento: ``CAPTURE_RECORD`` (hora de llegada en ns, id de conexión, tipo y
+largo) y el payload tal cual llegó. Cada conexión empieza con un registro
+``open`` con su dirección remota y termina con uno ``close``:
+
+    for arrival_ns, connection, kind, payload in read_capture(path):
+        ...
+
+``replay.py`` la reproduce contra un servidor.
+"""
+
+import asyncio
+import struct
+import time
+from collections import deque
+from pathlib import Path
+
+CAPTURE_MAGIC = b"LR"
+CAPTURE_VERSION = 1
+CAPTURE_SUFFIX = ".lcap"
+# magia, versión, flags (reservado)
+CAPTURE_HEADER = struct.Struct("<2sBB")
+# hora de llegada (time.time_ns), id de conexión, tipo, largo del payload
+CAPTURE_RECORD = struct.Struct("<QIBI")
+CAPTURE_KINDS = ("text", "binary", "open", "close")
+KIND_TEXT, KIND_BINARY, KIND_OPEN, KIND_CLOSE = range(len(CAPTURE_KINDS))
+
+
+def capture_path(directory, started_at, worker=None):
+    """Un archivo por arranque del servidor, y por worker con varios"""
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(started_at))
+    suffix = CAPTURE_SUFFIX if worker is None else f".w{worker}{CAPTURE_SUFFIX}"
+    return Path(directory) / f"ingest-{stamp}{suffix}"
+
+
+def read_capture(path):
+    """Produce ``(arrival_ns, connection, kind, payload)`` por registro.
+
+    ``payload`` es ``str`` en las tramas de texto y los registros ``open``, y
+    ``bytes`` en el resto. Un registro incompleto al final (corte durante una
+    escritura) se ignora.
+    """
+    with Path(path).open("rb") as fh:
+        header = fh.read(CAPTURE_HEADER.size)
+        if len(header) < CAPTURE_HEADER.size:
+            raise ValueError("capture header too short")
+        magic, version, _ = CAPTURE_HEADER.unpack(header)
+        if magic != CAPTURE_MAGIC:
+            raise ValueError("invalid capture magic")
+        if version != CAPTURE_VERSION:
+            raise ValueError(f"unsupported capture version: {version}")
+
+        while True:
+            head = fh.read(CAPTURE_RECORD.size)
+            if len(head) < CAPTURE_RECORD.size:
+                return
+            arrival_ns, connection, kind, length = CAPTURE_RECORD.unpack(head)
+            payload = fh.read(length)
+            if len(payload) < length:
+                return
+            if kind in (KIND_TEXT, KIND_OPEN):
+                payload = payload.decode("utf-8", "surrogatepass")
+            yield arrival_ns, connection, kind, payload
+
+
+class IngestRecorder:
+    """Graba todo lo que llega por las conexiones del servidor.
+
+    ``record`` sólo toma la hora y guarda la trama en memoria; una tarea de
+    fondo la escribe en un hilo cada ``flush_interval_ms``, como
+    ``ScanArchive``. Si el disco no da abasto y lo pendiente supera
+    ``max_pending_bytes`` se descartan las tramas nuevas
+    (``dropped_frames``), así que una captura con huecos se nota.
+    """
+
+    def __init__(
+        self,
+        directory,
+        flush_interval_ms=1000,
+        max_pending_bytes=64 * 1024 * 1024,
+        worker=None,
+    ):
+        self.directory = Path(directory)
+        self.flush_interval_s = flush_interval_ms / 1000
+        self.max_pending_bytes = max_pending_bytes
+        self.worker = worker
+        self.path = None
+        # (hora de llegada en ns, conexión, tipo, payload)
+        self.pending = deque()
+        self.pending_bytes = 0
+        self.recorded_frames = 0
+        self.written_bytes = 0
+        self.dropped_frames = 0
+        self.write_failures = 0
+        self._next_connection = 1
+        self._fh = None
+        self._task = None
+
+    def open_connection(self, remote_address):
+        """Registra una conexión nueva y devuelve su id"""
+        connection = self._next_connection
+        self._next_connection += 1
+        self._append(connection, KIND_OPEN, str(remote_address).encode("utf-8"))
+        return connection
+
+    def close_connection(self, connection):
+        self._append(connection, KIND_CLOSE, b"")
+
+    def record(self, connection, message):
+        """Graba una trama tal cual llegó (``str`` o ``bytes``)"""
+        if isinstance(message, str):
+            kind = KIND_TEXT
+            message = message.encode("utf-8", "surrogatepass")
+        else:
+            kind = KIND_BINARY
+        if self.pending_bytes + len(message) > self.max_pending_bytes:
+            self.dropped_frames += 1
+            return
+        self._append(connection, kind, message)
+        self.recorded_frames += 1
+
+    def _append(self, connection, kind, payload):
+        self.pending.append((time.time_ns(), connection, kind, payload))
+        self.pending_bytes += CAPTURE_RECORD.size + len(payload)
+
+    def start(self):
+        if self._task is None:
+            self.path = capture_path(self.directory, time.time(), self.worker)
+            print(f"Grabando las tramas entrantes en {self.path}")
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._fh is not None:
+            await asyncio.to_thread(self._fh.close)
+            self._fh = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval_s)
+            await self.flush()
+
+    async def flush(self):
+        if not self.pending or self.path is None:
+            return
+
+        pending, self.pending = self.pending, deque()
+        self.pending_bytes = 0
+        try:
+            await asyncio.to_thread(self._write, pending)
+        except Exception as e:
+            self.write_failures += 1
+            print(f"Error escribiendo la captura {self.path}: {e}")
+
+    def _write(self, pending):
+        if self._fh is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._fh = self.path.open("ab")
+            if self._fh.tell() == 0:
+                self._fh.write(CAPTURE_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION, 0))
+
+        parts = []
+        for arrival_ns, connection, kind, payload in pending:
+            header = CAPTURE_RECORD.pack(arrival_ns, connection, kind, len(payload))
+            parts.append(header)
+            parts.append(payload)
+        data = b"".join(parts)
+        self._fh.write(data)
+        self._fh.flush()
+        self.written_bytes += len(data)
+
+    def stats(self):
+        return {
+            "recorded_frames": self.recorded_frames,
+            "written_bytes": self.written_bytes,
+            "pending_bytes": self.pending_bytes,
+            "dropped_frames": self.dropped_frames,
+            "write_failures": self.write_failures,
+        }
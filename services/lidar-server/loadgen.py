@@ -0,0 +1,545 @@
+"""Generador de carga para el servidor LiDAR.
+
+Emula ``--devices`` dispositivos que envían batches de ``--batch-size``
+puntos (texto legado, JSON ``{inclination, points}`` o binario "PS" v2) a
+``--points-per-second`` por dispositivo, y ``--web-clients`` clientes web
+que miden la latencia desde el envío de cada batch hasta que les llega como
+``new_points``. Con ``--steps`` la tasa se multiplica por ``--step-factor``
+en cada etapa, para encontrar dónde se satura un proceso del servidor.
+
+Uso:
+    python loadgen.py --devices 4 --format binary --points-per-second 20000
+    python loadgen.py --devices 8 --web-clients 4 --steps 5 --step-factor 2
+    python loadgen.py --devices 8 --steps 6 --server-workers 1,2,4
+
+Con ``--server-workers`` el generador levanta ``main.py`` con cada cantidad
+de workers (``LIDAR_WORKERS``, con el Redis de ``REDIS_URL``), repite las
+etapas contra cada uno y compara la mayor tasa sostenida: la que llega
+completa a los clientes web con p99 bajo ``--max-p99-ms``.
+
+Los clientes web sólo ven ``x, y, z, intensity``, así que cada batch lleva
+una marca en las intensidades de sus primeros puntos: ``255`` y tres dígitos
+en base 255 con el número de batch. El resto de las intensidades es < 255.
+La latencia medida incluye la del propio generador: si ``loadgen_cpu`` se
+acerca a 1 el cuello de botella es el generador, no el servidor.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import websockets
+
+from payload_codecs import CODEC_IDS, available_codecs
+from point_batch import (
+    POINT_RECORD_DTYPE,
+    WEB_FRAME_HEADER,
+    WEB_FRAME_MAGIC,
+    WEB_FRAME_TYPES,
+)
+from sensor_protocol import compress_binary_batch, encode_binary_sensor_batch_v2
+
+LOAD_FORMATS = ("text", "json", "binary")
+POINT_SEPARATORS = {"text": ";", "json": ","}
+LOAD_TAG_MARKER = 255
+LOAD_TAG_BASE = 255
+LOAD_TAG_DIGITS = 3
+LOAD_TAG_MODULUS = LOAD_TAG_BASE**LOAD_TAG_DIGITS
+LOAD_MIN_BATCH_SIZE = 1 + LOAD_TAG_DIGITS
+LOAD_INCLINATION_TENTHS = 450
+LOAD_PAN_STEP_TENTHS = 8
+REGISTER_TIMEOUT_S = 5.0
+PERCENTILES = (50, 95, 99)
+SERVER_SCRIPT = Path(__file__).with_name("main.py")
+SERVER_START_TIMEOUT_S = 20.0
+# Tras aceptar la primera conexión, para que arranquen todos los workers
+SERVER_WARMUP_S = 2.0
+SERVER_STOP_TIMEOUT_S = 10.0
+# Fracción de batches entregados para considerar sostenida una etapa
+SUSTAINED_DELIVERED = 0.99
+
+
+class LatencyTracker:
+    """Hora de envío de cada batch marcado y latencias que ven los clientes web"""
+
+    __slots__ = ("sent", "samples", "unknown", "next_tag")
+
+    def __init__(self, steps):
+        # tag -> (perf_counter del envío, etapa)
+        self.sent = {}
+        self.samples = [[] for _ in range(steps)]
+        self.unknown = 0
+        self.next_tag = 0
+
+    def reserve(self):
+        tag = self.next_tag
+        self.next_tag = (tag + 1) % LOAD_TAG_MODULUS
+        return tag
+
+    def mark_sent(self, tag, step):
+        self.sent[tag] = (time.perf_counter(), step)
+
+    def observe(self, intensity, received_at):
+        """Registra las marcas de ``intensity`` (columna de un ``new_points``)"""
+        for tag in find_load_tags(intensity):
+            sent = self.sent.get(tag)
+            if sent is None:
+                self.unknown += 1
+                continue
+            sent_at, step = sent
+            self.samples[step].append(received_at - sent_at)
+
+
+def tag_intensities(intensity, tag):
+    """Escribe la marca de ``tag`` en los primeros puntos de ``intensity``"""
+    intensity[0] = LOAD_TAG_MARKER
+    for digit in range(LOAD_TAG_DIGITS):
+        intensity[1 + digit] = tag % LOAD_TAG_BASE
+        tag //= LOAD_TAG_BASE
+
+
+def find_load_tags(intensity):
+    """Marcas de batch presentes en una columna de intensidades"""
+    intensity = np.asarray(intensity)
+    starts = np.flatnonzero(
+        intensity[: len(intensity) - LOAD_TAG_DIGITS] == LOAD_TAG_MARKER
+    )
+    tags = np.zeros(len(starts), dtype=np.int64)
+    for digit in reversed(range(LOAD_TAG_DIGITS)):
+        tags = tags * LOAD_TAG_BASE + intensity[starts + 1 + digit].astype(np.int64)
+    return tags.tolist()
+
+
+def _format_points(distance, intensity, pan_angle_tenths, message_format):
+    if message_format == "text":
+        point = "{};{};{:g}"
+    else:
+        point = '{{"a":{2:g},"d":{0},"i":{1}}}'
+    return POINT_SEPARATORS[message_format].join(
+        point.format(d, i, a / 10)
+        for d, i, a in zip(distance, intensity, pan_angle_tenths)
+    )
+
+
+class DeviceBatches:
+    """Batches de un dispositivo emulado.
+
+    Las columnas se generan una vez y cada batch sólo cambia las
+    intensidades marcadas, así que para texto y JSON el resto del mensaje
+    se formatea una sola vez.
+    """
+
+    __slots__ = ("message_format", "codec_id", "columns", "tail")
+
+    def __init__(self, message_format, batch_size, codec_id=0, seed=0):
+        rng = np.random.default_rng(seed)
+        start = int(rng.integers(3600))
+        self.message_format = message_format
+        self.codec_id = codec_id
+        self.columns = {
+            "distance": rng.integers(200, 12000, batch_size).tolist(),
+            "intensity": rng.integers(0, LOAD_TAG_MARKER, batch_size).tolist(),
+            "pan_angle_tenths": (
+                (start + LOAD_PAN_STEP_TENTHS * np.arange(batch_size)) % 3600
+            ).tolist(),
+        }
+        self.tail = None
+        if message_format != "binary":
+            self.tail = _format_points(
+                *(column[LOAD_MIN_BATCH_SIZE:] for column in self.columns.values()),
+                message_format,
+            )
+
+    def encode(self, sequence, tag):
+        columns = self.columns
+        intensity = columns["intensity"]
+        tag_intensities(intensity, tag)
+
+        if self.message_format == "binary":
+            payload = encode_binary_sensor_batch_v2(
+                sequence,
+                time.monotonic_ns() // 1000,
+                LOAD_INCLINATION_TENTHS,
+                columns["distance"],
+                intensity,
+                columns["pan_angle_tenths"],
+            )
+            if self.codec_id:
+                payload = compress_binary_batch(payload, self.codec_id)
+            return payload
+
+        head = _format_points(
+            columns["distance"][:LOAD_MIN_BATCH_SIZE],
+            intensity[:LOAD_MIN_BATCH_SIZE],
+            columns["pan_angle_tenths"][:LOAD_MIN_BATCH_SIZE],
+            self.message_format,
+        )
+        if self.tail:
+            head += POINT_SEPARATORS[self.message_format] + self.tail
+        if self.message_format == "text":
+            return f"{LOAD_INCLINATION_TENTHS / 10:g};{head}"
+        return (
+            f'{{"inclination":{LOAD_INCLINATION_TENTHS / 10:g},"points":[{head}]}}'
+        )
+
+
+def new_step_stats():
+    return {"sent_batches": 0, "late_batches": 0, "device_errors": 0}
+
+
+async def start_load_scan(ws, scan_id):
+    await ws.send(json.dumps({"type": "start_scan", "scan_id": scan_id}))
+    while True:
+        reply = await asyncio.wait_for(ws.recv(), REGISTER_TIMEOUT_S)
+        if isinstance(reply, str) and reply.startswith("ERROR:"):
+            raise RuntimeError(f"start_scan rechazado: {reply}")
+        if isinstance(reply, str) and '"start_scan_response"' in reply:
+            return
+
+
+async def run_device(ws, index, args, schedule, tracker, step_stats):
+    """Envía batches a ritmo fijo durante cada etapa de ``schedule``"""
+    batches = DeviceBatches(
+        args.format, args.batch_size, CODEC_IDS.get(args.codec, 0), seed=index
+    )
+    current = {"step": 0}
+
+    async def read_replies():
+        try:
+            async for reply in ws:
+                if isinstance(reply, str) and reply.startswith("ERROR:"):
+                    step_stats[current["step"]]["device_errors"] += 1
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    reader = asyncio.create_task(read_replies())
+    loop = asyncio.get_running_loop()
+    sequence = 0
+    try:
+        for step, (started_at, ends_at, points_per_second) in enumerate(schedule):
+            current["step"] = step
+            stats = step_stats[step]
+            interval = args.batch_size / points_per_second
+            # Dispositivos escalonados dentro del intervalo
+            next_at = started_at + interval * index / args.devices
+            while next_at < ends_at:
+                delay = next_at - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                elif delay < -interval:
+                    stats["late_batches"] += 1
+
+                tag = tracker.reserve()
+                message = batches.encode(sequence, tag)
+                tracker.mark_sent(tag, step)
+                await ws.send(message)
+                stats["sent_batches"] += 1
+                sequence += 1
+                next_at += interval
+    finally:
+        reader.cancel()
+
+
+async def register_web_client(url, scan_id, encoding):
+    ws = await websockets.connect(url, max_size=None)
+    await ws.send(
+        json.dumps(
+            {"type": "register", "client": "web", "encoding": encoding, "scan": scan_id}
+        )
+    )
+    while True:
+        reply = await asyncio.wait_for(ws.recv(), REGISTER_TIMEOUT_S)
+        if isinstance(reply, str) and '"scan_subscribed"' in reply:
+            return ws
+
+
+async def run_web_client(ws, tracker):
+    """Lee ``new_points`` hasta que se cierre la conexión"""
+    new_points = WEB_FRAME_TYPES["new_points"]
+    try:
+        async for message in ws:
+            received_at = time.perf_counter()
+            if isinstance(message, bytes):
+                magic, _, frame_type, count, _ = WEB_FRAME_HEADER.unpack_from(
+                    message, 0
+                )
+                if magic != WEB_FRAME_MAGIC or frame_type != new_points:
+                    continue
+                records = np.frombuffer(
+                    message,
+                    dtype=POINT_RECORD_DTYPE,
+                    count=count,
+                    offset=WEB_FRAME_HEADER.size,
+                )
+                tracker.observe(records["intensity"], received_at)
+                continue
+
+            data = json.loads(message)
+            # Con "progress" es continuación del estado inicial, no datos en vivo
+            if data.get("type") != "new_points" or "progress" in data:
+                continue
+            tracker.observe(
+                [point["intensity"] for point in data["data"]], received_at
+            )
+    except websockets.exceptions.ConnectionClosed:
+        pass
+
+
+def report_step(step, args, points_per_second, stats, samples, cpu, web_clients):
+    """Imprime la línea ``LOAD|event=step`` y devuelve sus métricas"""
+    sent = stats["sent_batches"]
+    expected = sent * web_clients
+    latencies_ms = np.array(samples) * 1000
+    percentiles = (
+        np.percentile(latencies_ms, PERCENTILES)
+        if len(latencies_ms)
+        else [float("nan")] * len(PERCENTILES)
+    )
+    result = {
+        "sent_points_s": sent * args.batch_size / args.duration,
+        "delivered": len(samples) / expected if expected else 0,
+        "late_batches": stats["late_batches"],
+        "device_errors": stats["device_errors"],
+        "p99_ms": percentiles[PERCENTILES.index(99)],
+        "loadgen_cpu": cpu,
+    }
+    print(
+        "LOAD|event=step"
+        f"|step={step}"
+        f"|format={args.format}"
+        f"|codec={args.codec}"
+        f"|devices={args.devices}"
+        f"|batch_size={args.batch_size}"
+        f"|target_points_s={points_per_second * args.devices:.0f}"
+        f"|sent_points_s={result['sent_points_s']:.0f}"
+        f"|sent_batches={sent}"
+        f"|late_batches={stats['late_batches']}"
+        f"|device_errors={stats['device_errors']}"
+        f"|web_clients={web_clients}"
+        f"|delivered={result['delivered']:.4f}"
+        + "".join(
+            f"|p{percentile}_ms={value:.3f}"
+            for percentile, value in zip(PERCENTILES, percentiles)
+        )
+        + f"|max_ms={latencies_ms.max() if len(latencies_ms) else float('nan'):.3f}"
+        f"|loadgen_cpu={cpu:.2f}"
+    )
+    return result
+
+
+async def run_load(args):
+    scan_id = args.scan or f"loadgen-{time.strftime('%Y%m%d-%H%M%S')}"
+    tracker = LatencyTracker(args.steps)
+    step_stats = [new_step_stats() for _ in range(args.steps)]
+
+    devices = [
+        await websockets.connect(args.url, max_size=None) for _ in range(args.devices)
+    ]
+    # El primero crea el escaneo; los demás lo retoman
+    for ws in devices:
+        await start_load_scan(ws, scan_id)
+    web_clients = [
+        await register_web_client(args.url, scan_id, args.web_encoding)
+        for _ in range(args.web_clients)
+    ]
+    readers = [asyncio.create_task(run_web_client(ws, tracker)) for ws in web_clients]
+    print(
+        f"Escaneo {scan_id}: {args.devices} dispositivos ({args.format}), "
+        f"{args.web_clients} clientes web ({args.web_encoding})"
+    )
+
+    loop = asyncio.get_running_loop()
+    started_at = loop.time() + 0.1
+    schedule = [
+        (
+            started_at + step * args.duration,
+            started_at + (step + 1) * args.duration,
+            args.points_per_second * args.step_factor**step,
+        )
+        for step in range(args.steps)
+    ]
+    senders = asyncio.gather(
+        *(
+            run_device(ws, index, args, schedule, tracker, step_stats)
+            for index, ws in enumerate(devices)
+        )
+    )
+
+    cpu = []
+    for step_started_at, step_ends_at, _ in schedule:
+        await asyncio.sleep(max(0.0, step_started_at - loop.time()))
+        wall, process = time.perf_counter(), time.process_time()
+        await asyncio.sleep(max(0.0, step_ends_at - loop.time()))
+        cpu.append((time.process_time() - process) / (time.perf_counter() - wall))
+    await senders
+    # Lo que quedó en vuelo al terminar la última etapa
+    await asyncio.sleep(args.drain)
+
+    for ws in devices + web_clients:
+        await ws.close()
+    await asyncio.gather(*readers)
+
+    results = [
+        report_step(
+            step,
+            args,
+            points_per_second,
+            step_stats[step],
+            tracker.samples[step],
+            cpu[step],
+            len(web_clients),
+        )
+        for step, (_, _, points_per_second) in enumerate(schedule)
+    ]
+    if tracker.unknown:
+        print(f"Marcas desconocidas recibidas: {tracker.unknown}")
+    return results
+
+
+def sustained_points_s(results, max_p99_ms):
+    """Mayor tasa enviada que llegó completa, a tiempo y sin errores"""
+    return max(
+        (
+            result["sent_points_s"]
+            for result in results
+            if result["delivered"] >= SUSTAINED_DELIVERED
+            and result["p99_ms"] <= max_p99_ms
+            and not result["device_errors"]
+        ),
+        default=0.0,
+    )
+
+
+async def start_server(url, workers, log):
+    """Lanza ``main.py`` con ``workers`` workers y espera a que acepte conexiones"""
+    env = dict(os.environ, LIDAR_WORKERS=str(workers))
+    if workers > 1:
+        env["STORAGE_BACKEND"] = "redis"
+    process = subprocess.Popen(
+        [sys.executable, str(SERVER_SCRIPT)],
+        cwd=SERVER_SCRIPT.parent,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    deadline = time.monotonic() + SERVER_START_TIMEOUT_S
+    while True:
+        if process.poll() is not None:
+            raise RuntimeError(
+                f"el servidor terminó al arrancar ({process.returncode})"
+            )
+        try:
+            ws = await websockets.connect(url)
+        except OSError:
+            if time.monotonic() > deadline:
+                stop_server(process)
+                raise RuntimeError("el servidor no aceptó conexiones a tiempo")
+            await asyncio.sleep(0.2)
+            continue
+        await ws.close()
+        break
+    await asyncio.sleep(SERVER_WARMUP_S)
+    return process
+
+
+def stop_server(process):
+    # El supervisor de workers termina a sus procesos con SIGTERM
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(SERVER_STOP_TIMEOUT_S)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def run_scaling(args):
+    """Las mismas etapas contra el servidor con cada cantidad de workers"""
+    log = open(args.server_log, "ab") if args.server_log else subprocess.DEVNULL
+    baseline = None
+    try:
+        for workers in args.server_workers:
+            print(f"Servidor con {workers} workers")
+            process = await start_server(args.url, workers, log)
+            try:
+                results = await run_load(args)
+            finally:
+                stop_server(process)
+
+            sustained = sustained_points_s(results, args.max_p99_ms)
+            baseline = baseline or (workers, sustained)
+            speedup = sustained / baseline[1] if baseline[1] else 0.0
+            print(
+                "LOAD|event=scaling"
+                f"|workers={workers}"
+                f"|devices={args.devices}"
+                f"|format={args.format}"
+                f"|sustained_points_s={sustained:.0f}"
+                f"|speedup={speedup:.2f}"
+                f"|efficiency={speedup * baseline[0] / workers:.2f}"
+                f"|max_loadgen_cpu={max(r['loadgen_cpu'] for r in results):.2f}"
+            )
+    finally:
+        if args.server_log:
+            log.close()
+
+
+def run(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="ws://localhost:3000")
+    parser.add_argument("--devices", type=int, default=1)
+    parser.add_argument("--format", choices=LOAD_FORMATS, default="binary")
+    parser.add_argument(
+        "--codec",
+        choices=["none"] + available_codecs(),
+        default="none",
+        help="compresión de los batches binarios",
+    )
+    parser.add_argument(
+        "--points-per-second",
+        type=float,
+        default=4000,
+        help="puntos/s por dispositivo en la primera etapa",
+    )
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--web-clients", type=int, default=1)
+    parser.add_argument("--web-encoding", choices=("json", "binary"), default="binary")
+    parser.add_argument("--duration", type=float, default=10.0, help="s por etapa")
+    parser.add_argument("--steps", type=int, default=1)
+    parser.add_argument("--step-factor", type=float, default=2.0)
+    parser.add_argument("--drain", type=float, default=2.0)
+    parser.add_argument("--scan", help="escaneo compartido (por defecto uno nuevo)")
+    parser.add_argument(
+        "--server-workers",
+        type=lambda value: [int(count) for count in value.split(",")],
+        help="levantar main.py con estas cantidades de workers (p. ej. 1,2,4)",
+    )
+    parser.add_argument(
+        "--max-p99-ms",
+        type=float,
+        default=250.0,
+        help="p99 máximo de una etapa sostenida con --server-workers",
+    )
+    parser.add_argument("--server-log", help="archivo para la salida del servidor")
+    args = parser.parse_args(argv)
+
+    if args.batch_size < LOAD_MIN_BATCH_SIZE:
+        parser.error(f"--batch-size debe ser al menos {LOAD_MIN_BATCH_SIZE}")
+    if args.codec != "none" and args.format != "binary":
+        parser.error("--codec sólo aplica a --format binary")
+    if args.server_workers:
+        if args.scan:
+            parser.error("--scan no aplica a --server-workers")
+        asyncio.run(run_scaling(args))
+        return
+    asyncio.run(run_load(args))
+
+
+if __name__ == "__main__":
+    run()
@@ -1,18 +1,60 @@
 import os
+import re
 import math
 import asyncio
-import csv
-import struct
+import numpy as np
 import websockets
 import redis.asyncio as redis
 import json
-import uuid
 import time
 from pathlib import Path
 from datetime import datetime
 
+from parse import (
+    JsonMessageDecoder,
+    is_sensor_json,
+    parse_json_sensor_data,
+    parse_sensor_data,
+)
+from pipeline import Pipeline, Stage, StageStats
+from scan_cache import ScanCache
+from voxel_lod import VoxelLods, find_voxel_size
+from device_link import DeviceLink
+from workers import (
+    BUS_CHANNEL,
+    decode_bus_message,
+    encode_bus_batch,
+    encode_bus_event,
+    run_workers,
+)
+from telemetry import TelemetrySink
+from scan_archive import ScanArchive
+from ingest_capture import IngestRecorder
+from storage import STORAGE_BACKENDS, create_scan_store
+from fanout import (
+    OVERFLOW_POLICIES,
+    SLOW_CLIENT_CLOSE_CODE,
+    WEB_CLIENT_MAX_HELD_POINTS,
+    BroadcastMessage,
+    WebClient,
+)
+from point_batch import (
+    PointBatch,
+    POINT_RECORD_DTYPE,
+    WEB_FRAME_TYPES,
+    decode_chunk,
+    encode_chunk,
+)
+from sensor_protocol import (
+    BINARY_BATCH_MAGIC,
+    TENTH_DEGREE_STEPS,
+    decompress_binary_batch,
+    parse_binary_sensor_data,
+    unpack_binary_batch_header,
+)
+
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-REDIS_KEY = "lidar_points"
+SCAN_ID_PATTERN = re.compile(r"[A-Za-z0-9_.-]{1,64}")
 SERVICE_ROOT = Path(__file__).resolve().parent
 PROJECT_ROOT = Path(os.getenv("PROJECT_ROOT", Path.cwd())).resolve()
 NETWORK_TELEMETRY_CSV = Path(
@@ -22,13 +64,92 @@ NETWORK_TELEMETRY_CSV = Path(
     )
 )
 
-BINARY_BATCH_MAGIC = b"PS"
-BINARY_BATCH_VERSION = 1
-BINARY_BATCH_HEADER_SIZE = 8
-BINARY_POINT_RECORD_SIZE = 5
+# Formato de cada trama según su tipo y primeros bytes, sin parseo especulativo
+MESSAGE_FORMATS = ("binary", "json", "text", "unknown")
+TEXT_MESSAGE_FIRST_CHARS = frozenset("0123456789+-.")
+WHEEL_BASE = 15.35
+COORDINATE_DECIMALS = 2
+
+# Tablas seno/coseno por décima de grado. Se repiten 19 veces (68400 >= 65536)
+# para que cualquier índice int16/uint16 -los negativos NumPy los toma desde el
+# final- caiga en su ángulo equivalente sin pasar por np.mod.
+_TRIG_TABLE_PERIODS = 19
+_TENTH_DEGREE_RADIANS = np.radians(np.arange(TENTH_DEGREE_STEPS) / 10.0)
+SIN_TENTHS = np.tile(np.sin(_TENTH_DEGREE_RADIANS), _TRIG_TABLE_PERIODS)
+COS_TENTHS = np.tile(np.cos(_TENTH_DEGREE_RADIANS), _TRIG_TABLE_PERIODS)
+
+WEB_ENCODINGS = {"json", "binary"}
+WEB_CLIENT_QUEUE_SIZE = int(os.getenv("WEB_CLIENT_QUEUE_SIZE", "64"))
+WEB_CLIENT_OVERFLOW_POLICY = os.getenv("WEB_CLIENT_OVERFLOW_POLICY", "drop_oldest")
+WEB_CLIENT_MAX_HELD_POINTS = int(
+    os.getenv("WEB_CLIENT_MAX_HELD_POINTS", str(WEB_CLIENT_MAX_HELD_POINTS))
+)
+if WEB_CLIENT_OVERFLOW_POLICY not in OVERFLOW_POLICIES:
+    raise ValueError(
+        f"WEB_CLIENT_OVERFLOW_POLICY debe ser uno de {', '.join(OVERFLOW_POLICIES)}"
+    )
 
-web_clients = set()
+INITIAL_STATE_CHUNK_BATCHES = int(os.getenv("INITIAL_STATE_CHUNK_BATCHES", "100"))
+# Un cliente que se reconecta con "since" recibe sólo los batches que le
+# faltan si son a lo sumo estos; si no, el estado inicial completo.
+RESYNC_MAX_BATCHES = int(os.getenv("RESYNC_MAX_BATCHES", "1000"))
+SCAN_CACHE_MAX_BYTES = int(os.getenv("SCAN_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+SCAN_PRELOAD_COUNT = int(os.getenv("SCAN_PRELOAD_COUNT", "4"))
+VOXEL_LOD_SIZES_MM = tuple(
+    float(size)
+    for size in os.getenv("VOXEL_LOD_SIZES_MM", "5,20,80").split(",")
+    if size.strip()
+)
+VOXEL_LOD_CHUNK_POINTS = int(os.getenv("VOXEL_LOD_CHUNK_POINTS", "10000"))
+# Con más de un worker, cada uno es un proceso con SO_REUSEPORT en el puerto
+# 3000 y el fan-out a clientes web pasa por Redis pub/sub.
+LIDAR_WORKERS = int(os.getenv("LIDAR_WORKERS", "1"))
+# Dónde se guardan los puntos de cada escaneo: redis, file (archivos en
+# STORAGE_DIR) o memory (se pierden al reiniciar).
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "redis")
+if STORAGE_BACKEND not in STORAGE_BACKENDS:
+    raise ValueError(f"STORAGE_BACKEND debe ser uno de {', '.join(STORAGE_BACKENDS)}")
+if LIDAR_WORKERS > 1 and STORAGE_BACKEND != "redis":
+    raise ValueError("Con LIDAR_WORKERS > 1 el almacenamiento debe ser redis")
+STORAGE_DIR = Path(os.getenv("STORAGE_DIR", SERVICE_ROOT / "scan_store"))
+BUS_RECONNECT_DELAY_S = 1.0
+# Espera antes de leer del almacenamiento un hueco de la caché que el bus no
+# llenó (batches intercalados de varios workers llegan con milisegundos).
+SCAN_GAP_FILL_DELAY_S = float(os.getenv("SCAN_GAP_FILL_DELAY_MS", "200")) / 1000
+PIPELINE_STAGE_CAPACITY = int(os.getenv("PIPELINE_STAGE_CAPACITY", "256"))
+PIPELINE_PERSIST_MAX_BATCH = int(os.getenv("PIPELINE_PERSIST_MAX_BATCH", "32"))
+PIPELINE_STATS_INTERVAL_S = float(os.getenv("PIPELINE_STATS_INTERVAL_S", "10"))
+
+# websocket -> WebClient
+web_clients = {}
 redis_client = None
+scan_store = None
+background_tasks = set()
+# scan_id -> tarea que completa un hueco de su caché
+scan_gap_fills = {}
+# conexión de un dispositivo -> tarea que le envía una respuesta de error
+error_replies = {}
+ingest_pipeline = None
+receive_stats = StageStats("receive")
+# msgspec, orjson o json; vacío elige el primero instalado
+SENSOR_JSON_DECODER = os.getenv("SENSOR_JSON_DECODER") or None
+json_decoder = JsonMessageDecoder(SENSOR_JSON_DECODER)
+json_decode_stats = StageStats("json_decode")
+decompress_stats = StageStats("decompress")
+# Tasa de compresión de cada batch comprimido desde el último NET|event=stats
+compression_ratios = []
+# Envío en el dispositivo (tramas v2) → broadcast a clientes web
+device_latency_stats = StageStats("device_latency")
+# dispositivo -> DeviceLink de su conexión
+device_links = {}
+scan_cache = ScanCache(SCAN_CACHE_MAX_BYTES)
+# scan_id -> VoxelLods, sólo para escaneos cuyos LOD están completos. Cuentan
+# para SCAN_CACHE_MAX_BYTES y se desalojan con su escaneo (ver restore_scan_lods).
+scan_lods = scan_cache.lods
+# scan_id -> hora de inicio, en orden de inicio
+scan_registry = {}
+latest_scan_id = None
+worker_index = 0
 
 network_stats = {
     "started_at": None,
@@ -47,8 +168,97 @@ network_stats = {
     "broadcast_failures": 0,
     "web_units": 0,
     "web_bytes": 0,
+    "web_queue_depth": 0,
+    "web_queue_max_depth": 0,
+    "web_dropped_messages": 0,
+    "web_coalesced_messages": 0,
+    "web_slow_disconnects": 0,
+    "web_resyncs": 0,
+    "web_resync_fallbacks": 0,
+    "bus_batches_out": 0,
+    "bus_batches_in": 0,
+    "scan_gap_fills": 0,
+    "message_formats": dict.fromkeys(MESSAGE_FORMATS, 0),
+    "device_frames_lost": 0,
+    "device_frames_reordered": 0,
+    "device_frames_duplicated": 0,
+    "compressed_units": 0,
+    "web_client_queues": {},
+    "scan_cache": {},
+    "voxel_lods": {},
 }
-network_telemetry_header_written = False
+NETWORK_TELEMETRY_HEADER = [
+    "timestamp",
+    "duration_s",
+    "last_unit_type",
+    "sensor_units",
+    "sensor_bytes",
+    "estimated_ws_frame_bytes",
+    "throughput_bytes_s",
+    "estimated_ws_throughput_bytes_s",
+    "mean_bytes_unit",
+    "text_units",
+    "text_bytes",
+    "binary_units",
+    "binary_bytes",
+    "points_parsed",
+    "points_processed",
+    "parse_failures",
+    "redis_failures",
+    "broadcast_failures",
+    "web_units",
+    "web_bytes",
+]
+TELEMETRY_FLUSH_MS = int(os.getenv("TELEMETRY_FLUSH_MS", "1000"))
+TELEMETRY_FLUSH_ROWS = int(os.getenv("TELEMETRY_FLUSH_ROWS", "500"))
+TELEMETRY_RING_SIZE = int(os.getenv("TELEMETRY_RING_SIZE", "10000"))
+telemetry_sink = TelemetrySink(
+    NETWORK_TELEMETRY_CSV,
+    NETWORK_TELEMETRY_HEADER,
+    flush_interval_ms=TELEMETRY_FLUSH_MS,
+    flush_rows=TELEMETRY_FLUSH_ROWS,
+    ring_size=TELEMETRY_RING_SIZE,
+)
+# Copia local, sólo de anexado, de los puntos de cada escaneo (scan_archive.py);
+# SCAN_ARCHIVE_DIR vacío la desactiva. Es una exportación derivada: el
+# servidor nunca la lee, la copia canónica es la de STORAGE_BACKEND. Con el
+# backend file los chunks ya están en disco, así que sólo se escribe si
+# SCAN_ARCHIVE_WITH_FILE_STORE=1 (si no, cada batch se escribiría dos veces).
+SCAN_ARCHIVE_DIR = os.getenv("SCAN_ARCHIVE_DIR", str(SERVICE_ROOT / "scan_archive"))
+SCAN_ARCHIVE_WITH_FILE_STORE = os.getenv("SCAN_ARCHIVE_WITH_FILE_STORE", "0") == "1"
+if STORAGE_BACKEND == "file" and not SCAN_ARCHIVE_WITH_FILE_STORE:
+    SCAN_ARCHIVE_DIR = ""
+SCAN_ARCHIVE_FSYNC_MS = int(os.getenv("SCAN_ARCHIVE_FSYNC_MS", "1000"))
+SCAN_ARCHIVE_FLUSH_BYTES = int(os.getenv("SCAN_ARCHIVE_FLUSH_BYTES", str(1024 * 1024)))
+SCAN_ARCHIVE_MAX_PENDING_BYTES = int(
+    os.getenv("SCAN_ARCHIVE_MAX_PENDING_BYTES", str(64 * 1024 * 1024))
+)
+scan_archive = (
+    ScanArchive(
+        SCAN_ARCHIVE_DIR,
+        flush_interval_ms=SCAN_ARCHIVE_FSYNC_MS,
+        flush_bytes=SCAN_ARCHIVE_FLUSH_BYTES,
+        max_pending_bytes=SCAN_ARCHIVE_MAX_PENDING_BYTES,
+    )
+    if SCAN_ARCHIVE_DIR
+    else None
+)
+# Grabación de todas las tramas entrantes (ingest_capture.py), para
+# reproducirlas con replay.py; INGEST_CAPTURE_DIR vacío (default) la desactiva.
+INGEST_CAPTURE_DIR = os.getenv("INGEST_CAPTURE_DIR", "")
+INGEST_CAPTURE_FLUSH_MS = int(os.getenv("INGEST_CAPTURE_FLUSH_MS", "1000"))
+INGEST_CAPTURE_MAX_PENDING_BYTES = int(
+    os.getenv("INGEST_CAPTURE_MAX_PENDING_BYTES", str(64 * 1024 * 1024))
+)
+ingest_recorder = (
+    IngestRecorder(
+        INGEST_CAPTURE_DIR,
+        flush_interval_ms=INGEST_CAPTURE_FLUSH_MS,
+        max_pending_bytes=INGEST_CAPTURE_MAX_PENDING_BYTES,
+    )
+    if INGEST_CAPTURE_DIR
+    else None
+)
 
 # Variables para calcular puntos por segundo
 total_points_processed = 0
@@ -65,46 +275,6 @@ def _network_duration_s(now=None):
     return (now or time.time()) - network_stats["started_at"]
 
 
-def _ensure_network_telemetry_header():
-    global network_telemetry_header_written
-
-    if network_telemetry_header_written:
-        return
-
-    NETWORK_TELEMETRY_CSV.parent.mkdir(parents=True, exist_ok=True)
-    network_telemetry_header_written = NETWORK_TELEMETRY_CSV.exists() and NETWORK_TELEMETRY_CSV.stat().st_size > 0
-    if network_telemetry_header_written:
-        return
-
-    with NETWORK_TELEMETRY_CSV.open("w", newline="", encoding="utf-8") as fh:
-        writer = csv.writer(fh)
-        writer.writerow(
-            [
-                "timestamp",
-                "duration_s",
-                "last_unit_type",
-                "sensor_units",
-                "sensor_bytes",
-                "estimated_ws_frame_bytes",
-                "throughput_bytes_s",
-                "estimated_ws_throughput_bytes_s",
-                "mean_bytes_unit",
-                "text_units",
-                "text_bytes",
-                "binary_units",
-                "binary_bytes",
-                "points_parsed",
-                "points_processed",
-                "parse_failures",
-                "redis_failures",
-                "broadcast_failures",
-                "web_units",
-                "web_bytes",
-            ]
-        )
-    network_telemetry_header_written = True
-
-
 def record_inbound_unit(unit_type, byte_count):
     now = time.time()
     if unit_type in {"binary", "text"} and network_stats["started_at"] is None:
@@ -142,10 +312,7 @@ def estimate_client_ws_frame_bytes(payload_bytes):
     return payload_bytes + header_bytes + 4
 
 
-def write_network_telemetry(unit_type):
-    _ensure_network_telemetry_header()
-
-    duration_s = _network_duration_s()
+def _network_throughputs(duration_s):
     throughput_bytes_s = network_stats["sensor_bytes"] / duration_s if duration_s > 0 else 0
     estimated_ws_throughput_bytes_s = (
         network_stats["estimated_ws_frame_bytes"] / duration_s if duration_s > 0 else 0
@@ -155,38 +322,84 @@ def write_network_telemetry(unit_type):
         if network_stats["sensor_units"] > 0
         else 0
     )
+    return throughput_bytes_s, estimated_ws_throughput_bytes_s, mean_bytes_unit
+
+
+def write_network_telemetry(unit_type):
+    """Guarda una instantánea de network_stats en el anillo de telemetría"""
+    duration_s = _network_duration_s()
+    throughput_bytes_s, estimated_ws_throughput_bytes_s, mean_bytes_unit = (
+        _network_throughputs(duration_s)
+    )
+
+    telemetry_sink.append(
+        [
+            _now_iso(),
+            f"{duration_s:.3f}",
+            unit_type,
+            network_stats["sensor_units"],
+            network_stats["sensor_bytes"],
+            network_stats["estimated_ws_frame_bytes"],
+            f"{throughput_bytes_s:.3f}",
+            f"{estimated_ws_throughput_bytes_s:.3f}",
+            f"{mean_bytes_unit:.3f}",
+            network_stats["text_units"],
+            network_stats["text_bytes"],
+            network_stats["binary_units"],
+            network_stats["binary_bytes"],
+            network_stats["points_parsed"],
+            network_stats["points_processed"],
+            network_stats["parse_failures"],
+            network_stats["redis_failures"],
+            network_stats["broadcast_failures"],
+            network_stats["web_units"],
+            network_stats["web_bytes"],
+        ]
+    )
 
-    with NETWORK_TELEMETRY_CSV.open("a", newline="", encoding="utf-8") as fh:
-        writer = csv.writer(fh)
-        writer.writerow(
-            [
-                _now_iso(),
-                f"{duration_s:.3f}",
-                unit_type,
-                network_stats["sensor_units"],
-                network_stats["sensor_bytes"],
-                network_stats["estimated_ws_frame_bytes"],
-                f"{throughput_bytes_s:.3f}",
-                f"{estimated_ws_throughput_bytes_s:.3f}",
-                f"{mean_bytes_unit:.3f}",
-                network_stats["text_units"],
-                network_stats["text_bytes"],
-                network_stats["binary_units"],
-                network_stats["binary_bytes"],
-                network_stats["points_parsed"],
-                network_stats["points_processed"],
-                network_stats["parse_failures"],
-                network_stats["redis_failures"],
-                network_stats["broadcast_failures"],
-                network_stats["web_units"],
-                network_stats["web_bytes"],
-            ]
-        )
 
+def print_network_stats(rows):
+    """Resumen NET|event=stats al volcar el anillo de telemetría"""
+    global compression_ratios
+    refresh_web_client_stats()
+
+    unit_type = rows[-1][NETWORK_TELEMETRY_HEADER.index("last_unit_type")]
+    duration_s = _network_duration_s()
+    throughput_bytes_s, estimated_ws_throughput_bytes_s, mean_bytes_unit = (
+        _network_throughputs(duration_s)
+    )
+
+    formats = "".join(
+        f"|format_{name}={count}"
+        for name, count in network_stats["message_formats"].items()
+    )
+    ratios, compression_ratios = compression_ratios, []
+    compression = ""
+    if ratios:
+        low, median, high = np.percentile(ratios, [0, 50, 100])
+        compression = (
+            f"|compression_ratio_min={low:.3f}"
+            f"|compression_ratio_p50={median:.3f}"
+            f"|compression_ratio_max={high:.3f}"
+        )
+    archive = ""
+    if scan_archive is not None:
+        archive = "".join(
+            f"|archive_{name}={value}" for name, value in scan_archive.stats().items()
+        )
+    capture = ""
+    if ingest_recorder is not None:
+        capture = "".join(
+            f"|capture_{name}={value}"
+            for name, value in ingest_recorder.stats().items()
+        )
     print(
         "NET|event=stats"
+        f"|worker={worker_index}"
+        f"|json_decoder={json_decoder.backend}"
         f"|duration_s={duration_s:.3f}"
         f"|last_unit_type={unit_type}"
+        f"|rows_flushed={len(rows)}"
         f"|sensor_units={network_stats['sensor_units']}"
         f"|sensor_bytes={network_stats['sensor_bytes']}"
         f"|estimated_ws_frame_bytes={network_stats['estimated_ws_frame_bytes']}"
@@ -196,284 +409,627 @@ def write_network_telemetry(unit_type):
         f"|parse_failures={network_stats['parse_failures']}"
         f"|redis_failures={network_stats['redis_failures']}"
         f"|broadcast_failures={network_stats['broadcast_failures']}"
+        f"|web_queue_depth={network_stats['web_queue_depth']}"
+        f"|web_queue_max_depth={network_stats['web_queue_max_depth']}"
+        f"|web_dropped_messages={network_stats['web_dropped_messages']}"
+        f"|web_coalesced_messages={network_stats['web_coalesced_messages']}"
+        f"|web_slow_disconnects={network_stats['web_slow_disconnects']}"
+        f"|web_resyncs={network_stats['web_resyncs']}"
+        f"|web_resync_fallbacks={network_stats['web_resync_fallbacks']}"
+        f"|scan_cache_bytes={network_stats['scan_cache']['bytes']}"
+        f"|scan_cache_hits={network_stats['scan_cache']['hits']}"
+        f"|scan_cache_misses={network_stats['scan_cache']['misses']}"
+        f"|bus_batches_out={network_stats['bus_batches_out']}"
+        f"|bus_batches_in={network_stats['bus_batches_in']}"
+        f"|scan_gap_fills={network_stats['scan_gap_fills']}"
+        f"|device_frames_lost={network_stats['device_frames_lost']}"
+        f"|device_frames_reordered={network_stats['device_frames_reordered']}"
+        f"|device_frames_duplicated={network_stats['device_frames_duplicated']}"
+        f"|compressed_units={network_stats['compressed_units']}"
+        f"{compression}"
+        f"{formats}"
+        f"{archive}"
+        f"{capture}"
+        f"|telemetry_dropped_rows={telemetry_sink.dropped_rows}"
     )
 
 
-async def init_redis():
-    global redis_client
-    redis_client = redis.from_url(REDIS_URL, decode_responses=True)
-    print("Conexión a Redis establecida")
+telemetry_sink.on_flush = print_network_stats
 
 
-def parse_sensor_data(message):
+async def init_storage():
+    """Abre el almacenamiento de escaneos; Redis también hace de bus entre workers"""
+    global redis_client, scan_store
+    if STORAGE_BACKEND == "redis" or LIDAR_WORKERS > 1:
+        redis_client = redis.from_url(REDIS_URL, decode_responses=False)
+        print("Conexión a Redis establecida")
+    scan_store = create_scan_store(STORAGE_BACKEND, redis_client, STORAGE_DIR)
     try:
-        inclination_groups = message.strip().split("|")
+        await scan_store.open()
+    except Exception as e:
+        print(f"Error abriendo el almacenamiento {STORAGE_BACKEND}: {e}")
+    print(f"Almacenamiento de escaneos: {STORAGE_BACKEND}")
 
-        all_points = []
-        current_inclination = None
 
-        for group_index, group in enumerate(inclination_groups):
-            if not group:
-                continue
 
-            parts = group.split(";")
-            if not parts:
-                continue
 
-            if group_index == 0:
-                try:
-                    current_inclination = float(parts[0])
-                    data_parts = parts[1:]
-                except (ValueError, IndexError):
-                    continue
-            else:
-                data_parts = parts
+def convert_to_cartesian(inclination, pan_angle, distance, wheel_base=WHEEL_BASE):
+    inc_rad = math.radians(inclination)
+    pan_rad = math.radians(pan_angle)
 
-                if len(data_parts) % 3 == 1:
-                    try:
-                        new_inclination = float(data_parts[-1])
-                        data_parts = data_parts[:-1]
-                    except ValueError:
-                        pass
+    x = wheel_base * math.cos(inc_rad) + distance * math.cos(pan_rad) * math.sin(
+        inc_rad
+    )
+    y = distance * math.sin(pan_rad)
+    z = wheel_base * math.sin(inc_rad) - distance * math.cos(pan_rad) * math.cos(
+        inc_rad
+    )
 
-            for i in range(0, len(data_parts), 3):
-                if i + 2 < len(data_parts):
-                    try:
-                        distance = float(data_parts[i])
-                        intensity = float(data_parts[i + 1])
-                        angle = float(data_parts[i + 2])
-
-                        all_points.append(
-                            {
-                                "inclination": current_inclination,
-                                "distance": distance,
-                                "intensity": intensity,
-                                "pan_angle": angle,
-                            }
-                        )
-                    except ValueError:
-                        continue
+    return x, y, z
 
-            if group_index > 0 and len(parts) % 3 == 1:
-                try:
-                    current_inclination = float(parts[-1])
-                except ValueError:
-                    pass
 
-        return all_points
+def convert_to_cartesian_batch(inclination, pan_angle, distance, wheel_base=WHEEL_BASE):
+    """Versión vectorizada de ``convert_to_cartesian`` para columnas NumPy"""
+    inc_rad = np.radians(inclination)
+    pan_rad = np.radians(pan_angle)
+    cos_inc = np.cos(inc_rad)
+    sin_inc = np.sin(inc_rad)
+    projected = distance * np.cos(pan_rad)
 
-    except Exception as e:
-        print(f"Error parseando datos del sensor: {e}")
-        return []
+    x = wheel_base * cos_inc + projected * sin_inc
+    y = distance * np.sin(pan_rad)
+    z = wheel_base * sin_inc - projected * cos_inc
+
+    return x, y, z
 
 
-def parse_binary_sensor_data(payload):
-    try:
-        if len(payload) < BINARY_BATCH_HEADER_SIZE:
-            raise ValueError("payload too short")
+def convert_tenths_to_cartesian_batch(
+    inclination_tenths, pan_angle_tenths, distance, wheel_base=WHEEL_BASE
+):
+    """Igual que ``convert_to_cartesian_batch`` con ángulos en décimas de grado.
+
+    Sustituye la trigonometría por lecturas de ``SIN_TENTHS``/``COS_TENTHS``;
+    los índices deben ser int16 o uint16.
+    """
+    cos_inc = COS_TENTHS.take(inclination_tenths)
+    sin_inc = SIN_TENTHS.take(inclination_tenths)
+    projected = distance * COS_TENTHS.take(pan_angle_tenths)
+
+    x = wheel_base * cos_inc + projected * sin_inc
+    y = distance * SIN_TENTHS.take(pan_angle_tenths)
+    z = wheel_base * sin_inc - projected * cos_inc
+
+    return x, y, z
+
+
+def quantize_coordinates(*columns, decimals=COORDINATE_DECIMALS):
+    """Redondea columnas de coordenadas a ``decimals`` decimales"""
+    return tuple(np.round(column, decimals) for column in columns)
+
 
-        magic, version, flags, inclination_tenths, point_count = struct.unpack_from(
-            "<2sBBhH", payload, 0
+def is_valid_scan_id(scan_id):
+    return isinstance(scan_id, str) and SCAN_ID_PATTERN.fullmatch(scan_id) is not None
+
+
+def new_scan_id(device=None):
+    """Id de escaneo a partir de la hora y el dispositivo que lo inicia"""
+    suffix = re.sub(r"[^A-Za-z0-9_.-]", "-", device or "scan")
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{suffix}"[:64]
+
+
+async def store_batches(batches):
+    """Agrega un chunk por batch a su escaneo en una sola escritura.
+
+    Asigna a cada batch su ``sequence``: la posición de su chunk en el escaneo.
+    """
+    try:
+        await scan_store.append_batches(batches)
+        print(
+            f"Almacenados {sum(len(batch) for batch in batches)} puntos "
+            f"({scan_store.name})"
         )
+    except Exception as e:
+        network_stats["redis_failures"] += 1
+        print(f"Error almacenando en {scan_store.name}: {e}")
+
+    return batches
 
-        if magic != BINARY_BATCH_MAGIC:
-            raise ValueError("invalid binary batch magic")
 
-        if version != BINARY_BATCH_VERSION:
-            raise ValueError(f"unsupported binary batch version: {version}")
+async def get_scan_extent(scan_id):
+    """Devuelve ``(primera secuencia, chunks, puntos)`` almacenados.
 
-        expected_size = (
-            BINARY_BATCH_HEADER_SIZE + point_count * BINARY_POINT_RECORD_SIZE
+    Se leen de forma consistente; las secuencias almacenadas son
+    ``[primera, primera + chunks)``.
+    """
+    return await scan_store.extent(scan_id)
+
+
+def iter_stored_chunks(scan_id, start=0, stop=None):
+    """``(sequence, metadata, records)`` de los chunks con secuencia ``[start, stop)``.
+
+    Se leen de a INITIAL_STATE_CHUNK_BATCHES sin cargar todo el escaneo.
+    """
+    return scan_store.iter_chunks(
+        scan_id, start, stop, batch_size=INITIAL_STATE_CHUNK_BATCHES
+    )
+
+
+async def iter_initial_state(
+    scan_id, first_sequence, next_sequence, point_count, scan=None
+):
+    """Estado inicial en mensajes acotados de hasta INITIAL_STATE_CHUNK_BATCHES batches.
+
+    El primero es ``initial_state`` (el cliente reemplaza sus puntos); los
+    siguientes, ``initial_state_chunk``. Todos llevan el progreso y la
+    secuencia del último batch incluido. Con ``scan`` (un escaneo de
+    ``scan_cache``) se sirve desde memoria sin leer el almacenamiento.
+    """
+    message_type = "initial_state"
+    sent = 0
+    pending = []
+    last_sequence = None
+
+    def flush():
+        nonlocal message_type, sent
+        if len(pending) == 1:
+            records = pending[0]
+        elif pending:
+            records = np.concatenate(pending)
+        else:
+            records = np.empty(0, dtype=POINT_RECORD_DTYPE)
+        pending.clear()
+        sent += len(records)
+        message = BroadcastMessage(
+            message_type,
+            records,
+            progress=(sent, max(point_count, sent)),
+            sequence=last_sequence,
         )
-        if len(payload) != expected_size:
-            raise ValueError(
-                f"invalid payload size: expected {expected_size}, got {len(payload)}"
-            )
+        message_type = "initial_state_chunk"
+        return message
+
+    if scan is not None:
+        firsts = range(first_sequence, next_sequence, INITIAL_STATE_CHUNK_BATCHES)
+        chunks = scan.iter_chunks(next_sequence, INITIAL_STATE_CHUNK_BATCHES)
+        for first, records in zip(firsts, chunks):
+            pending.append(records)
+            last_sequence = min(first + INITIAL_STATE_CHUNK_BATCHES, next_sequence) - 1
+            yield flush()
+        if message_type == "initial_state":
+            yield flush()
+        return
 
-        inclination = inclination_tenths / 10.0
-        all_points = []
+    try:
+        async for sequence, _, records in iter_stored_chunks(
+            scan_id, first_sequence, next_sequence
+        ):
+            pending.append(records)
+            last_sequence = sequence
+            if len(pending) >= INITIAL_STATE_CHUNK_BATCHES:
+                yield flush()
+    except Exception as e:
+        print(f"Error leyendo el estado inicial almacenado: {e}")
 
-        offset = BINARY_BATCH_HEADER_SIZE
-        for _ in range(point_count):
-            distance, intensity, pan_angle_tenths = struct.unpack_from(
-                "<HBH", payload, offset
-            )
-            offset += BINARY_POINT_RECORD_SIZE
+    if pending or message_type == "initial_state":
+        yield flush()
 
-            all_points.append(
-                {
-                    "inclination": inclination,
-                    "distance": float(distance),
-                    "intensity": float(intensity),
-                    "pan_angle": pan_angle_tenths / 10.0,
-                }
-            )
 
-        return all_points
+async def iter_missed_batches(scan_id, since, next_sequence, scan=None):
+    """Batches con secuencia en ``(since, next_sequence)`` como ``new_points``.
+
+    Es el snapshot incremental de un cliente que se reconecta: se agrega a
+    los puntos que ya tiene, en mensajes de hasta INITIAL_STATE_CHUNK_BATCHES
+    batches con la secuencia del último.
+    """
+    first_chunk = since + 1
+    if scan is not None:
+        firsts = range(first_chunk, next_sequence, INITIAL_STATE_CHUNK_BATCHES)
+        chunks = scan.iter_chunks(
+            next_sequence, INITIAL_STATE_CHUNK_BATCHES, first_chunk
+        )
+        for first, records in zip(firsts, chunks):
+            last_sequence = min(first + INITIAL_STATE_CHUNK_BATCHES, next_sequence) - 1
+            yield BroadcastMessage("new_points", records, sequence=last_sequence)
+        return
 
+    pending = []
+    last_sequence = None
+    try:
+        async for sequence, _, records in iter_stored_chunks(
+            scan_id, first_chunk, next_sequence
+        ):
+            pending.append(records)
+            last_sequence = sequence
+            if len(pending) >= INITIAL_STATE_CHUNK_BATCHES:
+                yield BroadcastMessage(
+                    "new_points", np.concatenate(pending), sequence=last_sequence
+                )
+                pending = []
     except Exception as e:
-        print(f"Error parseando payload binario del sensor: {e}")
-        return []
+        print(f"Error leyendo los batches perdidos de {scan_id}: {e}")
+
+    if pending:
+        yield BroadcastMessage(
+            "new_points", np.concatenate(pending), sequence=last_sequence
+        )
+
+
+async def iter_lod_initial_state(scan_id, voxel_size):
+    """Estado inicial de un stream LOD: los centroides actuales por partes"""
+    lods = scan_lods.get(scan_id)
+    if lods is None:
+        yield BroadcastMessage(
+            "initial_state", np.empty(0, dtype=POINT_RECORD_DTYPE), progress=(0, 0)
+        )
+        return
+
+    generation = lods.generation
+    centroids = lods.grids[voxel_size].centroids()
+    total = len(centroids)
+
+    message_type = "initial_state"
+    for start in range(0, max(total, 1), VOXEL_LOD_CHUNK_POINTS):
+        if lods.generation != generation:
+            return
+        records = centroids[start : start + VOXEL_LOD_CHUNK_POINTS]
+        yield BroadcastMessage(
+            message_type, records, progress=(start + len(records), total)
+        )
+        message_type = "initial_state_chunk"
 
 
-def parse_json_sensor_data(data):
+async def load_scan(scan_id):
+    """Reconstruye desde el almacenamiento la caché y los LOD de un escaneo"""
+    scan = scan_cache.reset(scan_id)
+    lods = VoxelLods(VOXEL_LOD_SIZES_MM) if VOXEL_LOD_SIZES_MM else None
     try:
-        points = data.get("points", [])
-        inclination = float(data.get("inclination", data.get("servo_deg", 0.0)))
-        parsed_points = []
+        first_sequence, chunk_count, _ = await get_scan_extent(scan_id)
+        scan.rebase(first_sequence)
+        async for sequence, _, records in iter_stored_chunks(
+            scan_id, first_sequence, first_sequence + chunk_count
+        ):
+            scan.append(sequence, records)
+            if lods is not None:
+                lods.add(records)
+    except Exception as e:
+        print(f"Error cargando el escaneo {scan_id} almacenado: {e}")
+        scan.invalidate()
+        return
 
-        for point in points:
-            parsed_points.append(
-                {
-                    "inclination": float(point.get("inclination", inclination)),
-                    "distance": float(point.get("distance", point.get("d"))),
-                    "intensity": float(point.get("intensity", point.get("i"))),
-                    "pan_angle": float(point.get("pan_angle", point.get("a"))),
-                }
+    if lods is not None:
+        scan_lods[scan_id] = lods
+        print(
+            f"LOD de vóxeles cargados para {scan_id}: "
+            + ", ".join(
+                f"{size} mm={stats['voxels']}" for size, stats in lods.stats().items()
             )
+        )
+    if scan.complete:
+        print(
+            f"Caché del escaneo {scan_id} cargada: {scan.point_count} puntos en "
+            f"{scan.chunk_count} batches ({scan.nbytes} bytes)"
+        )
+    else:
+        print(f"Caché del escaneo {scan_id} incompleta; se leerá del almacenamiento")
 
-        return parsed_points
 
+async def load_scans():
+    """Lee el registro de escaneos y precarga los SCAN_PRELOAD_COUNT más recientes"""
+    global latest_scan_id
+    try:
+        entries = await scan_store.list_scans()
     except Exception as e:
-        print(f"Error parseando payload JSON del sensor: {e}")
-        return []
+        print(f"Error leyendo el registro de escaneos: {e}")
+        return
 
+    for scan_id, started_at in entries:
+        scan_registry[scan_id] = started_at
+    if scan_registry:
+        latest_scan_id = next(reversed(scan_registry))
+    print(f"Escaneos registrados: {len(scan_registry)} (último: {latest_scan_id})")
 
-def convert_to_cartesian(inclination, pan_angle, distance, wheel_base=15.35):
-    inc_rad = math.radians(inclination)
-    pan_rad = math.radians(pan_angle)
+    # Del más viejo al más nuevo, para que el último quede como el más usado
+    preload = list(scan_registry)[-SCAN_PRELOAD_COUNT:] if SCAN_PRELOAD_COUNT else []
+    for scan_id in preload:
+        await load_scan(scan_id)
+    scan_cache.enforce_limit()
 
-    x = wheel_base * math.cos(inc_rad) + distance * math.cos(pan_rad) * math.sin(
-        inc_rad
-    )
-    y = distance * math.sin(pan_rad)
-    z = wheel_base * math.sin(inc_rad) - distance * math.cos(pan_rad) * math.cos(
-        inc_rad
-    )
 
-    return x, y, z
+async def start_scan(scan_id=None, device=None):
+    """Registra un escaneo nuevo, o retoma uno existente, y devuelve su id.
 
+    Un escaneo nuevo pasa a ser el último: los clientes web que siguen al
+    último escaneo se cambian a él.
+    """
+    global latest_scan_id
+    if scan_id is None:
+        scan_id = new_scan_id(device)
+    elif not is_valid_scan_id(scan_id):
+        raise ValueError(f"invalid scan id: {scan_id!r}")
 
-async def store_points_in_redis(points):
-    """Almacena los puntos en Redis sin sobreescribir"""
+    started_at = time.time()
     try:
-        for point in points:
-            # Generar ID único para cada punto
-            point_id = str(uuid.uuid4())
-            point_data = {
-                **point,
-                "id": point_id,
-                "timestamp": datetime.now().isoformat(),
-            }
-
-            # Usar HSET para almacenar cada punto con su ID único
-            await redis_client.hset(REDIS_KEY, point_id, json.dumps(point_data))
-
-        print(f"Almacenados {len(points)} puntos en Redis")
+        created = await scan_store.register_scan(scan_id, started_at)
     except Exception as e:
         network_stats["redis_failures"] += 1
-        print(f"Error almacenando en Redis: {e}")
+        print(f"Error registrando el escaneo en {scan_store.name}: {e}")
+        created = scan_id not in scan_registry
+
+    if not created:
+        scan_registry.setdefault(scan_id, started_at)
+        print(f"Escaneo retomado: {scan_id}")
+        await restore_scan_lods(scan_id)
+        return scan_id
+
+    await activate_scan(scan_id, device, started_at)
+    await publish_bus_event(
+        {
+            "event": "scan_started",
+            "scan_id": scan_id,
+            "device": device,
+            "started_at": started_at,
+        }
+    )
+    return scan_id
 
 
-async def get_all_points_from_redis():
-    """Obtiene todos los puntos almacenados en Redis"""
-    try:
-        all_points_data = await redis_client.hgetall(REDIS_KEY)
-        points = []
+async def restore_scan_lods(scan_id):
+    """Reconstruye los LOD de un escaneo retomado que no los tiene.
 
-        for point_json in all_points_data.values():
-            try:
-                point = json.loads(point_json)
-                # Solo enviar los datos necesarios al cliente
-                points.append(
-                    {
-                        "intensity": point["intensity"],
-                        "x": point["x"],
-                        "y": point["y"],
-                        "z": point["z"],
-                    }
-                )
-            except json.JSONDecodeError as e:
-                print(f"Error parseando punto desde Redis: {e}")
+    Un escaneo que no se precargó, o cuyos LOD se desalojaron, se rearma
+    desde las columnas de la caché si están completas y, si no, desde el
+    almacenamiento junto con su caché.
+    """
+    if not VOXEL_LOD_SIZES_MM or scan_id in scan_lods:
+        return
 
-        return points
+    scan = scan_cache.get(scan_id)
+    if scan is None:
+        await load_scan(scan_id)
+    else:
+        lods = VoxelLods(VOXEL_LOD_SIZES_MM)
+        for records in scan.iter_chunks(
+            scan.next_sequence, INITIAL_STATE_CHUNK_BATCHES
+        ):
+            lods.add(records)
+        scan_lods[scan_id] = lods
+        print(f"LOD de vóxeles de {scan_id} reconstruidos desde la caché")
+    scan_cache.enforce_limit()
+
+
+async def activate_scan(scan_id, device, started_at):
+    """Estado local de un escaneo nuevo: caché, LOD y clientes que siguen al último"""
+    global latest_scan_id
+    scan_registry[scan_id] = started_at
+    scan_cache.reset(scan_id)
+    if VOXEL_LOD_SIZES_MM:
+        scan_lods[scan_id] = VoxelLods(VOXEL_LOD_SIZES_MM)
+    latest_scan_id = scan_id
+    print(f"Escaneo iniciado: {scan_id}")
+
+    await broadcast_to_web_clients(
+        {"scan_id": scan_id, "device": device}, "scan_started"
+    )
+    for client in list(web_clients.values()):
+        if client.follow_latest:
+            await subscribe_web_client(client, scan_id, replace_pending=True)
+
+
+async def reset_scan(scan_id, first_sequence=0):
+    """Vacía el estado local de un escaneo tras limpiarlo del almacenamiento.
+
+    ``first_sequence`` es la del próximo batch del escaneo (ver
+    ``clear_stored_scan``).
+    """
+    scan_cache.reset(scan_id, first_sequence)
+    if scan_archive is not None:
+        scan_archive.reset(scan_id)
+    if scan_id in scan_lods:
+        scan_lods[scan_id].reset()
+    elif VOXEL_LOD_SIZES_MM:
+        scan_lods[scan_id] = VoxelLods(VOXEL_LOD_SIZES_MM)
+    # Notificar a los clientes web del escaneo que se limpiaron los datos
+    await broadcast_to_web_clients([], "scan_cleared", scan_id=scan_id)
+
+
+async def clear_stored_scan(scan_id):
+    """Vacía un escaneo del almacenamiento; None si falló.
+
+    Devuelve la secuencia del próximo batch: continúa donde quedó el
+    escaneo, así un cliente que no vio la limpieza no puede confundir los
+    batches nuevos con los que ya tenía.
+    """
+    try:
+        first_sequence = await scan_store.clear(scan_id)
+        print(
+            f"Puntos del escaneo {scan_id} limpiados ({scan_store.name}); "
+            f"sigue en la secuencia {first_sequence}"
+        )
+        return first_sequence
     except Exception as e:
-        print(f"Error obteniendo puntos de Redis: {e}")
-        return []
+        print(f"Error limpiando el almacenamiento: {e}")
+        return None
+
+
+def _spawn(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
+def refresh_web_client_stats():
+    """Vuelca profundidad de cola y contadores por cliente en network_stats"""
+    queues = {
+        _device_id(client.ws): client.stats() for client in web_clients.values()
+    }
+    network_stats["web_client_queues"] = queues
+    network_stats["web_queue_depth"] = sum(queue["depth"] for queue in queues.values())
+    network_stats["web_queue_max_depth"] = max(
+        [network_stats["web_queue_max_depth"]]
+        + [queue["max_depth"] for queue in queues.values()]
+    )
+    network_stats["scan_cache"] = scan_cache.stats()
+    network_stats["voxel_lods"] = {
+        scan_id: lods.stats() for scan_id, lods in scan_lods.items()
+    }
 
 
-async def clear_points_from_redis():
-    """Limpia todos los puntos del escaneo en Redis"""
-    try:
-        await redis_client.delete(REDIS_KEY)
-        print("Puntos limpiados de Redis")
-        return True
-    except Exception as e:
-        print(f"Error limpiando Redis: {e}")
-        return False
+async def unregister_web_client(ws, code=None, reason=""):
+    client = web_clients.pop(ws, None)
+    if client is not None:
+        await client.close(code, reason)
+
 
+async def broadcast_to_web_clients(
+    data, message_type="new_points", lod=None, scan_id=None, sequence=None
+):
+    """Encola datos para todos los clientes web conectados.
 
-async def broadcast_to_web_clients(data, message_type="new_points"):
-    """Envía datos a todos los clientes web conectados"""
+    No espera a ningún envío: cada cliente tiene su propia tarea y cola
+    acotada, y el mensaje se serializa una vez por codificación. Con
+    ``scan_id`` sólo llega a los suscritos a ese escaneo, y los mensajes de
+    puntos sólo a los suscritos a ``lod`` (None son los puntos crudos).
+    """
     if web_clients:
-        message = json.dumps({"type": message_type, "data": data})
+        message = BroadcastMessage(message_type, data, sequence=sequence)
+        point_message = message_type in WEB_FRAME_TYPES
 
-        disconnected = []
+        for ws, client in list(web_clients.items()):
+            if scan_id is not None and client.scan_id != scan_id:
+                continue
+            if point_message and client.lod != lod:
+                continue
+            if client.enqueue(message):
+                continue
 
-        for client in web_clients:
-            try:
-                await client.send(message)
-            except websockets.exceptions.ConnectionClosedError:
+            del web_clients[ws]
+            if client.closed:
                 network_stats["broadcast_failures"] += 1
-                disconnected.append(client)
-            except Exception as e:
-                network_stats["broadcast_failures"] += 1
-                print(f"Error enviando a cliente web: {e}")
-                disconnected.append(client)
+                _spawn(client.close())
+            else:
+                network_stats["web_slow_disconnects"] += 1
+                print(f"Cliente web desconectado por cola llena: {ws.remote_address}")
+                _spawn(client.close(SLOW_CLIENT_CLOSE_CODE, "slow consumer"))
 
-        for client in disconnected:
-            web_clients.discard(client)
+    return data
 
 
-def process_sensor_points(sensor_points):
+def process_sensor_points(batch, wheel_base=WHEEL_BASE):
     global total_points_processed, start_time
 
-    if not sensor_points:
-        return []
+    if not len(batch):
+        return batch
 
     if start_time is None:
         start_time = time.time()
 
-    print(f"Puntos parseados: {len(sensor_points)}")
-
-    processed_points = []
-    wheel_base = 15.35
-
-    for point in sensor_points:
-        inclination = point["inclination"]
-        pan_angle = point["pan_angle"]
-        distance = point["distance"]
-        intensity = point["intensity"]
+    print(f"Puntos parseados: {len(batch)}")
 
-        x, y, z = convert_to_cartesian(inclination, pan_angle, distance, wheel_base)
-
-        processed_points.append(
-            {
-                "intensity": intensity,
-                "x": round(x, 2),
-                "y": round(y, 2),
-                "z": round(z, 2),
-            }
+    if batch.has_tenths:
+        x, y, z = convert_tenths_to_cartesian_batch(
+            batch.inclination_tenths, batch.pan_angle_tenths, batch.distance, wheel_base
+        )
+    else:
+        x, y, z = convert_to_cartesian_batch(
+            batch.inclination, batch.pan_angle, batch.distance, wheel_base
         )
+    batch.x, batch.y, batch.z = quantize_coordinates(x, y, z)
 
-    total_points_processed += len(processed_points)
+    total_points_processed += len(batch)
     elapsed_time = time.time() - start_time
     points_per_second = total_points_processed / elapsed_time if elapsed_time > 0 else 0
 
-    print(f"Puntos procesados: {len(processed_points)}")
+    print(f"Puntos procesados: {len(batch)}")
     print(f"Media puntos/s: {points_per_second:.2f}")
 
-    return processed_points
+    return batch
+
+
+async def iter_subscription(subscribed, snapshot):
+    """Confirmación de la suscripción seguida del estado inicial"""
+    try:
+        yield subscribed
+        async for message in snapshot:
+            yield message
+    finally:
+        await snapshot.aclose()
+
+
+async def subscribe_web_client(client, scan_id, replace_pending=False, since=None):
+    """Suscribe el cliente a ``scan_id`` y le adjunta su estado inicial.
+
+    Con ``replace_pending`` descarta los puntos encolados del escaneo
+    anterior, que el nuevo ``initial_state`` reemplazaría de todos modos.
+    Con ``since`` (la secuencia del último batch que el cliente ya tiene)
+    sólo se envían los batches posteriores, salvo que falten más de
+    RESYNC_MAX_BATCHES o que ``since`` no exista en el escaneo: entonces va
+    el estado inicial completo. Las secuencias no se reutilizan al limpiar
+    un escaneo, así que un ``since`` anterior a la limpieza cae fuera.
+    """
+    client.scan_id = scan_id
+    if replace_pending:
+        client.discard_pending_points()
+
+    if client.lod is not None:
+        subscribed = BroadcastMessage(
+            "scan_subscribed",
+            {"scan_id": scan_id, "lod": client.lod, "resync": "snapshot"},
+        )
+        # El snapshot se toma en la tarea de envío y los vóxeles nuevos
+        # posteriores llegan en vivo, así que no hace falta deduplicar.
+        client.attach_snapshot(
+            iter_subscription(subscribed, iter_lod_initial_state(scan_id, client.lod))
+        )
+        print(f"Estado inicial LOD {client.lod:g} mm de {scan_id} en curso")
+        return
+
+    scan = scan_cache.get(scan_id) if scan_id is not None else None
+    if scan is not None:
+        first_sequence, chunk_count = scan.first_sequence, scan.chunk_count
+        point_count = scan.point_count
+    elif scan_id is None:
+        first_sequence, chunk_count, point_count = 0, 0, 0
+    else:
+        try:
+            first_sequence, chunk_count, point_count = await get_scan_extent(scan_id)
+        except Exception as e:
+            print(f"Error obteniendo puntos almacenados: {e}")
+            first_sequence, chunk_count, point_count = 0, 0, 0
+    next_sequence = first_sequence + chunk_count
+
+    missed = None if since is None else next_sequence - 1 - since
+    incremental = (
+        missed is not None
+        and since >= first_sequence
+        and 0 <= missed <= RESYNC_MAX_BATCHES
+    )
+    if since is not None:
+        network_stats["web_resyncs" if incremental else "web_resync_fallbacks"] += 1
+    subscribed = BroadcastMessage(
+        "scan_subscribed",
+        {
+            "scan_id": scan_id,
+            "lod": None,
+            "resync": "incremental" if incremental else "snapshot",
+            "sequence": next_sequence - 1 if chunk_count else None,
+        },
+    )
+
+    if incremental:
+        snapshot = iter_missed_batches(scan_id, since, next_sequence, scan)
+        print(f"Reenvío de {missed} batches de {scan_id} desde la secuencia {since}")
+    else:
+        snapshot = iter_initial_state(
+            scan_id, first_sequence, next_sequence, point_count, scan
+        )
+        print(
+            f"Estado inicial de {scan_id} en curso: "
+            f"{point_count} puntos en {chunk_count} batches"
+        )
+    client.attach_snapshot(
+        iter_subscription(subscribed, snapshot), live_from_sequence=next_sequence
+    )
 
 
 async def handle_web_client_message(ws, data):
@@ -481,91 +1037,573 @@ async def handle_web_client_message(ws, data):
     message_type = data.get("type")
 
     if message_type == "register" and data.get("client") == "web":
-        web_clients.add(ws)
-        print(f"Cliente web registrado: {ws.remote_address}")
-
-        # Enviar estado actual al cliente recién conectado
-        current_points = await get_all_points_from_redis()
-        if current_points:
-            await ws.send(json.dumps({"type": "initial_state", "data": current_points}))
-            print(f"Estado inicial enviado: {len(current_points)} puntos")
-        else:
-            await ws.send(json.dumps({"type": "initial_state", "data": []}))
+        encoding = data.get("encoding", "json")
+        if encoding not in WEB_ENCODINGS:
+            encoding = "json"
+        lod = None
+        if data.get("lod") is not None:
+            lod = find_voxel_size(VOXEL_LOD_SIZES_MM, data["lod"])
+            if lod is None:
+                print(f"LOD desconocido {data['lod']!r}; se envían puntos crudos")
+        # Sin "scan" el cliente sigue al último escaneo iniciado
+        scan_id = data.get("scan")
+        if scan_id is not None and not is_valid_scan_id(scan_id):
+            print(f"Escaneo inválido {scan_id!r}; se sigue al último")
+            scan_id = None
+        follow_latest = scan_id is None or data.get("follow_latest") is True
+        target = latest_scan_id if follow_latest else scan_id
+        # "since" vale para el escaneo nombrado en "scan"; si el cliente sigue
+        # al último y mientras estuvo desconectado empezó otro, va el estado
+        # completo del nuevo.
+        since = data.get("since")
+        if since is not None and (
+            isinstance(since, bool)
+            or not isinstance(since, int)
+            or since < 0
+            or scan_id is None
+            or target != scan_id
+        ):
+            network_stats["web_resync_fallbacks"] += 1
+            since = None
+
+        await unregister_web_client(ws)
+        client = WebClient(
+            ws,
+            encoding,
+            WEB_CLIENT_QUEUE_SIZE,
+            WEB_CLIENT_OVERFLOW_POLICY,
+            shared_stats=network_stats,
+            lod=lod,
+            follow_latest=follow_latest,
+            max_held_points=WEB_CLIENT_MAX_HELD_POINTS,
+        )
+        # Se registra antes de leer la extensión del escaneo para no perder
+        # batches; los que ya estén en el snapshot se descartan al enviar.
+        web_clients[ws] = client
+        print(f"Cliente web registrado ({encoding}): {ws.remote_address}")
+
+        await subscribe_web_client(client, target, since=since)
+        client.start()
+
+    elif message_type == "list_scans":
+        await ws.send(
+            json.dumps(
+                {
+                    "type": "scans",
+                    "data": [
+                        {
+                            "scan_id": scan_id,
+                            "started_at": started_at,
+                            "latest": scan_id == latest_scan_id,
+                        }
+                        for scan_id, started_at in scan_registry.items()
+                    ],
+                }
+            )
+        )
 
     elif message_type == "clear_scan":
-        print(f"Solicitud de limpieza de escaneo de: {ws.remote_address}")
-        success = await clear_points_from_redis()
+        scan_id = data.get("scan")
+        if not is_valid_scan_id(scan_id):
+            client = web_clients.get(ws)
+            scan_id = client.scan_id if client is not None else latest_scan_id
+        print(f"Solicitud de limpieza del escaneo {scan_id} de: {ws.remote_address}")
+        success = True
+        if scan_id is not None:
+            first_sequence = await clear_stored_scan(scan_id)
+            success = first_sequence is not None
+        if success and scan_id is not None:
+            await reset_scan(scan_id, first_sequence)
+            await publish_bus_event(
+                {
+                    "event": "scan_cleared",
+                    "scan_id": scan_id,
+                    "first_sequence": first_sequence,
+                }
+            )
 
-        if success:
-            # Notificar a todos los clientes web que se limpiaron los datos
-            await broadcast_to_web_clients([], "scan_cleared")
-            await ws.send(json.dumps({"type": "clear_response", "success": True}))
-        else:
-            await ws.send(json.dumps({"type": "clear_response", "success": False}))
+        await ws.send(json.dumps({"type": "clear_response", "success": success}))
+
+
+def _device_id(ws):
+    address = ws.remote_address
+    if isinstance(address, tuple) and len(address) >= 2:
+        return f"{address[0]}:{address[1]}"
+    return str(address)
+
+
+class SensorFrame:
+    """Mensaje de un dispositivo en tránsito por el pipeline de ingesta"""
+
+    __slots__ = (
+        "ws",
+        "device",
+        "device_sequence",
+        "received_at",
+        "unit_type",
+        "message",
+        "batch",
+        "scan_id",
+    )
+
+    def __init__(
+        self, ws, device, device_sequence, received_at, unit_type, message, scan_id
+    ):
+        self.ws = ws
+        self.device = device
+        self.scan_id = scan_id
+        self.device_sequence = device_sequence
+        self.received_at = received_at
+        self.unit_type = unit_type
+        # bytes (binario), JSON ya decodificado (dict o SensorJsonMessage)
+        # o str (texto legado)
+        self.message = message
+        self.batch = None
+
+
+async def _send_error(ws, error):
+    try:
+        await ws.send(error)
+    except Exception:
+        pass
+
+
+def reply_error(ws, error):
+    """Envía ``error`` al dispositivo sin esperar el envío.
+
+    Las etapas del pipeline son compartidas: esperar a un socket lento
+    frenaría a todos los dispositivos. Mientras una respuesta sigue en
+    vuelo, las siguientes de esa conexión se descartan.
+    """
+    task = error_replies.get(ws)
+    if task is None or task.done():
+        error_replies[ws] = _spawn(_send_error(ws, error))
+
+
+def decode_binary_sensor_frame(frame):
+    """Batch binario; con v2 registra secuencia y timestamp en el DeviceLink"""
+    try:
+        decompress_started_at = time.perf_counter()
+        payload = decompress_binary_batch(frame.message)
+        if payload is not frame.message:
+            decompress_stats.observe(time.perf_counter() - decompress_started_at)
+        header = unpack_binary_batch_header(payload)
+    except Exception as e:
+        print(f"Error parseando payload binario del sensor: {e}")
+        return PointBatch.empty()
+
+    if payload is not frame.message:
+        network_stats["compressed_units"] += 1
+        compression_ratios.append(len(payload) / len(frame.message))
+    batch = parse_binary_sensor_data(payload, header)
+    link = device_links.get(frame.device)
+    if header["sequence"] is not None and link is not None:
+        lost, reordered, duplicated = link.lost, link.reordered, link.duplicated
+        batch.sent_at = link.observe(
+            header["sequence"], header["timestamp_us"], frame.received_at
+        )
+        network_stats["device_frames_lost"] += link.lost - lost
+        network_stats["device_frames_reordered"] += link.reordered - reordered
+        network_stats["device_frames_duplicated"] += link.duplicated - duplicated
+    return batch
+
+
+def decode_sensor_frame(frame):
+    if frame.unit_type == "binary":
+        batch = decode_binary_sensor_frame(frame)
+    elif is_sensor_json(frame.message):
+        batch = parse_json_sensor_data(frame.message)
+    else:
+        batch = parse_sensor_data(frame.message)
+
+    network_stats["points_parsed"] += len(batch)
+    if not len(batch):
+        network_stats["parse_failures"] += 1
+        print("No se pudieron parsear datos válidos del sensor")
+        reply_error(frame.ws, "ERROR:PARSE_FAILED")
+        write_network_telemetry(frame.unit_type)
+        return None
+
+    batch.device = frame.device
+    batch.device_sequence = frame.device_sequence
+    batch.received_at = frame.received_at
+    batch.scan_id = frame.scan_id
+    frame.batch = batch
+    return frame
+
+
+def transform_sensor_frame(frame):
+    process_sensor_points(frame.batch)
+    network_stats["points_processed"] += len(frame.batch)
+    return frame
+
+
+async def persist_sensor_frames(frames):
+    batches = [frame.batch for frame in frames]
+    # Se toman antes de escribir: si un clear_scan reemplaza un escaneo
+    # mientras tanto, estos batches no entran en su caché nueva.
+    scans = {batch.scan_id: scan_cache.scan(batch.scan_id) for batch in batches}
+    await store_batches(batches)
+    if scan_archive is not None:
+        for batch in batches:
+            scan_archive.append(batch, scan_registry.get(batch.scan_id))
+    for scan_id, scan in scans.items():
+        missing = scan_cache.append_batches(
+            scan, [batch for batch in batches if batch.scan_id == scan_id]
+        )
+        if missing is not None:
+            schedule_scan_gap_fill(scan_id, scan)
+    if LIDAR_WORKERS > 1:
+        await publish_batches_to_bus(batches)
+    return frames
+
+
+async def publish_voxel_lods(scan_id, records):
+    """Acumula los registros en cada LOD y envía los centroides de vóxeles nuevos"""
+    lods = scan_lods.get(scan_id)
+    if lods is None:
+        return
+
+    added = lods.add(records)
+    scan_cache.enforce_limit()
+    for voxel_size, centroids in added.items():
+        if len(centroids):
+            await broadcast_to_web_clients(
+                centroids, "new_points", lod=voxel_size, scan_id=scan_id
+            )
+
+
+async def publish_sensor_frame(frame):
+    await broadcast_to_web_clients(frame.batch, "new_points", scan_id=frame.scan_id)
+    if frame.batch.sent_at is not None:
+        device_latency_stats.observe(max(0.0, time.time() - frame.batch.sent_at))
+    await publish_voxel_lods(frame.scan_id, frame.batch.to_records())
+    write_network_telemetry(frame.unit_type)
+
+
+async def publish_batches_to_bus(batches):
+    """Reenvía los batches ya persistidos a los demás workers"""
+    origin = os.getpid()
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for batch in batches:
+                if batch.sequence is not None:
+                    pipe.publish(
+                        BUS_CHANNEL,
+                        encode_bus_batch(
+                            origin, batch.scan_id, batch.sequence, encode_chunk(batch)
+                        ),
+                    )
+                    network_stats["bus_batches_out"] += 1
+            await pipe.execute()
+    except Exception as e:
+        network_stats["redis_failures"] += 1
+        print(f"Error publicando batches a otros workers: {e}")
+
+
+def schedule_scan_gap_fill(scan_id, scan):
+    task = scan_gap_fills.get(scan_id)
+    if task is None or task.done():
+        scan_gap_fills[scan_id] = _spawn(fill_scan_gap(scan_id, scan))
+
+
+async def fill_scan_gap(scan_id, scan):
+    """Completa desde el almacenamiento un hueco de la caché de un escaneo.
+
+    Con varios workers un batch ajeno puede llegar por el bus después de uno
+    propio posterior; casi siempre el hueco se llena solo antes de
+    SCAN_GAP_FILL_DELAY_S. Si no (pub/sub perdió el mensaje o el caché es
+    nuevo), los batches que faltan se leen del almacenamiento en lugar de
+    descartar la caché. Si ni así se llena, la caché queda incompleta.
+    """
+    await asyncio.sleep(SCAN_GAP_FILL_DELAY_S)
+    if scan.missing is None or scan.cleared or not scan.complete:
+        return
+
+    network_stats["scan_gap_fills"] += 1
+    try:
+        if not scan.chunk_count:
+            # Una caché recién creada no sabe dónde empieza el escaneo
+            first_sequence, _, _ = await get_scan_extent(scan_id)
+            scan.rebase(max(scan.first_sequence, first_sequence))
+        if scan.missing is not None:
+            start, stop = scan.missing
+            async for sequence, _, records in iter_stored_chunks(
+                scan_id, start, stop
+            ):
+                scan.append(sequence, records)
+    except Exception as e:
+        print(f"Error completando la caché de {scan_id}: {e}")
+
+    if scan.missing is not None:
+        print(f"Caché de {scan_id} incompleta; se leerá del almacenamiento")
+        scan.invalidate()
+    scan_cache.enforce_limit()
+
+
+async def publish_bus_event(event):
+    if LIDAR_WORKERS <= 1:
+        return
+    try:
+        await redis_client.publish(BUS_CHANNEL, encode_bus_event(os.getpid(), event))
+    except Exception as e:
+        network_stats["redis_failures"] += 1
+        print(f"Error publicando evento a otros workers: {e}")
+
+
+async def apply_remote_batch(scan_id, sequence, chunk):
+    """Batch ingerido por otro worker: caché, clientes web locales y LOD"""
+    _, records = decode_chunk(chunk)
+    network_stats["bus_batches_in"] += 1
+    scan = scan_cache.scan(scan_id)
+    scan.append(sequence, records)
+    scan_cache.enforce_limit()
+    if scan.missing is not None:
+        schedule_scan_gap_fill(scan_id, scan)
+    await broadcast_to_web_clients(
+        records, "new_points", scan_id=scan_id, sequence=sequence
+    )
+    await publish_voxel_lods(scan_id, records)
+
+
+async def apply_remote_event(event):
+    kind = event.get("event")
+    if kind == "scan_started":
+        scan_id = event["scan_id"]
+        if scan_id not in scan_registry:
+            await activate_scan(scan_id, event.get("device"), event["started_at"])
+    elif kind == "scan_cleared":
+        await reset_scan(event["scan_id"], event.get("first_sequence", 0))
+
+
+async def consume_bus():
+    """Aplica lo que publican los demás workers; reconecta si Redis se cae"""
+    origin = os.getpid()
+    while True:
+        pubsub = redis_client.pubsub()
+        try:
+            await pubsub.subscribe(BUS_CHANNEL)
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                try:
+                    source, kind, payload = decode_bus_message(message["data"])
+                    if source == origin:
+                        continue
+                    if kind == "batch":
+                        await apply_remote_batch(*payload)
+                    else:
+                        await apply_remote_event(payload)
+                except Exception as e:
+                    print(f"Error aplicando mensaje de otro worker: {e}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            network_stats["redis_failures"] += 1
+            print(f"Error en la suscripción a {BUS_CHANNEL}: {e}")
+            await asyncio.sleep(BUS_RECONNECT_DELAY_S)
+        finally:
+            await pubsub.aclose()
+
+
+def build_ingest_pipeline(capacity=None):
+    """receive → decode → transform → persist → publish.
+
+    La recepción es el bucle de cada conexión en ``server()``; el resto son
+    etapas con colas acotadas, así que el almacenamiento y el broadcast
+    se solapan con la lectura de la siguiente trama.
+    """
+    capacity = capacity or PIPELINE_STAGE_CAPACITY
+    return Pipeline(
+        [
+            Stage("decode", decode_sensor_frame, capacity),
+            Stage("transform", transform_sensor_frame, capacity),
+            Stage(
+                "persist",
+                persist_sensor_frames,
+                capacity,
+                max_batch=PIPELINE_PERSIST_MAX_BATCH,
+            ),
+            Stage("publish", publish_sensor_frame, capacity),
+        ]
+    )
+
+
+def start_ingest_pipeline():
+    global ingest_pipeline
+    ingest_pipeline = build_ingest_pipeline()
+    ingest_pipeline.start()
+    return ingest_pipeline
+
+
+def pipeline_stats_snapshot():
+    snapshot = [
+        receive_stats.snapshot(),
+        json_decode_stats.snapshot(),
+        decompress_stats.snapshot(),
+    ]
+    if ingest_pipeline is not None:
+        snapshot.extend(ingest_pipeline.snapshot())
+    snapshot.append(device_latency_stats.snapshot())
+    return snapshot
+
+
+async def report_pipeline_stats(interval_s=None):
+    """Publica periódicamente profundidad de cola e histograma de cada etapa"""
+    interval_s = interval_s or PIPELINE_STATS_INTERVAL_S
+    last_processed = None
+    while True:
+        await asyncio.sleep(interval_s)
+        snapshot = pipeline_stats_snapshot()
+        network_stats["pipeline"] = snapshot
+
+        processed = [stage["processed"] for stage in snapshot]
+        if processed == last_processed:
+            continue
+        last_processed = processed
+
+        for stage in snapshot:
+            print(
+                "PIPE|event=stage"
+                f"|stage={stage['stage']}"
+                f"|depth={stage['depth']}"
+                f"|capacity={stage['capacity']}"
+                f"|processed={stage['processed']}"
+                f"|failures={stage['failures']}"
+                f"|mean_ms={stage['mean_ms']:.3f}"
+                f"|p50_ms={stage['p50_ms']:.3f}"
+                f"|p99_ms={stage['p99_ms']:.3f}"
+                f"|max_ms={stage['max_ms']:.3f}"
+                "|histogram="
+                + ",".join(f"{le}:{count}" for le, count in stage["histogram"].items())
+            )
+
+
+def classify_message(message):
+    """Formato de una trama mirando sólo su tipo y primer carácter/bytes.
+
+    Binario con magia ``PS`` → ``binary``; texto que empieza con ``{`` →
+    ``json``; con un dígito, signo o punto → ``text`` (protocolo legado).
+    """
+    if isinstance(message, bytes):
+        if message[:2] == BINARY_BATCH_MAGIC:
+            return "binary"
+        return "unknown"
+    if isinstance(message, str):
+        first = message[:1]
+        if first.isspace():
+            first = message.lstrip()[:1]
+        if first == "{":
+            return "json"
+        if first in TEXT_MESSAGE_FIRST_CHARS and first:
+            return "text"
+    return "unknown"
 
 
 async def server(ws):
     print("Cliente conectado:", ws.remote_address)
+    device = _device_id(ws)
+    device_sequence = 0
+    # Escaneo de esta conexión: el de start_scan o uno nuevo al primer batch
+    scan_id = None
+    device_links[device] = DeviceLink()
+    connection = None
+    if ingest_recorder is not None:
+        connection = ingest_recorder.open_connection(device)
     try:
         async for message in ws:
             try:
-                if isinstance(message, bytes):
-                    unit_type = "binary"
-                    record_inbound_unit(unit_type, len(message))
-                    print(
-                        f"Cliente identificado como Pico (binario): {ws.remote_address}"
-                    )
-                    sensor_points = parse_binary_sensor_data(message)
-                elif isinstance(message, str):
+                if connection is not None:
+                    ingest_recorder.record(connection, message)
+                received_at = time.time()
+                started_at = time.perf_counter()
+                message_format = classify_message(message)
+                if message_format == "json":
                     message_bytes = len(message.encode("utf-8"))
-                    data = None
+                    decode_started_at = time.perf_counter()
                     try:
-                        data = json.loads(message)
-                    except json.JSONDecodeError:
+                        data = json_decoder.decode(message)
+                    except ValueError:
                         data = None
+                    json_decode_stats.observe(time.perf_counter() - decode_started_at)
 
-                    if data and isinstance(data, dict) and isinstance(data.get("points"), list):
+                    if is_sensor_json(data):
                         unit_type = "text"
                         record_inbound_unit(unit_type, message_bytes)
                         print(
                             f"Cliente identificado como Pico (JSON): {ws.remote_address}"
                         )
-                        sensor_points = parse_json_sensor_data(data)
+                        sensor_message = data
                     elif data and isinstance(data, dict):
                         record_inbound_unit("web", message_bytes)
+                        network_stats["message_formats"]["json"] += 1
+                        if data.get("type") == "start_scan":
+                            try:
+                                scan_id = await start_scan(data.get("scan_id"), device)
+                            except ValueError as e:
+                                print(f"start_scan rechazado de {device}: {e}")
+                                await ws.send("ERROR:INVALID_SCAN_ID")
+                                continue
+                            await ws.send(
+                                json.dumps(
+                                    {
+                                        "type": "start_scan_response",
+                                        "success": True,
+                                        "scan_id": scan_id,
+                                    }
+                                )
+                            )
+                            continue
                         await handle_web_client_message(ws, data)
                         continue
-                    elif ";" not in message:
-                        print(f"Mensaje desconocido de {ws.remote_address}: {message}")
-                        await ws.send("ERROR:UNKNOWN_FORMAT")
-                        continue
                     else:
+                        message_format = "unknown"
+                elif message_format == "text":
+                    if ";" in message:
                         unit_type = "text"
-                        record_inbound_unit(unit_type, message_bytes)
+                        record_inbound_unit(unit_type, len(message.encode("utf-8")))
                         print(
                             f"Cliente identificado como Pico (texto): {ws.remote_address}"
                         )
-                        sensor_points = parse_sensor_data(message)
-                else:
+                        sensor_message = message
+                    else:
+                        message_format = "unknown"
+                elif message_format == "binary":
+                    unit_type = "binary"
+                    record_inbound_unit(unit_type, len(message))
                     print(
-                        f"Tipo de mensaje desconocido de {ws.remote_address}: {type(message)}"
+                        f"Cliente identificado como Pico (binario): {ws.remote_address}"
                     )
+                    sensor_message = message
+
+                network_stats["message_formats"][message_format] += 1
+                if message_format == "unknown":
+                    if isinstance(message, str):
+                        print(f"Mensaje desconocido de {ws.remote_address}: {message}")
+                    else:
+                        print(
+                            f"Trama binaria desconocida de {ws.remote_address}: "
+                            f"{len(message)} bytes"
+                        )
                     await ws.send("ERROR:UNKNOWN_FORMAT")
                     continue
 
-                processed_points = process_sensor_points(sensor_points)
-                network_stats["points_parsed"] += len(sensor_points)
-                network_stats["points_processed"] += len(processed_points)
-
-                if processed_points:
-                    await store_points_in_redis(processed_points)
-                    await broadcast_to_web_clients(processed_points, "new_points")
-                else:
-                    network_stats["parse_failures"] += 1
-                    print("No se pudieron parsear datos válidos del sensor")
-                    await ws.send("ERROR:PARSE_FAILED")
-
-                write_network_telemetry(unit_type)
+                if scan_id is None:
+                    scan_id = await start_scan(device=device)
+
+                await ingest_pipeline.submit(
+                    SensorFrame(
+                        ws,
+                        device,
+                        device_sequence,
+                        received_at,
+                        unit_type,
+                        sensor_message,
+                        scan_id,
+                    )
+                )
+                device_sequence += 1
+                receive_stats.observe(time.perf_counter() - started_at)
 
             except Exception as e:
                 network_stats["parse_failures"] += 1
@@ -580,23 +1618,72 @@ async def server(ws):
     except Exception as e:
         print(f"Error en el servidor: {e}")
     finally:
-        web_clients.discard(ws)
+        if connection is not None:
+            ingest_recorder.close_connection(connection)
+        reply = error_replies.pop(ws, None)
+        if reply is not None:
+            reply.cancel()
+        link = device_links.pop(device, None)
+        if link is not None and link.received:
+            print(f"Enlace de {device}: {link.stats()}")
+        await unregister_web_client(ws)
         print(f"Cliente desconectado: {ws.remote_address}")
 
 
 async def main():
-    # Inicializar Redis
-    await init_redis()
+    await init_storage()
+    await load_scans()
+    start_ingest_pipeline()
+    telemetry_sink.start()
+    if scan_archive is not None:
+        scan_archive.start()
+    if ingest_recorder is not None:
+        ingest_recorder.start()
+    _spawn(report_pipeline_stats())
+    if LIDAR_WORKERS > 1:
+        _spawn(consume_bus())
 
-    async with websockets.serve(server, "0.0.0.0", 3000):
-        print("Servidor iniciado en ws://0.0.0.0:3000")
-        print("Conexión a Redis establecida")
-        print("Esperando conexiones...")
-        print("- Clientes web deben enviar: {'type': 'register', 'client': 'web'}")
-        print("- Clientes web pueden limpiar con: {'type': 'clear_scan'}")
-        print("- Dispositivos Pico aceptan texto legado y batches binarios compactos")
-        await asyncio.Future()
+    try:
+        async with websockets.serve(
+            server, "0.0.0.0", 3000, reuse_port=LIDAR_WORKERS > 1
+        ):
+            print(f"Servidor iniciado en ws://0.0.0.0:3000 (worker {worker_index})")
+            print("Esperando conexiones...")
+            print("- Clientes web deben enviar: {'type': 'register', 'client': 'web'}")
+            print("  (agregar 'encoding': 'binary' para recibir tramas binarias)")
+            print(f"  (agregar 'lod': <mm> para centroides de vóxeles: {VOXEL_LOD_SIZES_MM})")
+            print("  (agregar 'scan': <id> para un escaneo; sin él se sigue al último)")
+            print("- Clientes web pueden limpiar con: {'type': 'clear_scan'}")
+            print("- Listar escaneos con: {'type': 'list_scans'}")
+            print("- Dispositivos pueden iniciar un escaneo con: {'type': 'start_scan'}")
+            print("- Dispositivos Pico aceptan texto legado y batches binarios v1/v2")
+            print(f"- Decodificador JSON de sensores: {json_decoder.backend}")
+            await asyncio.Future()
+    finally:
+        await telemetry_sink.stop()
+        if scan_archive is not None:
+            await scan_archive.stop()
+        if ingest_recorder is not None:
+            await ingest_recorder.stop()
+        await scan_store.close()
+
+
+def run_worker(index):
+    """Punto de entrada de cada proceso worker"""
+    global worker_index
+    worker_index = index
+    # Un CSV de telemetría por worker para no intercalar escrituras
+    path = telemetry_sink.path
+    telemetry_sink.path = path.with_name(f"{path.stem}-w{index}{path.suffix}")
+    if scan_archive is not None:
+        scan_archive.worker = index
+    if ingest_recorder is not None:
+        ingest_recorder.worker = index
+    asyncio.run(main())
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if LIDAR_WORKERS > 1:
+        run_workers(LIDAR_WORKERS, run_worker)
+    else:
+        asyncio.run(main())
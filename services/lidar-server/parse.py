@@ -1,73 +1,298 @@
+import json
+import re
+from operator import attrgetter, itemgetter
 
+import numpy as np
 
+from point_batch import PointBatch
 
-# Función alternativa más simple si el formato es más predecible
-def parse_sensor_data_v2(message):
-    """
-    Versión alternativa asumiendo que la estructura es:
-    inclinacion|datos;datos;...;nueva_inclinacion|datos;datos;...
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Protocolo de texto legado del sensor:
+#
+#     inclinacion;d;i;a;d;i;a|d;i;a;...;nueva_inclinacion|d;i;a;...
+#
+# El primer token del primer grupo es la inclinación inicial. Los demás grupos
+# traen ternas (distancia, intensidad, ángulo de paneo) y, si les sobra un
+# token, éste es la inclinación de los grupos siguientes. Los tokens que
+# sobran al final de un grupo sin completar una terna se ignoran.
+TEXT_GROUP_SEPARATOR = "|"
+TEXT_TOKEN_SEPARATOR = ";"
+# Token sólo con espacios: ``np.fromstring`` lo lee como -1.0 sin avisar
+TEXT_BLANK_TOKEN = re.compile(r"(?:^|;)\s+(?:;|$)")
+
+
+def parse_sensor_data(message):
+    """Parsea un mensaje de texto del sensor en un ``PointBatch``.
+
+    Convierte todos los números de una sola vez con NumPy y arma las columnas
+    con índices, sin ``float()`` por token. Si algún token no es un número
+    (tokens vacíos o en blanco, separadores sobrantes, basura) recurre a
+    ``parse_sensor_data_tokens``, que descarta sólo las ternas inválidas;
+    el resultado es el mismo en ambos caminos.
     """
+    text = message.strip()
+    if not text:
+        return PointBatch.empty()
+
+    tokens = text.replace(TEXT_GROUP_SEPARATOR, TEXT_TOKEN_SEPARATOR)
+    if has_empty_token(text, tokens):
+        return parse_sensor_data_tokens(message)
+
     try:
-        all_points = []
+        values = np.fromstring(tokens, dtype=np.float64, sep=TEXT_TOKEN_SEPARATOR)
+    except ValueError:
+        return parse_sensor_data_tokens(message)
+
+    token_counts = [
+        group.count(TEXT_TOKEN_SEPARATOR) + 1
+        for group in text.split(TEXT_GROUP_SEPARATOR)
+    ]
+    # NumPy < 2.3 sólo avisa y corta en el primer token inválido
+    if len(values) != sum(token_counts):
+        return parse_sensor_data_tokens(message)
+
+    # Primer token de cada grupo con ternas, cantidad de ternas e inclinación
+    starts = []
+    triples = []
+    inclinations = []
+    inclination = values[0]
+    offset = 0
+    for group_index, count in enumerate(token_counts):
+        if group_index == 0:
+            starts.append(1)
+            triples.append((count - 1) // 3)
+        else:
+            starts.append(offset)
+            triples.append(count // 3)
+        inclinations.append(inclination)
+        offset += count
+        if group_index > 0 and count % 3 == 1:
+            inclination = values[offset - 1]
+
+    triples = np.array(triples)
+    point_count = int(triples.sum())
+    # Índice de la distancia de cada punto: inicio del grupo + 3 * terna
+    first_point = np.cumsum(triples) - triples
+    indices = np.repeat(np.array(starts) - 3 * first_point, triples)
+    indices += 3 * np.arange(point_count)
+
+    return PointBatch(
+        np.repeat(inclinations, triples),
+        values[indices + 2],
+        values[indices],
+        values[indices + 1],
+    )
+
+
+def has_empty_token(text, tokens):
+    """True si ``tokens`` (``text`` con un solo separador) tiene tokens vacíos"""
+    separator = TEXT_TOKEN_SEPARATOR
+    if separator * 2 in tokens or tokens[0] == separator or tokens[-1] == separator:
+        return True
+    # La expresión regular es lenta: sólo hace falta si hay espacios
+    if len(text.split(None, 1)) == 1:
+        return False
+    return TEXT_BLANK_TOKEN.search(tokens) is not None
+
+
+def parse_sensor_data_tokens(message):
+    """Parser tolerante, token por token: descarta las ternas inválidas"""
+    try:
+        inclination_groups = message.strip().split(TEXT_GROUP_SEPARATOR)
+
+        inclinations = []
+        distances = []
+        intensities = []
+        pan_angles = []
         current_inclination = None
-        
-        # Dividir por "|"
-        groups = message.strip().split('|')
-        
-        for group in groups:
+
+        for group_index, group in enumerate(inclination_groups):
             if not group:
                 continue
-                
-            parts = group.split(';')
-            
-            # El primer elemento del primer grupo es siempre inclinación
-            if current_inclination is None:
-                current_inclination = float(parts[0])
-                parts = parts[1:]
-            
-            # Procesar datos en grupos de 3
-            i = 0
-            while i + 2 < len(parts):
+
+            parts = group.split(TEXT_TOKEN_SEPARATOR)
+            if not parts:
+                continue
+
+            if group_index == 0:
                 try:
-                    distance = float(parts[i])
-                    intensity = float(parts[i + 1])
-                    angle = float(parts[i + 2])
-                    
-                    all_points.append({
-                        'inclination': current_inclination,
-                        'distance': distance,
-                        'intensity': intensity,
-                        'pan_angle': angle
-                    })
-                    
-                    i += 3
-                except ValueError:
-                    i += 1
+                    current_inclination = float(parts[0])
+                    data_parts = parts[1:]
+                except (ValueError, IndexError):
                     continue
-            
-            # Si queda un elemento al final, es la nueva inclinación
-            if i < len(parts):
+            else:
+                data_parts = parts
+
+                if len(data_parts) % 3 == 1:
+                    try:
+                        new_inclination = float(data_parts[-1])
+                        data_parts = data_parts[:-1]
+                    except ValueError:
+                        pass
+
+            for i in range(0, len(data_parts), 3):
+                if i + 2 < len(data_parts):
+                    try:
+                        distance = float(data_parts[i])
+                        intensity = float(data_parts[i + 1])
+                        angle = float(data_parts[i + 2])
+                    except ValueError:
+                        continue
+
+                    inclinations.append(current_inclination)
+                    distances.append(distance)
+                    intensities.append(intensity)
+                    pan_angles.append(angle)
+
+            if group_index > 0 and len(parts) % 3 == 1:
                 try:
-                    current_inclination = float(parts[i])
+                    current_inclination = float(parts[-1])
                 except ValueError:
                     pass
-        
-        return all_points
-    
+
+        return PointBatch(inclinations, pan_angles, distances, intensities)
+
     except Exception as e:
         print(f"Error parseando datos del sensor: {e}")
-        return []
+        return PointBatch.empty()
+
+
+# Decodificadores JSON en orden de preferencia; se usa el primero instalado.
+JSON_DECODERS = ("msgspec", "orjson", "json")
+# Forma de los mensajes JSON del sensor (experiments/ld19/network_exp.py):
+#     {"inclination": 12.5, "points": [{"a": 90.0, "d": 1500, "i": 200}, ...]}
+JSON_POINT_KEYS = ("a", "d", "i")
+
+if msgspec is not None:
+
+    class SensorJsonPoint(msgspec.Struct, forbid_unknown_fields=True, gc=False):
+        a: float
+        d: float
+        i: float
+
+    class SensorJsonMessage(msgspec.Struct, gc=False):
+        points: list[SensorJsonPoint]
+        # Sin ``None``: un ``null`` no valida y el mensaje sigue el camino
+        # genérico, que lo rechaza como siempre.
+        inclination: float | msgspec.UnsetType = msgspec.UNSET
+        servo_deg: float | msgspec.UnsetType = msgspec.UNSET
+
+else:
+    SensorJsonMessage = None
+
+
+def available_json_decoders():
+    installed = {"msgspec": msgspec, "orjson": orjson, "json": json}
+    return [name for name in JSON_DECODERS if installed[name] is not None]
+
+
+class JsonMessageDecoder:
+    """Decodifica los mensajes JSON que llegan por WebSocket.
+
+    Con msgspec, los mensajes del sensor con la forma ``{inclination,
+    points: [{a, d, i}]}`` se validan contra un esquema y salen como
+    ``SensorJsonMessage``; cualquier otro JSON (mensajes de clientes web,
+    puntos con otras claves) se decodifica genérico como dict. Con orjson o
+    la stdlib todo sale como dict. JSON inválido lanza ``ValueError``.
+    """
 
+    def __init__(self, backend=None):
+        available = available_json_decoders()
+        if backend is None:
+            backend = available[0]
+        elif backend not in available:
+            raise ValueError(
+                f"decodificador JSON no disponible: {backend} "
+                f"(disponibles: {', '.join(available)})"
+            )
+        self.backend = backend
+        if backend == "msgspec":
+            self._sensor_decoder = msgspec.json.Decoder(SensorJsonMessage)
+            self._decode = msgspec.json.Decoder().decode
+        elif backend == "orjson":
+            self._decode = orjson.loads
+        else:
+            self._decode = json.loads
 
-# Pruebas
-test_data = "90.0|1;1;1;2;2;2;91.0|3;3;3;4;4;4"
+    def decode(self, message):
+        if self.backend == "msgspec":
+            try:
+                return self._sensor_decoder.decode(message)
+            except msgspec.ValidationError:
+                pass
+        return self._decode(message)
 
-print("Versión 1:")
-result1 = parse_sensor_data(test_data)
-for point in result1:
-    print(point)
 
-print("\nVersionión 2:")
-result2 = parse_sensor_data_v2(test_data)
-for point in result2:
-    print(point)
\ No newline at end of file
+def is_sensor_json(data):
+    """True para mensajes JSON del sensor (con lista ``points``)"""
+    if SensorJsonMessage is not None and isinstance(data, SensorJsonMessage):
+        return True
+    return isinstance(data, dict) and isinstance(data.get("points"), list)
+
+
+def parse_json_sensor_data(data):
+    """Mensaje JSON del sensor (``SensorJsonMessage`` o dict) a ``PointBatch``.
+
+    Los puntos ``{a, d, i}`` se convierten directo a columnas; los que usan
+    otras claves (``pan_angle``, ``distance``, ``inclination`` por punto)
+    pasan por ``parse_json_sensor_data_fields``.
+    """
+    if SensorJsonMessage is not None and isinstance(data, SensorJsonMessage):
+        points = data.points
+        inclination = data.inclination
+        if inclination is msgspec.UNSET:
+            inclination = data.servo_deg if data.servo_deg is not msgspec.UNSET else 0.0
+        getters = [attrgetter(key) for key in JSON_POINT_KEYS]
+    else:
+        points = data.get("points", [])
+        try:
+            # Sólo las claves del esquema: otra clave cambia el significado
+            if sum(map(len, points)) != len(JSON_POINT_KEYS) * len(points):
+                return parse_json_sensor_data_fields(data)
+            inclination = float(data.get("inclination", data.get("servo_deg", 0.0)))
+        except (TypeError, ValueError):
+            return parse_json_sensor_data_fields(data)
+        getters = [itemgetter(key) for key in JSON_POINT_KEYS]
+
+    try:
+        pan_angle, distance, intensity = [
+            np.fromiter(map(getter, points), dtype=np.float64, count=len(points))
+            for getter in getters
+        ]
+    except (KeyError, TypeError, ValueError):
+        return parse_json_sensor_data_fields(data)
+    # np.fromiter convierte un ``null`` en NaN sin quejarse; el parser campo a
+    # campo rechaza el mensaje (y conserva los NaN que sí vinieron como NaN).
+    if any(np.isnan(column).any() for column in (pan_angle, distance, intensity)):
+        return parse_json_sensor_data_fields(data)
+
+    return PointBatch(
+        np.full(len(points), float(inclination)), pan_angle, distance, intensity
+    )
+
+
+def parse_json_sensor_data_fields(data):
+    """Parser tolerante, punto por punto, con nombres de campo alternativos"""
+    try:
+        points = data.get("points", [])
+        inclination = float(data.get("inclination", data.get("servo_deg", 0.0)))
+
+        return PointBatch(
+            [float(point.get("inclination", inclination)) for point in points],
+            [float(point.get("pan_angle", point.get("a"))) for point in points],
+            [float(point.get("distance", point.get("d"))) for point in points],
+            [float(point.get("intensity", point.get("i"))) for point in points],
+        )
+
+    except Exception as e:
+        print(f"Error parseando payload JSON del sensor: {e}")
+        return PointBatch.empty()
@@ -0,0 +1,91 @@
+import zlib
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Id de códec que viaja en los 4 bits altos del byte de flags; 0 = sin comprimir
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_LZ4 = 2
+CODEC_ZSTD = 3
+CODEC_IDS = {"zlib": CODEC_ZLIB, "lz4": CODEC_LZ4, "zstd": CODEC_ZSTD}
+CODEC_NAMES = {codec_id: name for name, codec_id in CODEC_IDS.items()}
+DECOMPRESS_BUFFER_INITIAL_SIZE = 64 * 1024
+
+
+def available_codecs():
+    installed = {"zlib": zlib, "lz4": lz4, "zstd": zstandard}
+    return [name for name in CODEC_IDS if installed[name] is not None]
+
+
+def compress(codec_id, data, level=None):
+    """Comprime ``data``; lo usan el generador de carga y los benchmarks"""
+    if codec_id == CODEC_ZLIB:
+        return zlib.compress(data, 6 if level is None else level)
+    if codec_id == CODEC_LZ4 and lz4 is not None:
+        return lz4.frame.compress(data, compression_level=level or 0)
+    if codec_id == CODEC_ZSTD and zstandard is not None:
+        return zstandard.ZstdCompressor(level=level or 3).compress(data)
+    raise ValueError(f"unsupported codec: {codec_id}")
+
+
+class PayloadDecompressor:
+    """Descomprime payloads en un búfer propio que se reutiliza entre tramas.
+
+    ``decompress`` devuelve una vista sobre el búfer que sólo vale hasta la
+    llamada siguiente: quien la use tiene que copiar lo que conserve.
+    ``max_size`` acota la salida para no inflar payloads maliciosos.
+
+    Sólo zstd escribe directo en el búfer (``readinto``). Los módulos
+    ``zlib`` y ``lz4.frame`` no tienen descompresión sobre un búfer ajeno:
+    devuelven ``bytes`` nuevos que se copian al búfer, así que con ellos
+    cada trama cuesta una asignación y una copia del tamaño descomprimido.
+    """
+
+    def __init__(self, initial_size=DECOMPRESS_BUFFER_INITIAL_SIZE):
+        self.buffer = bytearray(initial_size)
+        self._zstd = zstandard.ZstdDecompressor() if zstandard is not None else None
+
+    def _reserve(self, size):
+        if size > len(self.buffer):
+            self.buffer = bytearray(max(size, len(self.buffer) * 2))
+
+    def decompress(self, codec_id, data, max_size, offset=0):
+        """Escribe la salida en ``buffer[offset:]``; devuelve ``buffer[:fin]``"""
+        self._reserve(offset + max_size)
+        view = memoryview(self.buffer)
+
+        if codec_id == CODEC_ZSTD and self._zstd is not None:
+            size = 0
+            with self._zstd.stream_reader(data) as reader:
+                while size < max_size:
+                    read = reader.readinto(view[offset + size : offset + max_size])
+                    if not read:
+                        break
+                    size += read
+                if size == max_size and reader.read(1):
+                    raise ValueError("decompressed payload too large")
+        else:
+            if codec_id == CODEC_ZLIB:
+                decompressor = zlib.decompressobj()
+                output = decompressor.decompress(data, max_size)
+                complete = decompressor.eof and not decompressor.unconsumed_tail
+            elif codec_id == CODEC_LZ4 and lz4 is not None:
+                decompressor = lz4.frame.LZ4FrameDecompressor()
+                output = decompressor.decompress(data, max_length=max_size)
+                complete = decompressor.eof
+            else:
+                raise ValueError(f"unsupported codec: {codec_id}")
+            if not complete:
+                raise ValueError("truncated or too large compressed payload")
+            size = len(output)
+            view[offset : offset + size] = output
+
+        return view[: offset + size]
@@ -0,0 +1,164 @@
+import asyncio
+import time
+
+# Límites superiores (ms) de los buckets del histograma de tiempo de servicio.
+SERVICE_TIME_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000)
+
+
+class StageStats:
+    """Contadores y histograma de tiempo de servicio de una etapa"""
+
+    __slots__ = ("name", "processed", "failures", "buckets", "total_s", "max_s")
+
+    def __init__(self, name):
+        self.name = name
+        self.processed = 0
+        self.failures = 0
+        # Un bucket extra para lo que supera el último límite
+        self.buckets = [0] * (len(SERVICE_TIME_BUCKETS_MS) + 1)
+        self.total_s = 0.0
+        self.max_s = 0.0
+
+    def observe(self, seconds, items=1):
+        self.processed += items
+        self.total_s += seconds
+        self.max_s = max(self.max_s, seconds)
+
+        elapsed_ms = seconds * 1000
+        for index, limit in enumerate(SERVICE_TIME_BUCKETS_MS):
+            if elapsed_ms <= limit:
+                self.buckets[index] += 1
+                return
+        self.buckets[-1] += 1
+
+    def percentile_ms(self, fraction):
+        """Cota superior del bucket que contiene el percentil ``fraction``"""
+        total = sum(self.buckets)
+        if total == 0:
+            return 0.0
+
+        threshold = fraction * total
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= threshold:
+                if index < len(SERVICE_TIME_BUCKETS_MS):
+                    return float(SERVICE_TIME_BUCKETS_MS[index])
+                return self.max_s * 1000
+        return self.max_s * 1000
+
+    def snapshot(self, depth=0, capacity=0):
+        calls = sum(self.buckets)
+        return {
+            "stage": self.name,
+            "depth": depth,
+            "capacity": capacity,
+            "processed": self.processed,
+            "failures": self.failures,
+            "mean_ms": self.total_s * 1000 / calls if calls else 0.0,
+            "p50_ms": self.percentile_ms(0.50),
+            "p99_ms": self.percentile_ms(0.99),
+            "max_ms": self.max_s * 1000,
+            "histogram": dict(
+                zip([*map(str, SERVICE_TIME_BUCKETS_MS), "inf"], self.buckets)
+            ),
+        }
+
+
+class Stage:
+    """Etapa del pipeline: una cola acotada y una tarea consumidora.
+
+    ``handler`` recibe un elemento (o una lista de hasta ``max_batch``
+    elementos si ``max_batch > 1``) y puede ser síncrono o async. Lo que
+    devuelve pasa a la siguiente etapa; ``None`` descarta el elemento. Con la
+    cola llena, ``put`` espera: esa es la contrapresión hacia atrás.
+    """
+
+    def __init__(self, name, handler, capacity=256, max_batch=1):
+        self.name = name
+        self.handler = handler
+        self.capacity = capacity
+        self.max_batch = max_batch
+        self.queue = asyncio.Queue(maxsize=capacity)
+        self.stats = StageStats(name)
+        self.next_stage = None
+        self.task = None
+
+    async def put(self, item):
+        await self.queue.put(item)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def _take(self):
+        items = [await self.queue.get()]
+        while len(items) < self.max_batch and not self.queue.empty():
+            items.append(self.queue.get_nowait())
+        return items
+
+    async def _run(self):
+        while True:
+            items = await self._take()
+            started_at = time.perf_counter()
+            try:
+                result = self.handler(items if self.max_batch > 1 else items[0])
+                if asyncio.iscoroutine(result):
+                    result = await result
+            except Exception as e:
+                self.stats.failures += 1
+                result = None
+                print(f"Error en etapa {self.name}: {e}")
+            finally:
+                self.stats.observe(time.perf_counter() - started_at, len(items))
+
+            try:
+                if result is not None and self.next_stage is not None:
+                    if self.max_batch > 1:
+                        for item in result:
+                            await self.next_stage.put(item)
+                    else:
+                        await self.next_stage.put(result)
+            finally:
+                for _ in items:
+                    self.queue.task_done()
+
+    def snapshot(self):
+        return self.stats.snapshot(self.queue.qsize(), self.capacity)
+
+
+class Pipeline:
+    """Cadena de etapas conectadas por colas asyncio acotadas"""
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.next_stage = next_stage
+
+    async def submit(self, item):
+        await self.stages[0].put(item)
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    async def join(self):
+        """Espera a que todo lo encolado haya atravesado el pipeline"""
+        for stage in self.stages:
+            await stage.queue.join()
+
+    async def stop(self):
+        for stage in self.stages:
+            await stage.stop()
+
+    def snapshot(self):
+        return [stage.snapshot() for stage in self.stages]
@@ -0,0 +1,222 @@
+import struct
+
+import numpy as np
+
+MEASUREMENT_COLUMNS = ("inclination", "pan_angle", "distance", "intensity")
+CARTESIAN_COLUMNS = ("x", "y", "z")
+TENTHS_COLUMNS = ("inclination_tenths", "pan_angle_tenths")
+METADATA_FIELDS = (
+    "device",
+    "device_sequence",
+    "received_at",
+    "sent_at",
+    "sequence",
+    "scan_id",
+)
+
+# Punto procesado empaquetado: float32 xyz + intensidad uint8 (13 bytes).
+POINT_RECORD_DTYPE = np.dtype(
+    [("x", "<f4"), ("y", "<f4"), ("z", "<f4"), ("intensity", "u1")]
+)
+
+# Chunk almacenado: metadatos del batch una sola vez + registros empaquetados.
+CHUNK_MAGIC = b"PC"
+CHUNK_VERSION = 1
+CHUNK_DEVICE_SIZE = 32
+CHUNK_HEADER = struct.Struct(f"<2sBBIIQ{CHUNK_DEVICE_SIZE}s")
+
+# Trama binaria para clientes web: cabecera + registros POINT_RECORD_DTYPE.
+# La cabecera lleva la secuencia del último batch incluido (-1 si no aplica);
+# las tramas del estado inicial agregan el progreso (puntos enviados, total).
+WEB_FRAME_MAGIC = b"PW"
+WEB_FRAME_VERSION = 3
+WEB_FRAME_HEADER = struct.Struct("<2sBBIi")
+WEB_FRAME_PROGRESS = struct.Struct("<II")
+WEB_FRAME_TYPES = {"initial_state": 1, "new_points": 2, "initial_state_chunk": 3}
+WEB_FRAME_PROGRESS_TYPES = {"initial_state", "initial_state_chunk"}
+
+
+class PointBatch:
+    """Lote de puntos en formato struct-of-arrays.
+
+    Las columnas de medición se llenan al parsear el mensaje del sensor;
+    ``x``, ``y`` y ``z`` quedan en ``None`` hasta ``process_sensor_points``.
+    Los protocolos que envían ángulos en décimas de grado enteras también
+    rellenan ``inclination_tenths`` y ``pan_angle_tenths``. Los metadatos
+    (dispositivo, secuencias, hora de recepción, escaneo) los asigna el
+    servidor; ``sent_at`` es la hora de envío estimada de las tramas v2.
+    """
+
+    __slots__ = (
+        MEASUREMENT_COLUMNS + CARTESIAN_COLUMNS + TENTHS_COLUMNS + METADATA_FIELDS
+    )
+
+    def __init__(
+        self,
+        inclination,
+        pan_angle,
+        distance,
+        intensity,
+        x=None,
+        y=None,
+        z=None,
+        inclination_tenths=None,
+        pan_angle_tenths=None,
+    ):
+        self.inclination = np.asarray(inclination, dtype=np.float64)
+        self.pan_angle = np.asarray(pan_angle, dtype=np.float64)
+        self.distance = np.asarray(distance, dtype=np.float64)
+        self.intensity = np.asarray(intensity, dtype=np.float64)
+        self.x = x
+        self.y = y
+        self.z = z
+        self.inclination_tenths = inclination_tenths
+        self.pan_angle_tenths = pan_angle_tenths
+        self.device = None
+        self.device_sequence = 0
+        self.received_at = None
+        self.sent_at = None
+        self.sequence = None
+        self.scan_id = None
+
+    def __len__(self):
+        return len(self.distance)
+
+    def __repr__(self):
+        return f"PointBatch({len(self)} puntos, cartesiano={self.has_cartesian})"
+
+    @classmethod
+    def empty(cls):
+        return cls((), (), (), ())
+
+    @classmethod
+    def concatenate(cls, batches):
+        batches = [batch for batch in batches if len(batch)]
+        if not batches:
+            return cls.empty()
+
+        columns = {
+            name: np.concatenate([getattr(batch, name) for batch in batches])
+            for name in MEASUREMENT_COLUMNS
+        }
+        for optional_columns, present in (
+            (CARTESIAN_COLUMNS, all(batch.has_cartesian for batch in batches)),
+            (TENTHS_COLUMNS, all(batch.has_tenths for batch in batches)),
+        ):
+            if present:
+                for name in optional_columns:
+                    columns[name] = np.concatenate(
+                        [getattr(batch, name) for batch in batches]
+                    )
+        merged = cls(**columns)
+
+        sequences = [batch.sequence for batch in batches]
+        if None not in sequences:
+            merged.sequence = max(sequences)
+        return merged
+
+    @property
+    def has_cartesian(self):
+        return self.x is not None
+
+    @property
+    def has_tenths(self):
+        return self.pan_angle_tenths is not None
+
+    def to_records(self):
+        """Columnas procesadas empaquetadas como ``POINT_RECORD_DTYPE``"""
+        records = np.empty(len(self), dtype=POINT_RECORD_DTYPE)
+        records["x"] = self.x
+        records["y"] = self.y
+        records["z"] = self.z
+        records["intensity"] = np.clip(self.intensity, 0, 255)
+        return records
+
+    def to_client_points(self):
+        """Puntos como dicts ``{intensity, x, y, z}`` para el protocolo JSON"""
+        return [
+            {"intensity": intensity, "x": x, "y": y, "z": z}
+            for intensity, x, y, z in zip(
+                self.intensity.tolist(),
+                self.x.tolist(),
+                self.y.tolist(),
+                self.z.tolist(),
+            )
+        ]
+
+
+def records_to_client_points(records, decimals=2):
+    """Registros ``POINT_RECORD_DTYPE`` como dicts ``{intensity, x, y, z}``"""
+    return [
+        {"intensity": intensity, "x": x, "y": y, "z": z}
+        for intensity, x, y, z in zip(
+            records["intensity"].astype(np.float64).tolist(),
+            np.round(records["x"].astype(np.float64), decimals).tolist(),
+            np.round(records["y"].astype(np.float64), decimals).tolist(),
+            np.round(records["z"].astype(np.float64), decimals).tolist(),
+        )
+    ]
+
+
+def encode_chunk(batch):
+    """Serializa un batch procesado como chunk binario para almacenamiento"""
+    header = CHUNK_HEADER.pack(
+        CHUNK_MAGIC,
+        CHUNK_VERSION,
+        0,
+        len(batch),
+        batch.device_sequence,
+        int((batch.received_at or 0) * 1_000_000),
+        (batch.device or "").encode("utf-8")[:CHUNK_DEVICE_SIZE],
+    )
+    return header + batch.to_records().tobytes()
+
+
+def decode_chunk(data):
+    """Devuelve ``(metadata, records)`` de un chunk; ``records`` es una vista"""
+    if len(data) < CHUNK_HEADER.size:
+        raise ValueError("chunk too short")
+
+    magic, version, _, point_count, device_sequence, timestamp_us, device = (
+        CHUNK_HEADER.unpack_from(data, 0)
+    )
+    if magic != CHUNK_MAGIC:
+        raise ValueError("invalid chunk magic")
+    if version != CHUNK_VERSION:
+        raise ValueError(f"unsupported chunk version: {version}")
+
+    expected_size = CHUNK_HEADER.size + point_count * POINT_RECORD_DTYPE.itemsize
+    if len(data) != expected_size:
+        raise ValueError(
+            f"invalid chunk size: expected {expected_size}, got {len(data)}"
+        )
+
+    metadata = {
+        "device": device.rstrip(b"\0").decode("utf-8", "replace"),
+        "device_sequence": device_sequence,
+        "received_at": timestamp_us / 1_000_000,
+        "point_count": point_count,
+    }
+    records = np.frombuffer(
+        data, dtype=POINT_RECORD_DTYPE, count=point_count, offset=CHUNK_HEADER.size
+    )
+    return metadata, records
+
+
+def encode_web_frame(message_type, records, progress=None, sequence=None):
+    """Trama binaria para clientes web.
+
+    ``progress`` es ``(enviados, total)`` y sólo aplica a las tramas del
+    estado inicial. ``sequence`` es la del último batch de ``records``.
+    """
+    header = WEB_FRAME_HEADER.pack(
+        WEB_FRAME_MAGIC,
+        WEB_FRAME_VERSION,
+        WEB_FRAME_TYPES[message_type],
+        len(records),
+        -1 if sequence is None else sequence,
+    )
+    if message_type in WEB_FRAME_PROGRESS_TYPES:
+        sent, total = progress or (len(records), len(records))
+        header += WEB_FRAME_PROGRESS.pack(sent, total)
+    return header + records.tobytes()
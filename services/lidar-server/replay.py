@@ -0,0 +1,219 @@
+"""Reproduce una captura de ``ingest_capture.py`` contra un servidor LiDAR.
+
+Cada conexión grabada abre su propia conexión WebSocket y las tramas se
+reenvían en el orden global en que llegaron: con los intervalos originales
+(``--speed 1``, o más rápido con ``--speed 2``) o, con ``--speed 0``, tan
+rápido como el servidor las acepte. Así una sesión de campo sirve como
+benchmark de regresión contra otro build del servidor.
+
+Uso:
+    python replay.py captura.lcap --url ws://localhost:3000
+    python replay.py captura.lcap --speed 0          # lo más rápido posible
+    python replay.py captura.lcap --list --connection 3
+
+Las respuestas ``ERROR:...`` del servidor se imprimen con la última trama
+enviada por esa conexión, para depurar fallos de parseo; ``--list`` muestra
+las tramas de la captura sin enviarlas.
+"""
+
+import argparse
+import asyncio
+import time
+from pathlib import Path
+
+import websockets
+
+from ingest_capture import (
+    CAPTURE_KINDS,
+    KIND_BINARY,
+    KIND_CLOSE,
+    KIND_OPEN,
+    KIND_TEXT,
+    read_capture,
+)
+
+REPLAY_PREVIEW_CHARS = 60
+
+
+class ReplayConnection:
+    """Conexión hacia el servidor en lugar de una conexión grabada"""
+
+    def __init__(self, connection, remote_address=None):
+        self.connection = connection
+        self.remote_address = remote_address
+        self.ws = None
+        self.reader = None
+        self.last_frame = None
+        self.closed = False
+
+    async def open(self, url, stats):
+        try:
+            self.ws = await websockets.connect(url, max_size=None)
+        except Exception as e:
+            stats["connect_errors"] += 1
+            print(
+                f"No se pudo abrir la conexión {self.connection} "
+                f"({self.remote_address}): {e}"
+            )
+            self.closed = True
+            return
+        stats["connections"] += 1
+        self.reader = asyncio.create_task(self.read_replies(stats))
+
+    async def read_replies(self, stats):
+        """Descarta lo que envía el servidor salvo los errores"""
+        try:
+            async for message in self.ws:
+                if isinstance(message, str) and message.startswith("ERROR:"):
+                    stats["server_errors"] += 1
+                    print(
+                        f"REPLAY|event=server_error|connection={self.connection}"
+                        f"|after_frame={self.last_frame}|reply={message}"
+                    )
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def send(self, index, payload, stats):
+        if self.closed:
+            return
+        try:
+            await self.ws.send(payload)
+        except websockets.exceptions.ConnectionClosed as e:
+            stats["send_errors"] += 1
+            print(f"Conexión {self.connection} cerrada por el servidor: {e}")
+            self.closed = True
+            return
+        self.last_frame = index
+        stats["frames"] += 1
+        stats["bytes"] += len(payload)
+
+    async def close(self, delay=0.0):
+        """Cierra tras ``delay`` s, para recibir los errores que falten"""
+        self.closed = True
+        await asyncio.sleep(delay)
+        if self.ws is not None:
+            await self.ws.close()
+        if self.reader is not None:
+            await self.reader
+
+
+def preview(kind, payload):
+    if kind == KIND_BINARY:
+        return payload[: REPLAY_PREVIEW_CHARS // 2].hex()
+    return repr(payload[:REPLAY_PREVIEW_CHARS])
+
+
+def list_capture(path, connections=None):
+    first_ns = None
+    for index, (arrival_ns, connection, kind, payload) in enumerate(
+        read_capture(path)
+    ):
+        first_ns = arrival_ns if first_ns is None else first_ns
+        if connections and connection not in connections:
+            continue
+        print(
+            f"{index}\t{(arrival_ns - first_ns) / 1e6:.3f} ms\t{connection}\t"
+            f"{CAPTURE_KINDS[kind]}\t{len(payload)}\t{preview(kind, payload)}"
+        )
+
+
+async def replay(path, url, speed=1.0, connections=None, drain=2.0):
+    stats = {
+        "frames": 0,
+        "bytes": 0,
+        "connections": 0,
+        "connect_errors": 0,
+        "send_errors": 0,
+        "server_errors": 0,
+    }
+    open_connections = {}
+    closing = []
+    first_ns = last_ns = None
+    max_lag_s = 0.0
+    started_at = time.perf_counter()
+
+    for index, (arrival_ns, connection, kind, payload) in enumerate(
+        read_capture(path)
+    ):
+        if connections and connection not in connections:
+            continue
+        first_ns = arrival_ns if first_ns is None else first_ns
+        last_ns = arrival_ns
+        if speed > 0:
+            target = started_at + (arrival_ns - first_ns) / 1e9 / speed
+            delay = target - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                max_lag_s = max(max_lag_s, -delay)
+
+        # Una captura con tramas descartadas puede no tener el ``open``
+        replay_connection = open_connections.get(connection)
+        if replay_connection is None and kind != KIND_CLOSE:
+            replay_connection = ReplayConnection(
+                connection, payload if kind == KIND_OPEN else None
+            )
+            open_connections[connection] = replay_connection
+            await replay_connection.open(url, stats)
+
+        if kind in (KIND_TEXT, KIND_BINARY):
+            await replay_connection.send(index, payload, stats)
+        elif kind == KIND_CLOSE and replay_connection is not None:
+            replay_connection = open_connections.pop(connection)
+            closing.append(asyncio.create_task(replay_connection.close(drain)))
+
+    sent_s = time.perf_counter() - started_at
+    for replay_connection in open_connections.values():
+        closing.append(asyncio.create_task(replay_connection.close(drain)))
+    await asyncio.gather(*closing)
+
+    capture_s = (last_ns - first_ns) / 1e9 if first_ns is not None else 0.0
+    print(
+        "REPLAY|event=done"
+        f"|capture={Path(path).name}"
+        f"|speed={speed:g}"
+        f"|frames={stats['frames']}"
+        f"|bytes={stats['bytes']}"
+        f"|connections={stats['connections']}"
+        f"|capture_s={capture_s:.3f}"
+        f"|replay_s={sent_s:.3f}"
+        f"|frames_s={stats['frames'] / sent_s if sent_s > 0 else 0:.1f}"
+        f"|bytes_s={stats['bytes'] / sent_s if sent_s > 0 else 0:.0f}"
+        f"|max_lag_ms={max_lag_s * 1000:.3f}"
+        f"|connect_errors={stats['connect_errors']}"
+        f"|send_errors={stats['send_errors']}"
+        f"|server_errors={stats['server_errors']}"
+    )
+    return stats
+
+
+def run(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--url", default="ws://localhost:3000")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="1 = tiempos originales, 0 = lo más rápido posible",
+    )
+    parser.add_argument(
+        "--connection",
+        type=int,
+        action="append",
+        help="reproducir sólo estas conexiones (repetible)",
+    )
+    parser.add_argument("--drain", type=float, default=2.0)
+    parser.add_argument("--list", action="store_true", help="listar sin enviar")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        list_capture(args.path, args.connection)
+        return
+    asyncio.run(
+        replay(args.path, args.url, args.speed, args.connection, args.drain)
+    )
+
+
+if __name__ == "__main__":
+    run()
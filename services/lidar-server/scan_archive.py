@@ -0,0 +1,342 @@
+"""Archivo binario local, sólo de anexado, con los puntos de cada escaneo.
+
+Cada archivo es una cabecera de ``ARCHIVE_HEADER_SIZE`` bytes seguida de
+registros ``ARCHIVE_RECORD_DTYPE`` de ancho fijo, así que se lee con
+``np.memmap`` sin parsear nada:
+
+    header, records = open_scan_archive("scan_archive/20250101-120000-scan.lidar")
+    records["x"], records["batch"]
+
+Uso:
+    python scan_archive.py <archivo.lidar> [--csv salida.csv]
+"""
+
+import argparse
+import asyncio
+import csv
+import os
+import struct
+from collections import OrderedDict, deque
+from pathlib import Path
+
+import numpy as np
+
+from point_batch import POINT_RECORD_DTYPE
+
+ARCHIVE_MAGIC = b"LA"
+ARCHIVE_VERSION = 1
+ARCHIVE_SUFFIX = ".lidar"
+# magia, versión, flags, tamaño de cabecera, tamaño de registro, hora de
+# inicio del escaneo (epoch s) e id de escaneo; el resto hasta
+# ARCHIVE_HEADER_SIZE son ceros reservados.
+ARCHIVE_HEADER = struct.Struct("<2sBBHHd64s")
+ARCHIVE_HEADER_SIZE = 128
+# Punto procesado + número de batch dentro del archivo y ms desde el inicio
+# del escaneo hasta su recepción (21 bytes, sin relleno).
+ARCHIVE_RECORD_DTYPE = np.dtype(
+    POINT_RECORD_DTYPE.descr + [("batch", "<u4"), ("received_ms", "<u4")]
+)
+ARCHIVE_MAX_OPEN_FILES = 16
+
+
+def scan_archive_path(directory, scan_id, worker=None):
+    """Archivo de un escaneo; con varios workers cada uno escribe el suyo"""
+    suffix = ARCHIVE_SUFFIX if worker is None else f".w{worker}{ARCHIVE_SUFFIX}"
+    return Path(directory) / f"{scan_id}{suffix}"
+
+
+def scan_archive_paths(directory, scan_id):
+    """Archivos existentes de un escaneo (uno por worker que lo escribió)"""
+    directory = Path(directory)
+    paths = [scan_archive_path(directory, scan_id)]
+    paths += sorted(directory.glob(f"{scan_id}.w*{ARCHIVE_SUFFIX}"))
+    return [path for path in paths if path.exists()]
+
+
+def pack_archive_header(scan_id, started_at):
+    header = ARCHIVE_HEADER.pack(
+        ARCHIVE_MAGIC,
+        ARCHIVE_VERSION,
+        0,
+        ARCHIVE_HEADER_SIZE,
+        ARCHIVE_RECORD_DTYPE.itemsize,
+        started_at,
+        scan_id.encode("utf-8"),
+    )
+    return header.ljust(ARCHIVE_HEADER_SIZE, b"\0")
+
+
+def unpack_archive_header(data):
+    if len(data) < ARCHIVE_HEADER.size:
+        raise ValueError("archive header too short")
+
+    magic, version, _, header_size, record_size, started_at, scan_id = (
+        ARCHIVE_HEADER.unpack_from(data, 0)
+    )
+    if magic != ARCHIVE_MAGIC:
+        raise ValueError("invalid archive magic")
+    if version != ARCHIVE_VERSION:
+        raise ValueError(f"unsupported archive version: {version}")
+    if record_size != ARCHIVE_RECORD_DTYPE.itemsize:
+        raise ValueError(f"unsupported archive record size: {record_size}")
+
+    return {
+        "scan_id": scan_id.rstrip(b"\0").decode("utf-8", "replace"),
+        "started_at": started_at,
+        "header_size": header_size,
+        "record_size": record_size,
+    }
+
+
+def open_scan_archive(path):
+    """Devuelve ``(header, records)``; ``records`` es un ``np.memmap`` de lectura.
+
+    Un registro incompleto al final (corte durante una escritura) se ignora.
+    """
+    path = Path(path)
+    with path.open("rb") as fh:
+        header = unpack_archive_header(fh.read(ARCHIVE_HEADER_SIZE))
+
+    count = (path.stat().st_size - header["header_size"]) // header["record_size"]
+    header["point_count"] = count
+    if count <= 0:
+        return header, np.empty(0, dtype=ARCHIVE_RECORD_DTYPE)
+    records = np.memmap(
+        path,
+        dtype=ARCHIVE_RECORD_DTYPE,
+        mode="r",
+        offset=header["header_size"],
+        shape=(count,),
+    )
+    return header, records
+
+
+def archive_batch_bounds(records):
+    """Índices ``[inicio, fin)`` de cada batch de ``records``"""
+    if not len(records):
+        return []
+    starts = np.flatnonzero(np.diff(records["batch"])) + 1
+    starts = np.concatenate(([0], starts))
+    ends = np.append(starts[1:], len(records))
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+class _ArchiveFile:
+    __slots__ = ("fh", "started_at", "next_batch")
+
+    def __init__(self, path, scan_id, started_at):
+        """Abre para anexar; crea la cabecera o recorta un registro a medias"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.fh = open(path, "a+b")
+        size = self.fh.seek(0, os.SEEK_END)
+        self.next_batch = 0
+        if size == 0:
+            self.started_at = started_at
+            self.fh.write(pack_archive_header(scan_id, started_at))
+            return
+
+        self.fh.seek(0)
+        header = unpack_archive_header(self.fh.read(ARCHIVE_HEADER_SIZE))
+        self.started_at = header["started_at"]
+        body = size - header["header_size"]
+        complete = header["header_size"] + body - body % header["record_size"]
+        if complete != size:
+            print(f"Archivo {path}: se descartan {size - complete} bytes incompletos")
+            self.fh.truncate(complete)
+        if complete > header["header_size"]:
+            self.fh.seek(complete - header["record_size"])
+            last = np.frombuffer(
+                self.fh.read(header["record_size"]), dtype=ARCHIVE_RECORD_DTYPE
+            )
+            self.next_batch = int(last["batch"][0]) + 1
+        self.fh.seek(0, os.SEEK_END)
+
+
+class ScanArchive:
+    """Anexa los batches procesados de cada escaneo a su archivo local.
+
+    ``append`` sólo guarda los registros en memoria; una tarea de fondo los
+    escribe y hace ``fsync`` cada ``flush_interval_ms`` o en cuanto junta
+    ``flush_bytes``, con la E/S en un hilo como ``TelemetrySink``. Si el disco
+    no da abasto y lo pendiente supera ``max_pending_bytes`` se descartan los
+    batches más viejos (``dropped_batches``).
+    """
+
+    def __init__(
+        self,
+        directory,
+        flush_interval_ms=1000,
+        flush_bytes=1024 * 1024,
+        max_pending_bytes=64 * 1024 * 1024,
+        worker=None,
+    ):
+        self.directory = Path(directory)
+        self.flush_interval_s = flush_interval_ms / 1000
+        self.flush_bytes = flush_bytes
+        self.max_pending_bytes = max_pending_bytes
+        self.worker = worker
+        # (scan_id, hora de inicio del escaneo, hora de recepción, registros)
+        self.pending = deque()
+        # Escaneos a vaciar antes de escribir lo pendiente
+        self.cleared = set()
+        self.pending_bytes = 0
+        self.written_points = 0
+        self.written_bytes = 0
+        self.dropped_batches = 0
+        self.write_failures = 0
+        self._files = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def append(self, batch, started_at):
+        """Encola un batch procesado del escaneo ``batch.scan_id``"""
+        points = batch.to_records()
+        records = np.empty(len(points), dtype=ARCHIVE_RECORD_DTYPE)
+        for name in POINT_RECORD_DTYPE.names:
+            records[name] = points[name]
+        self.pending.append((batch.scan_id, started_at, batch.received_at, records))
+        self.pending_bytes += records.nbytes
+
+        while self.pending_bytes > self.max_pending_bytes:
+            _, _, _, dropped = self.pending.popleft()
+            self.pending_bytes -= dropped.nbytes
+            self.dropped_batches += 1
+        if self.pending_bytes >= self.flush_bytes:
+            self._wakeup.set()
+
+    def reset(self, scan_id):
+        """Borra el archivo del escaneo (``clear_scan``) y lo pendiente de él.
+
+        Lo que se encole después es posterior al borrado, así que se escribe
+        en un archivo nuevo.
+        """
+        self.pending = deque(entry for entry in self.pending if entry[0] != scan_id)
+        self.pending_bytes = sum(entry[3].nbytes for entry in self.pending)
+        self.cleared.add(scan_id)
+        self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        await asyncio.to_thread(self._close_all)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval_s)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        if not self.pending and not self.cleared:
+            return
+
+        pending, self.pending = self.pending, deque()
+        cleared, self.cleared = self.cleared, set()
+        self.pending_bytes = 0
+        try:
+            await asyncio.to_thread(self._write, pending, cleared)
+        except Exception as e:
+            self.write_failures += 1
+            print(f"Error escribiendo el archivo de escaneos en {self.directory}: {e}")
+
+    def _file(self, scan_id, started_at):
+        archive = self._files.get(scan_id)
+        if archive is None:
+            path = scan_archive_path(self.directory, scan_id, self.worker)
+            archive = _ArchiveFile(path, scan_id, started_at)
+            self._files[scan_id] = archive
+            if len(self._files) > ARCHIVE_MAX_OPEN_FILES:
+                _, oldest = self._files.popitem(last=False)
+                oldest.fh.close()
+        self._files.move_to_end(scan_id)
+        return archive
+
+    def _write(self, pending, cleared=()):
+        for scan_id in cleared:
+            archive = self._files.pop(scan_id, None)
+            if archive is not None:
+                archive.fh.close()
+            scan_archive_path(self.directory, scan_id, self.worker).unlink(
+                missing_ok=True
+            )
+
+        touched = {}
+        for scan_id, started_at, received_at, records in pending:
+            archive = self._file(scan_id, started_at or received_at or 0.0)
+            records["batch"] = archive.next_batch
+            archive.next_batch += 1
+            received_at = received_at or archive.started_at
+            received_ms = int((received_at - archive.started_at) * 1000)
+            records["received_ms"] = max(0, received_ms)
+            archive.fh.write(records.tobytes())
+            self.written_points += len(records)
+            self.written_bytes += records.nbytes
+            touched[scan_id] = archive
+
+        for archive in touched.values():
+            archive.fh.flush()
+            os.fsync(archive.fh.fileno())
+
+    def _close_all(self):
+        for archive in self._files.values():
+            archive.fh.close()
+        self._files.clear()
+
+    def stats(self):
+        return {
+            "written_points": self.written_points,
+            "written_bytes": self.written_bytes,
+            "pending_bytes": self.pending_bytes,
+            "dropped_batches": self.dropped_batches,
+            "write_failures": self.write_failures,
+        }
+
+
+def run(argv=None):
+    parser = argparse.ArgumentParser(description="Resumen o exportación de un archivo")
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--csv", type=Path, help="exportar x, y, z, intensidad")
+    args = parser.parse_args(argv)
+
+    header, records = open_scan_archive(args.path)
+    bounds = archive_batch_bounds(records)
+    duration_s = records["received_ms"][-1] / 1000 if len(records) else 0.0
+    print(
+        f"Escaneo {header['scan_id']}: {header['point_count']} puntos en "
+        f"{len(bounds)} batches, {duration_s:.1f} s"
+    )
+
+    if args.csv:
+        with args.csv.open("w", newline="", encoding="utf-8") as fh:
+            writer = csv.writer(fh)
+            writer.writerow(["batch", "received_ms", "x", "y", "z", "intensity"])
+            for start in range(0, len(records), 100_000):
+                chunk = records[start : start + 100_000]
+                writer.writerows(
+                    zip(
+                        chunk["batch"].tolist(),
+                        chunk["received_ms"].tolist(),
+                        chunk["x"].tolist(),
+                        chunk["y"].tolist(),
+                        chunk["z"].tolist(),
+                        chunk["intensity"].tolist(),
+                    )
+                )
+        print(f"Exportado a {args.csv}")
+
+
+if __name__ == "__main__":
+    run()
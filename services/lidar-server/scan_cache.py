@@ -0,0 +1,253 @@
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+from point_batch import POINT_RECORD_DTYPE
+
+SCAN_CACHE_INITIAL_CAPACITY = 4096
+# Chunks que pueden esperar a uno anterior antes de dar el escaneo por perdido
+SCAN_CACHE_MAX_PENDING_BATCHES = 256
+
+
+class ScanColumns:
+    """Copia en memoria, sólo de anexado, de los chunks de un escaneo.
+
+    Guarda los registros ``POINT_RECORD_DTYPE`` de todos los batches en un
+    único arreglo que crece por duplicación, y el fin de cada batch en
+    ``batch_ends``: el batch con secuencia ``first_sequence + n`` ocupa
+    ``records[batch_ends[n - 1]:batch_ends[n]]``. Las filas ya escritas no
+    cambian nunca, así que las vistas entregadas siguen siendo válidas
+    aunque el arreglo se realoque.
+
+    Con varios workers los batches de un escaneo llegan intercalados: uno
+    que se adelanta espera en ``pending`` a que lleguen los anteriores (ver
+    ``missing``). Si el hueco supera SCAN_CACHE_MAX_PENDING_BATCHES, o un
+    batch no tiene secuencia (falló Redis), el escaneo deja de estar
+    ``complete`` y se libera: a partir de ahí se sirve desde Redis.
+    """
+
+    __slots__ = (
+        "records",
+        "point_count",
+        "first_sequence",
+        "batch_ends",
+        "pending",
+        "complete",
+        "cleared",
+    )
+
+    def __init__(self, capacity=SCAN_CACHE_INITIAL_CAPACITY, first_sequence=0):
+        self.records = np.empty(capacity, dtype=POINT_RECORD_DTYPE)
+        self.point_count = 0
+        # Las secuencias siguen tras limpiar un escaneo: no vuelven a 0
+        self.first_sequence = first_sequence
+        self.batch_ends = array("Q")
+        # secuencia -> registros de los batches que llegaron antes de tiempo
+        self.pending = {}
+        self.complete = True
+        # Se marca al reemplazar el escaneo para cortar snapshots en curso
+        self.cleared = False
+
+    @property
+    def chunk_count(self):
+        return len(self.batch_ends)
+
+    @property
+    def next_sequence(self):
+        return self.first_sequence + len(self.batch_ends)
+
+    @property
+    def missing(self):
+        """``(inicio, fin)`` del hueco que retiene los pendientes, o None"""
+        if not self.pending:
+            return None
+        return self.next_sequence, min(self.pending)
+
+    @property
+    def nbytes(self):
+        return (
+            self.records.nbytes
+            + self.batch_ends.itemsize * len(self.batch_ends)
+            + sum(records.nbytes for records in self.pending.values())
+        )
+
+    def _reserve(self, extra):
+        needed = self.point_count + extra
+        if needed <= len(self.records):
+            return
+
+        capacity = max(len(self.records) * 2, needed, SCAN_CACHE_INITIAL_CAPACITY)
+        records = np.empty(capacity, dtype=POINT_RECORD_DTYPE)
+        records[: self.point_count] = self.records[: self.point_count]
+        self.records = records
+
+    def append(self, sequence, records):
+        """Anexa el chunk ``sequence``; devuelve False si el escaneo se perdió.
+
+        Un chunk adelantado queda pendiente hasta que llegan los anteriores y
+        uno repetido se ignora.
+        """
+        if not self.complete:
+            return False
+        if sequence < self.next_sequence or sequence in self.pending:
+            return True
+        if sequence > self.next_sequence:
+            if sequence - self.next_sequence > SCAN_CACHE_MAX_PENDING_BATCHES:
+                self.invalidate()
+                return False
+            self.pending[sequence] = records
+            return True
+
+        self._append(records)
+        while self.next_sequence in self.pending:
+            self._append(self.pending.pop(self.next_sequence))
+        return True
+
+    def rebase(self, first_sequence):
+        """Fija dónde empieza un escaneo todavía vacío (p. ej. uno limpiado)"""
+        if self.chunk_count:
+            return
+        self.first_sequence = first_sequence
+        self.pending = {
+            sequence: records
+            for sequence, records in self.pending.items()
+            if sequence >= first_sequence
+        }
+        while self.next_sequence in self.pending:
+            self._append(self.pending.pop(self.next_sequence))
+
+    def _append(self, records):
+        self._reserve(len(records))
+        end = self.point_count + len(records)
+        self.records[self.point_count : end] = records
+        self.point_count = end
+        self.batch_ends.append(end)
+
+    def invalidate(self):
+        self.complete = False
+        self.records = np.empty(0, dtype=POINT_RECORD_DTYPE)
+        self.point_count = 0
+        self.batch_ends = array("Q")
+        self.pending = {}
+
+    def iter_chunks(self, stop, batches_per_chunk, start=None):
+        """Vistas de registros de hasta ``batches_per_chunk`` batches.
+
+        Cubre los batches con secuencia en ``[start, stop)`` (desde el primero
+        si ``start`` es None) y se detiene si el escaneo se limpia o
+        invalida mientras se recorre.
+        """
+        first_index = 0 if start is None else start - self.first_sequence
+        stop_index = stop - self.first_sequence
+        begin = self.batch_ends[first_index - 1] if first_index else 0
+        for first in range(first_index, stop_index, batches_per_chunk):
+            if self.cleared or not self.complete:
+                return
+            end = self.batch_ends[min(first + batches_per_chunk, stop_index) - 1]
+            yield self.records[begin:end]
+            begin = end
+
+
+class ScanCache:
+    """Escaneos materializados en memoria con tope de bytes y desalojo LRU.
+
+    ``get`` sólo devuelve escaneos completos y sin huecos (los pendientes ya
+    se enviaron en vivo y un snapshot de la caché no los incluiría) y los
+    marca como recientes; ``scan`` devuelve (o crea vacío) el escaneo al que
+    anexar y también lo marca, para que el escaneo en vivo no sea el primero
+    en desalojarse. Un escaneo desalojado que sigue recibiendo batches
+    vuelve a crearse vacío y queda marcado como incompleto, salvo que le
+    falten pocos batches y se completen desde el almacenamiento.
+
+    ``lods`` guarda los LOD de vóxeles de cada escaneo (cualquier objeto con
+    ``nbytes``): cuentan para el tope y se desalojan junto con su escaneo.
+    Con la caché desactivada no hay tope y los LOD se conservan.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.scans = OrderedDict()
+        # scan_id -> VoxelLods
+        self.lods = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    @property
+    def nbytes(self):
+        return sum(scan.nbytes for scan in self.scans.values()) + sum(
+            lods.nbytes for lods in self.lods.values()
+        )
+
+    def get(self, scan_id):
+        scan = self.scans.get(scan_id)
+        if scan is None or not scan.complete or scan.pending:
+            self.misses += 1
+            return None
+        self.scans.move_to_end(scan_id)
+        self.hits += 1
+        return scan
+
+    def scan(self, scan_id, first_sequence=0):
+        scan = self.scans.get(scan_id)
+        if scan is None:
+            scan = ScanColumns(first_sequence=first_sequence)
+            if not self.enabled:
+                scan.invalidate()
+            self.scans[scan_id] = scan
+        else:
+            # El escaneo en vivo es el más reciente aunque nadie lo lea
+            self.scans.move_to_end(scan_id)
+        return scan
+
+    def reset(self, scan_id, first_sequence=0):
+        """Reemplaza el escaneo por uno vacío en una sola asignación.
+
+        ``first_sequence`` es la del próximo batch: la primera de un escaneo
+        nuevo es 0 y la de uno limpiado, donde había quedado.
+        """
+        old = self.scans.pop(scan_id, None)
+        if old is not None:
+            old.cleared = True
+        return self.scan(scan_id, first_sequence)
+
+    def append_batches(self, scan, batches):
+        """Anexa los batches ya persistidos (con ``sequence``) y aplica el tope.
+
+        Devuelve ``scan.missing``: el hueco que hay que completar, si quedó uno.
+        """
+        for batch in batches:
+            if batch.sequence is None:
+                scan.invalidate()
+                break
+            if not scan.append(batch.sequence, batch.to_records()):
+                break
+        self.enforce_limit()
+        return scan.missing
+
+    def enforce_limit(self):
+        if not self.enabled:
+            return
+        while self.scans and self.nbytes > self.max_bytes:
+            scan_id, scan = self.scans.popitem(last=False)
+            if (scan.complete and scan.chunk_count) or scan_id in self.lods:
+                self.evictions += 1
+            scan.invalidate()
+            self.lods.pop(scan_id, None)
+            print(f"Escaneo {scan_id} desalojado de la caché en memoria")
+
+    def stats(self):
+        return {
+            "scans": len(self.scans),
+            "bytes": self.nbytes,
+            "lod_bytes": sum(lods.nbytes for lods in self.lods.values()),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,287 @@
+import struct
+
+import numpy as np
+
+from payload_codecs import PayloadDecompressor, compress
+from point_batch import PointBatch
+
+BINARY_BATCH_MAGIC = b"PS"
+BINARY_BATCH_VERSION = 1
+BINARY_BATCH_HEADER_SIZE = 8
+BINARY_POINT_RECORD_SIZE = 5
+# v2: magia, versión, flags, secuencia u32, timestamp del dispositivo en µs
+# (monotónico), inclinación en décimas y cantidad de puntos. Según los flags
+# siguen los segmentos de inclinación (<H cantidad + <hH por segmento:
+# inclinación, puntos) y el paneo base (<H) de los ángulos en delta.
+BINARY_BATCH_V2_VERSION = 2
+BINARY_BATCH_V2_HEADER = struct.Struct("<2sBBIQhH")
+BINARY_BATCH_VERSIONS = {BINARY_BATCH_VERSION, BINARY_BATCH_V2_VERSION}
+BINARY_FLAG_INCLINATION_SEGMENTS = 0x01
+BINARY_FLAG_PAN_DELTA = 0x02
+# Los 4 bits altos de los flags son el códec de lo que sigue a la cabecera fija
+# (ver payload_codecs); 0 es sin comprimir. La cabecera nunca se comprime.
+BINARY_FLAG_CODEC_SHIFT = 4
+BINARY_FLAG_CODEC_MASK = 0xF0
+BINARY_BATCH_FIXED_HEADER_SIZES = {
+    BINARY_BATCH_VERSION: BINARY_BATCH_HEADER_SIZE,
+    BINARY_BATCH_V2_VERSION: BINARY_BATCH_V2_HEADER.size,
+}
+# Cota del cuerpo descomprimido: segmentos, paneo base y 65535 puntos de 5 bytes
+BINARY_BATCH_MAX_BODY_SIZE = 2 + 0xFFFF * 4 + 2 + 0xFFFF * BINARY_POINT_RECORD_SIZE
+BINARY_SEGMENT_COUNT = struct.Struct("<H")
+BINARY_PAN_BASE = struct.Struct("<H")
+# Décimas de grado de una vuelta completa: los ángulos en delta dan la vuelta aquí
+TENTH_DEGREE_STEPS = 3600
+
+BINARY_POINT_DTYPE = np.dtype(
+    [("distance", "<u2"), ("intensity", "u1"), ("pan_angle_tenths", "<u2")]
+)
+# v2 con BINARY_FLAG_PAN_DELTA: diferencia con el punto anterior (int8)
+BINARY_DELTA_POINT_DTYPE = np.dtype(
+    [("distance", "<u2"), ("intensity", "u1"), ("pan_delta_tenths", "i1")]
+)
+BINARY_SEGMENT_DTYPE = np.dtype([("inclination_tenths", "<i2"), ("count", "<u2")])
+
+# Búfer de descompresión reutilizable (ver decompress_binary_batch)
+payload_decompressor = PayloadDecompressor()
+
+
+def unpack_binary_batch_header(payload):
+    """Valida la cabecera de un batch binario "PS" (v1 o v2) y devuelve sus campos.
+
+    El dict incluye ``segments`` (registros ``BINARY_SEGMENT_DTYPE`` o None),
+    ``pan_base_tenths`` (None si los ángulos no van en delta) y
+    ``records_offset``. ``sequence`` y ``timestamp_us`` son None en v1.
+    """
+    if len(payload) < BINARY_BATCH_HEADER_SIZE:
+        raise ValueError("payload too short")
+
+    magic, version, flags = struct.unpack_from("<2sBB", payload, 0)
+    if magic != BINARY_BATCH_MAGIC:
+        raise ValueError("invalid binary batch magic")
+
+    if version not in BINARY_BATCH_VERSIONS:
+        raise ValueError(f"unsupported binary batch version: {version}")
+
+    if flags & BINARY_FLAG_CODEC_MASK:
+        raise ValueError("compressed binary batch: decompress it first")
+
+    header = {
+        "version": version,
+        "flags": flags,
+        "sequence": None,
+        "timestamp_us": None,
+        "segments": None,
+        "pan_base_tenths": None,
+    }
+    point_dtype = BINARY_POINT_DTYPE
+    if version == BINARY_BATCH_VERSION:
+        inclination_tenths, point_count = struct.unpack_from("<hH", payload, 4)
+        offset = BINARY_BATCH_HEADER_SIZE
+    else:
+        if len(payload) < BINARY_BATCH_V2_HEADER.size:
+            raise ValueError("payload too short")
+        (_, _, _, sequence, timestamp_us, inclination_tenths, point_count) = (
+            BINARY_BATCH_V2_HEADER.unpack_from(payload, 0)
+        )
+        header["sequence"] = sequence
+        header["timestamp_us"] = timestamp_us
+        offset = BINARY_BATCH_V2_HEADER.size
+
+        if flags & BINARY_FLAG_INCLINATION_SEGMENTS:
+            if len(payload) < offset + BINARY_SEGMENT_COUNT.size:
+                raise ValueError("payload too short")
+            (segment_count,) = BINARY_SEGMENT_COUNT.unpack_from(payload, offset)
+            offset += BINARY_SEGMENT_COUNT.size
+            if len(payload) < offset + segment_count * BINARY_SEGMENT_DTYPE.itemsize:
+                raise ValueError("payload too short")
+            segments = np.frombuffer(
+                payload, dtype=BINARY_SEGMENT_DTYPE, count=segment_count, offset=offset
+            )
+            offset += segments.nbytes
+            if int(segments["count"].sum()) != point_count:
+                raise ValueError("inclination segments do not cover the batch")
+            header["segments"] = segments
+
+        if flags & BINARY_FLAG_PAN_DELTA:
+            if len(payload) < offset + BINARY_PAN_BASE.size:
+                raise ValueError("payload too short")
+            (header["pan_base_tenths"],) = BINARY_PAN_BASE.unpack_from(payload, offset)
+            offset += BINARY_PAN_BASE.size
+            point_dtype = BINARY_DELTA_POINT_DTYPE
+
+    expected_size = offset + point_count * point_dtype.itemsize
+    if len(payload) != expected_size:
+        raise ValueError(
+            f"invalid payload size: expected {expected_size}, got {len(payload)}"
+        )
+
+    header["inclination_tenths"] = inclination_tenths
+    header["point_count"] = point_count
+    header["records_offset"] = offset
+    header["point_dtype"] = point_dtype
+    return header
+
+
+def binary_batch_codec(payload):
+    """Id de códec de un batch "PS" (0 si no está comprimido)"""
+    if len(payload) < BINARY_BATCH_HEADER_SIZE:
+        return 0
+    return (payload[3] & BINARY_FLAG_CODEC_MASK) >> BINARY_FLAG_CODEC_SHIFT
+
+
+def decompress_binary_batch(payload):
+    """Devuelve el batch sin comprimir; los comprimidos, en el búfer reutilizable.
+
+    La vista devuelta sobre ``payload_decompressor`` sólo vale hasta la
+    próxima trama comprimida.
+    """
+    codec_id = binary_batch_codec(payload)
+    if not codec_id:
+        return payload
+
+    header_size = BINARY_BATCH_FIXED_HEADER_SIZES.get(payload[2])
+    if header_size is None:
+        raise ValueError(f"unsupported binary batch version: {payload[2]}")
+    if len(payload) < header_size:
+        raise ValueError("payload too short")
+
+    decompressed = payload_decompressor.decompress(
+        codec_id,
+        memoryview(payload)[header_size:],
+        BINARY_BATCH_MAX_BODY_SIZE,
+        offset=header_size,
+    )
+    decompressed[:header_size] = payload[:header_size]
+    decompressed[3] = payload[3] & ~BINARY_FLAG_CODEC_MASK
+    return decompressed
+
+
+def compress_binary_batch(payload, codec_id, level=None):
+    """Comprime el cuerpo de un batch "PS" y anota el códec en los flags"""
+    header_size = BINARY_BATCH_FIXED_HEADER_SIZES[payload[2]]
+    header = bytearray(payload[:header_size])
+    header[3] = (header[3] & ~BINARY_FLAG_CODEC_MASK) | (
+        codec_id << BINARY_FLAG_CODEC_SHIFT
+    )
+    return bytes(header) + compress(codec_id, payload[header_size:], level)
+
+
+def decode_binary_sensor_batch(payload, header=None):
+    """Decodifica un batch binario "PS" en columnas NumPy.
+
+    Devuelve ``(inclination_tenths, distance, intensity, pan_angle_tenths)``.
+    La inclinación es un entero, o una columna int16 si el batch trae
+    segmentos. Distancia e intensidad son vistas sobre ``payload``; el paneo
+    también, salvo que venga en delta.
+    """
+    if header is None:
+        header = unpack_binary_batch_header(payload)
+    records = np.frombuffer(
+        payload,
+        dtype=header["point_dtype"],
+        count=header["point_count"],
+        offset=header["records_offset"],
+    )
+
+    segments = header["segments"]
+    if segments is None:
+        inclination_tenths = header["inclination_tenths"]
+    else:
+        inclination_tenths = np.repeat(
+            segments["inclination_tenths"], segments["count"]
+        )
+
+    if header["pan_base_tenths"] is None:
+        pan_angle_tenths = records["pan_angle_tenths"]
+    else:
+        pan_angle_tenths = np.cumsum(records["pan_delta_tenths"], dtype=np.int64)
+        pan_angle_tenths += header["pan_base_tenths"]
+        pan_angle_tenths %= TENTH_DEGREE_STEPS
+        pan_angle_tenths = pan_angle_tenths.astype(np.uint16)
+
+    return (
+        inclination_tenths,
+        records["distance"],
+        records["intensity"],
+        pan_angle_tenths,
+    )
+
+
+def parse_binary_sensor_data(payload, header=None):
+    """``PointBatch`` de un batch "PS"; ``header`` indica que ya se descomprimió"""
+    try:
+        if header is None:
+            payload = decompress_binary_batch(payload)
+        inclination_tenths, distances, intensities, pan_angles_tenths = (
+            decode_binary_sensor_batch(payload, header)
+        )
+        if isinstance(payload, memoryview):
+            # Vista sobre el búfer de descompresión, que se reutiliza
+            pan_angles_tenths = pan_angles_tenths.copy()
+        inclination_tenths = np.broadcast_to(
+            np.asarray(inclination_tenths, dtype=np.int16), len(distances)
+        )
+
+        return PointBatch(
+            inclination_tenths / 10.0,
+            pan_angles_tenths / 10.0,
+            distances,
+            intensities,
+            inclination_tenths=inclination_tenths,
+            pan_angle_tenths=pan_angles_tenths,
+        )
+
+    except Exception as e:
+        print(f"Error parseando payload binario del sensor: {e}")
+        return PointBatch.empty()
+
+
+def encode_binary_sensor_batch_v2(
+    sequence, timestamp_us, inclination_tenths, distance, intensity, pan_angle_tenths
+):
+    """Arma un batch "PS" v2 como lo haría el firmware.
+
+    ``inclination_tenths`` es un entero o una columna por punto; si cambia
+    dentro del batch se codifica como segmentos. Los ángulos de paneo van en
+    delta cuando todos los saltos entran en un int8.
+    """
+    distance = np.asarray(distance)
+    point_count = len(distance)
+    inclination = np.broadcast_to(np.asarray(inclination_tenths), point_count)
+    pan = np.asarray(pan_angle_tenths, dtype=np.int64)
+
+    flags = 0
+    body = b""
+    changes = np.flatnonzero(np.diff(inclination)) + 1
+    if len(changes):
+        flags |= BINARY_FLAG_INCLINATION_SEGMENTS
+        starts = np.concatenate(([0], changes))
+        segments = np.empty(len(starts), dtype=BINARY_SEGMENT_DTYPE)
+        segments["inclination_tenths"] = inclination[starts]
+        segments["count"] = np.diff(np.append(starts, point_count))
+        body += BINARY_SEGMENT_COUNT.pack(len(segments)) + segments.tobytes()
+
+    # Salto al ángulo más cercano, contando la vuelta de 360°
+    deltas = (np.diff(pan, prepend=pan[:1]) + 1800) % TENTH_DEGREE_STEPS - 1800
+    if point_count and np.all((deltas >= -128) & (deltas <= 127)):
+        flags |= BINARY_FLAG_PAN_DELTA
+        body += BINARY_PAN_BASE.pack(int(pan[0]))
+        records = np.empty(point_count, dtype=BINARY_DELTA_POINT_DTYPE)
+        records["pan_delta_tenths"] = deltas
+    else:
+        records = np.empty(point_count, dtype=BINARY_POINT_DTYPE)
+        records["pan_angle_tenths"] = pan
+    records["distance"] = distance
+    records["intensity"] = intensity
+
+    header = BINARY_BATCH_V2_HEADER.pack(
+        BINARY_BATCH_MAGIC,
+        BINARY_BATCH_V2_VERSION,
+        flags,
+        sequence % (1 << 32),
+        timestamp_us,
+        int(inclination[0]) if point_count else 0,
+        point_count,
+    )
+    return header + body + records.tobytes()
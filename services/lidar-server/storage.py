@@ -0,0 +1,552 @@
+import asyncio
+import os
+import time
+from array import array
+from pathlib import Path
+
+from redis.exceptions import WatchError
+
+from point_batch import (
+    CHUNK_DEVICE_SIZE,
+    CHUNK_HEADER,
+    CHUNK_MAGIC,
+    POINT_RECORD_DTYPE,
+    decode_chunk,
+    encode_chunk,
+)
+from scan_cache import ScanColumns
+
+# Backends de almacenamiento de escaneos; se elige con STORAGE_BACKEND.
+STORAGE_BACKENDS = ("redis", "file", "memory")
+REDIS_KEY_PREFIX = "lidar"
+# ZSET scan_id -> hora de inicio; cada escaneo usa sus propias claves
+# (ver scan_chunks_key / scan_points_key).
+REDIS_SCANS_KEY = f"{REDIS_KEY_PREFIX}:scans"
+FILE_STORE_SCANS = "scans.tsv"
+FILE_STORE_SUFFIX = ".chunks"
+# Primera secuencia de un escaneo limpiado: ``<scan_id>.chunks.first``
+FILE_STORE_FIRST_SUFFIX = ".first"
+FILE_STORE_FSYNC_INTERVAL_S = 1.0
+STORE_READ_BATCHES = 100
+
+
+def scan_chunks_key(scan_id):
+    return f"{REDIS_KEY_PREFIX}:scan:{scan_id}:chunks"
+
+
+def scan_points_key(scan_id):
+    return f"{REDIS_KEY_PREFIX}:scan:{scan_id}:points"
+
+
+def scan_first_sequence_key(scan_id):
+    return f"{REDIS_KEY_PREFIX}:scan:{scan_id}:first"
+
+
+def _decode_chunks(chunks, first_sequence):
+    for offset, chunk in enumerate(chunks):
+        try:
+            metadata, records = decode_chunk(chunk)
+        except ValueError as e:
+            print(f"Error decodificando chunk almacenado: {e}")
+            continue
+        yield first_sequence + offset, metadata, records
+
+
+class RedisScanStore:
+    """Escaneos en Redis: una lista de chunks binarios y un contador por escaneo.
+
+    Todas las implementaciones comparten esta interfaz:
+
+    - ``append_batches(batches)`` / ``append_batch(batch)``: anexan un chunk
+      por batch al escaneo ``batch.scan_id`` y le asignan ``batch.sequence``.
+      Las secuencias de un escaneo crecen siempre, también tras limpiarlo.
+    - ``iter_chunks(scan_id, start, stop)``: ``(sequence, metadata, records)``
+      de los chunks con secuencia en ``[start, stop)``, leídos de a
+      ``batch_size``.
+    - ``extent(scan_id)``: ``(primera secuencia, chunks, puntos)`` leídos de
+      forma consistente; las secuencias almacenadas son
+      ``[primera, primera + chunks)``.
+    - ``clear(scan_id)``: vacía el escaneo y devuelve la primera secuencia
+      de los batches siguientes, que continúan donde quedó el escaneo.
+    - ``register_scan`` / ``list_scans``: registro de escaneos con su hora de
+      inicio, en orden de inicio.
+    """
+
+    name = "redis"
+
+    def __init__(self, client):
+        self.client = client
+        self._tasks = set()
+
+    async def open(self):
+        """Libera claves que un ``clear`` renombró y no llegó a borrar"""
+        leftovers = [
+            key
+            async for key in self.client.scan_iter(
+                match=f"{REDIS_KEY_PREFIX}:scan:*:deleting:*"
+            )
+        ]
+        if leftovers:
+            self._spawn_unlink(leftovers)
+
+    async def close(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def register_scan(self, scan_id, started_at):
+        """True si el escaneo es nuevo"""
+        return bool(
+            await self.client.zadd(REDIS_SCANS_KEY, {scan_id: started_at}, nx=True)
+        )
+
+    async def list_scans(self):
+        entries = await self.client.zrange(REDIS_SCANS_KEY, 0, -1, withscores=True)
+        return [
+            (scan_id.decode("utf-8"), started_at) for scan_id, started_at in entries
+        ]
+
+    async def append_batches(self, batches):
+        """Todos los chunks en un solo pipeline transaccional"""
+        scan_ids = list(dict.fromkeys(batch.scan_id for batch in batches))
+        async with self.client.pipeline(transaction=True) as pipe:
+            for scan_id in scan_ids:
+                pipe.get(scan_first_sequence_key(scan_id))
+            for batch in batches:
+                pipe.rpush(scan_chunks_key(batch.scan_id), encode_chunk(batch))
+                pipe.incrby(scan_points_key(batch.scan_id), len(batch))
+            results = await pipe.execute()
+
+        first_sequences = {
+            scan_id: int(first or 0) for scan_id, first in zip(scan_ids, results)
+        }
+        for batch, chunk_count in zip(batches, results[len(scan_ids) :: 2]):
+            batch.sequence = first_sequences[batch.scan_id] + chunk_count - 1
+        return batches
+
+    async def append_batch(self, batch):
+        await self.append_batches([batch])
+        return batch.sequence
+
+    async def extent(self, scan_id):
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.get(scan_first_sequence_key(scan_id))
+            pipe.llen(scan_chunks_key(scan_id))
+            pipe.get(scan_points_key(scan_id))
+            first_sequence, chunk_count, point_count = await pipe.execute()
+        return int(first_sequence or 0), chunk_count, int(point_count or 0)
+
+    async def iter_chunks(self, scan_id, start=0, stop=None, batch_size=None):
+        """Recorre la lista con LRANGE de a ``batch_size`` sin cargarla entera.
+
+        La posición en la lista es la secuencia menos la primera del escaneo;
+        si el escaneo se limpia mientras se recorre, el recorrido termina.
+        """
+        batch_size = batch_size or STORE_READ_BATCHES
+        key = scan_chunks_key(scan_id)
+        first_key = scan_first_sequence_key(scan_id)
+        first_sequence = int(await self.client.get(first_key) or 0)
+        cursor = max(start, first_sequence)
+        while stop is None or cursor < stop:
+            last = cursor + batch_size - 1
+            if stop is not None:
+                last = min(last, stop - 1)
+
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.get(first_key)
+                pipe.lrange(key, cursor - first_sequence, last - first_sequence)
+                current, chunks = await pipe.execute()
+            if int(current or 0) != first_sequence:
+                return
+            for chunk in _decode_chunks(chunks, cursor):
+                yield chunk
+
+            if len(chunks) < last - cursor + 1:
+                return
+            cursor = last + 1
+
+    async def clear(self, scan_id):
+        """Vacía un escaneo sin bloquear Redis.
+
+        Un RENAME atómico aparta sus claves, así que los batches siguientes ya
+        caen en claves vacías, y UNLINK las libera en segundo plano. En la
+        misma transacción (con WATCH sobre la lista) la primera secuencia
+        avanza lo que tenía el escaneo.
+        """
+        keys = (scan_chunks_key(scan_id), scan_points_key(scan_id))
+        first_key = scan_first_sequence_key(scan_id)
+        suffix = f"deleting:{time.time_ns()}"
+        doomed = [f"{key}:{suffix}" for key in keys]
+        async with self.client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(keys[0], first_key)
+                    chunk_count = await pipe.llen(keys[0])
+                    first_sequence = int(await pipe.get(first_key) or 0)
+                    pipe.multi()
+                    pipe.set(first_key, first_sequence + chunk_count)
+                    for key, target in zip(keys, doomed):
+                        pipe.rename(key, target)
+                    results = await pipe.execute(raise_on_error=False)
+                    break
+                except WatchError:
+                    continue
+
+        renamed = []
+        for target, result in zip(doomed, results[1:]):
+            if not isinstance(result, Exception):
+                renamed.append(target)
+            elif "no such key" not in str(result).lower():
+                raise result
+        if renamed:
+            self._spawn_unlink(renamed)
+        return first_sequence + chunk_count
+
+    def _spawn_unlink(self, keys):
+        task = asyncio.create_task(self._unlink(keys))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _unlink(self, keys):
+        try:
+            await self.client.unlink(*keys)
+        except Exception as e:
+            print(f"Error liberando claves de Redis: {e}")
+
+
+class _MemoryScan:
+    __slots__ = ("columns", "devices", "device_sequences", "received_us")
+
+    def __init__(self, first_sequence=0):
+        self.columns = ScanColumns(first_sequence=first_sequence)
+        self.devices = []
+        self.device_sequences = array("Q")
+        self.received_us = array("Q")
+
+
+class MemoryScanStore:
+    """Escaneos en memoria del proceso, en columnas (ver ``RedisScanStore``).
+
+    Los registros de cada escaneo van en un ``ScanColumns`` y los metadatos
+    de cada batch en arreglos paralelos, con la misma precisión que el chunk
+    binario. Se pierde todo al reiniciar el servidor.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self.scans = {}
+        self.registry = {}
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def register_scan(self, scan_id, started_at):
+        if scan_id in self.registry:
+            return False
+        self.registry[scan_id] = started_at
+        return True
+
+    async def list_scans(self):
+        return sorted(self.registry.items(), key=lambda entry: entry[1])
+
+    async def append_batches(self, batches):
+        for batch in batches:
+            scan = self.scans.get(batch.scan_id)
+            if scan is None:
+                scan = self.scans[batch.scan_id] = _MemoryScan()
+            sequence = scan.columns.next_sequence
+            scan.columns.append(sequence, batch.to_records())
+            device = (batch.device or "").encode("utf-8")[:CHUNK_DEVICE_SIZE]
+            scan.devices.append(device.decode("utf-8", "replace"))
+            scan.device_sequences.append(batch.device_sequence or 0)
+            scan.received_us.append(int((batch.received_at or 0) * 1_000_000))
+            batch.sequence = sequence
+        return batches
+
+    async def append_batch(self, batch):
+        await self.append_batches([batch])
+        return batch.sequence
+
+    async def extent(self, scan_id):
+        scan = self.scans.get(scan_id)
+        if scan is None:
+            return 0, 0, 0
+        columns = scan.columns
+        return columns.first_sequence, columns.chunk_count, columns.point_count
+
+    async def iter_chunks(self, scan_id, start=0, stop=None, batch_size=None):
+        scan = self.scans.get(scan_id)
+        if scan is None:
+            return
+        columns = scan.columns
+        first = columns.first_sequence
+        stop = (
+            columns.next_sequence if stop is None else min(stop, columns.next_sequence)
+        )
+        for sequence in range(max(start, first), stop):
+            if columns.cleared:
+                return
+            index = sequence - first
+            begin = columns.batch_ends[index - 1] if index else 0
+            end = columns.batch_ends[index]
+            metadata = {
+                "device": scan.devices[index],
+                "device_sequence": scan.device_sequences[index],
+                "received_at": scan.received_us[index] / 1_000_000,
+                "point_count": end - begin,
+            }
+            yield sequence, metadata, columns.records[begin:end]
+            if (sequence - start + 1) % (batch_size or STORE_READ_BATCHES) == 0:
+                await asyncio.sleep(0)
+
+    async def clear(self, scan_id):
+        scan = self.scans.get(scan_id)
+        if scan is None:
+            return 0
+        # Corta los recorridos en curso
+        scan.columns.cleared = True
+        first_sequence = scan.columns.next_sequence
+        self.scans[scan_id] = _MemoryScan(first_sequence)
+        return first_sequence
+
+
+class _FileScan:
+    __slots__ = (
+        "path",
+        "first_sequence",
+        "offsets",
+        "size",
+        "point_count",
+        "synced_at",
+    )
+
+    def __init__(self, path, first_sequence=0):
+        self.path = path
+        self.first_sequence = first_sequence
+        # Inicio de cada chunk; el fin del último es ``size``
+        self.offsets = array("Q")
+        self.size = 0
+        self.point_count = 0
+        self.synced_at = 0.0
+
+    @property
+    def next_sequence(self):
+        return self.first_sequence + len(self.offsets)
+
+    @property
+    def first_sequence_path(self):
+        return self.path.with_name(self.path.name + FILE_STORE_FIRST_SUFFIX)
+
+    def load(self):
+        """Indexa los chunks del archivo y recorta uno escrito a medias"""
+        if self.first_sequence_path.exists():
+            self.first_sequence = int(self.first_sequence_path.read_text())
+        if not self.path.exists():
+            return
+        with self.path.open("r+b") as fh:
+            file_size = fh.seek(0, os.SEEK_END)
+            offset = 0
+            while offset + CHUNK_HEADER.size <= file_size:
+                fh.seek(offset)
+                magic, _, _, point_count, *_ = CHUNK_HEADER.unpack(
+                    fh.read(CHUNK_HEADER.size)
+                )
+                chunk_size = (
+                    CHUNK_HEADER.size + point_count * POINT_RECORD_DTYPE.itemsize
+                )
+                if magic != CHUNK_MAGIC or offset + chunk_size > file_size:
+                    break
+                self.offsets.append(offset)
+                self.point_count += point_count
+                offset += chunk_size
+            if offset != file_size:
+                print(
+                    f"Archivo {self.path}: se descartan "
+                    f"{file_size - offset} bytes incompletos"
+                )
+                fh.truncate(offset)
+        self.size = offset
+
+
+class FileScanStore:
+    """Escaneos en archivos locales, sólo de anexado (ver ``RedisScanStore``).
+
+    Cada escaneo es ``<scan_id>.chunks`` en ``directory``: los mismos chunks
+    binarios que se guardan en Redis, uno detrás de otro. El índice de
+    chunks se arma al abrir cada escaneo leyendo sólo las cabeceras; si el
+    escaneo se limpió alguna vez, ``<scan_id>.chunks.first`` guarda la
+    secuencia de su primer chunk. El registro de escaneos es ``scans.tsv``
+    (id y hora de inicio por línea).
+    La E/S corre en un hilo; ``fsync`` se hace a lo sumo una vez por segundo
+    por archivo y al cerrar.
+    """
+
+    name = "file"
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.scans = {}
+        self.registry = {}
+        self._lock = asyncio.Lock()
+
+    def _path(self, scan_id):
+        return self.directory / f"{scan_id}{FILE_STORE_SUFFIX}"
+
+    async def open(self):
+        await asyncio.to_thread(self._open)
+
+    def _open(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for leftover in self.directory.glob(f"*{FILE_STORE_SUFFIX}.deleting-*"):
+            leftover.unlink(missing_ok=True)
+        registry = self.directory / FILE_STORE_SCANS
+        if registry.exists():
+            for line in registry.read_text(encoding="utf-8").splitlines():
+                scan_id, _, started_at = line.partition("\t")
+                if scan_id and started_at:
+                    self.registry.setdefault(scan_id, float(started_at))
+
+    async def close(self):
+        async with self._lock:
+            await asyncio.to_thread(self._sync_all)
+
+    def _sync_all(self):
+        for scan in self.scans.values():
+            if scan.path.exists():
+                with scan.path.open("rb") as fh:
+                    os.fsync(fh.fileno())
+
+    async def _scan(self, scan_id):
+        scan = self.scans.get(scan_id)
+        if scan is None:
+            scan = _FileScan(self._path(scan_id))
+            await asyncio.to_thread(scan.load)
+            self.scans[scan_id] = scan
+        return scan
+
+    async def register_scan(self, scan_id, started_at):
+        if scan_id in self.registry:
+            return False
+        self.registry[scan_id] = started_at
+        async with self._lock:
+            await asyncio.to_thread(self._append_registry, scan_id, started_at)
+        return True
+
+    def _append_registry(self, scan_id, started_at):
+        with (self.directory / FILE_STORE_SCANS).open("a", encoding="utf-8") as fh:
+            fh.write(f"{scan_id}\t{started_at!r}\n")
+
+    async def list_scans(self):
+        return sorted(self.registry.items(), key=lambda entry: entry[1])
+
+    async def append_batches(self, batches):
+        """Un ``write`` por escaneo; el índice se actualiza tras escribir"""
+        async with self._lock:
+            writes = {}
+            for batch in batches:
+                scan = await self._scan(batch.scan_id)
+                writes.setdefault(scan, []).append((batch, encode_chunk(batch)))
+            await asyncio.to_thread(self._write, writes)
+
+            for scan, pending in writes.items():
+                for batch, chunk in pending:
+                    batch.sequence = scan.next_sequence
+                    scan.offsets.append(scan.size)
+                    scan.size += len(chunk)
+                    scan.point_count += len(batch)
+        return batches
+
+    def _write(self, writes):
+        now = time.monotonic()
+        for scan, pending in writes.items():
+            with scan.path.open("ab") as fh:
+                fh.write(b"".join(chunk for _, chunk in pending))
+                fh.flush()
+                if now - scan.synced_at >= FILE_STORE_FSYNC_INTERVAL_S:
+                    os.fsync(fh.fileno())
+                    scan.synced_at = now
+
+    async def append_batch(self, batch):
+        await self.append_batches([batch])
+        return batch.sequence
+
+    async def extent(self, scan_id):
+        scan = await self._scan(scan_id)
+        return scan.first_sequence, len(scan.offsets), scan.point_count
+
+    async def iter_chunks(self, scan_id, start=0, stop=None, batch_size=None):
+        batch_size = batch_size or STORE_READ_BATCHES
+        scan = await self._scan(scan_id)
+        cursor = max(start, scan.first_sequence)
+        while True:
+            # El escaneo pudo limpiarse (reemplazarse) mientras se recorría
+            if self.scans.get(scan_id) is not scan:
+                return
+            last = min(cursor + batch_size, scan.next_sequence)
+            if stop is not None:
+                last = min(last, stop)
+            if cursor >= last:
+                return
+
+            first, end_index = cursor - scan.first_sequence, last - scan.first_sequence
+            offsets = scan.offsets[first:end_index]
+            end = (
+                scan.offsets[end_index] if end_index < len(scan.offsets) else scan.size
+            )
+            data = await asyncio.to_thread(self._read, scan.path, offsets[0], end)
+            bounds = [offset - offsets[0] for offset in offsets] + [end - offsets[0]]
+            view = memoryview(data)
+            chunks = [view[bounds[i] : bounds[i + 1]] for i in range(len(offsets))]
+            for chunk in _decode_chunks(chunks, cursor):
+                yield chunk
+            cursor = last
+
+    @staticmethod
+    def _read(path, start, end):
+        with path.open("rb") as fh:
+            fh.seek(start)
+            return fh.read(end - start)
+
+    async def clear(self, scan_id):
+        """Aparta el archivo con un rename y lo borra en un hilo.
+
+        Antes se guarda la primera secuencia de los chunks siguientes, así que
+        un corte a mitad de camino no reutiliza secuencias.
+        """
+        async with self._lock:
+            old = await self._scan(scan_id)
+            scan = self.scans[scan_id] = _FileScan(old.path, old.next_sequence)
+            path = self._path(scan_id)
+            doomed = path.with_name(f"{path.name}.deleting-{time.time_ns()}")
+            await asyncio.to_thread(self._clear_files, scan, doomed)
+        return scan.first_sequence
+
+    @staticmethod
+    def _clear_files(scan, doomed):
+        first_path = scan.first_sequence_path
+        pending = first_path.with_name(first_path.name + ".tmp")
+        with pending.open("w", encoding="utf-8") as fh:
+            fh.write(str(scan.first_sequence))
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(pending, first_path)
+
+        path = scan.path
+        try:
+            path.rename(doomed)
+        except FileNotFoundError:
+            return
+        doomed.unlink()
+
+
+def create_scan_store(backend, redis_client=None, directory=None):
+    if backend == "redis":
+        return RedisScanStore(redis_client)
+    if backend == "file":
+        return FileScanStore(directory)
+    if backend == "memory":
+        return MemoryScanStore()
+    raise ValueError(f"unknown storage backend: {backend}")
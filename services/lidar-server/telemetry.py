@@ -0,0 +1,84 @@
+import asyncio
+import csv
+from collections import deque
+
+
+class TelemetrySink:
+    """Anillo en memoria de filas CSV con volcado asíncrono a disco.
+
+    ``append`` sólo guarda la fila; una tarea de fondo escribe el anillo cada
+    ``flush_interval_ms`` o en cuanto junta ``flush_rows`` filas, y la E/S de
+    archivo corre en un hilo para no bloquear el event loop. Si el anillo se
+    llena antes de volcarse se descartan las filas más viejas.
+    """
+
+    def __init__(
+        self, path, header, flush_interval_ms=1000, flush_rows=500, ring_size=10000
+    ):
+        self.path = path
+        self.header = list(header)
+        self.flush_interval_s = flush_interval_ms / 1000
+        self.flush_rows = flush_rows
+        self.rows = deque(maxlen=ring_size)
+        self.dropped_rows = 0
+        self.written_rows = 0
+        self.on_flush = None
+        self._wakeup = asyncio.Event()
+        self._header_written = False
+        self._task = None
+
+    def append(self, row):
+        if len(self.rows) == self.rows.maxlen:
+            self.dropped_rows += 1
+        self.rows.append(row)
+        if len(self.rows) >= self.flush_rows:
+            self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval_s)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        if not self.rows:
+            return
+
+        rows = list(self.rows)
+        self.rows.clear()
+        try:
+            await asyncio.to_thread(self._write_rows, rows)
+            self.written_rows += len(rows)
+        except Exception as e:
+            print(f"Error escribiendo telemetría en {self.path}: {e}")
+
+        if self.on_flush is not None:
+            self.on_flush(rows)
+
+    def _write_rows(self, rows):
+        if not self._header_written:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            if not (self.path.exists() and self.path.stat().st_size > 0):
+                with self.path.open("w", newline="", encoding="utf-8") as fh:
+                    csv.writer(fh).writerow(self.header)
+            self._header_written = True
+
+        with self.path.open("a", newline="", encoding="utf-8") as fh:
+            csv.writer(fh).writerows(rows)
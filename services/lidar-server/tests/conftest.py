@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Los módulos del servidor son planos: se importan desde services/lidar-server
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
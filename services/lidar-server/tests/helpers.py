@@ -0,0 +1,354 @@
+"""Entradas de prueba compartidas por los tests y ``bench.py``.
+
+Todo es determinista: las mismas semillas dan los mismos datos.
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+import random
+import struct
+
+import numpy as np
+
+import main
+import parse
+from fanout import WebClient
+from point_batch import (
+    POINT_RECORD_DTYPE,
+    WEB_FRAME_HEADER,
+    WEB_FRAME_PROGRESS,
+    WEB_FRAME_TYPES,
+    PointBatch,
+)
+import sensor_protocol
+
+DEFAULT_SEED = 1234
+
+
+def make_point_batch(point_count, seed=DEFAULT_SEED):
+    rng = np.random.default_rng(seed)
+    return PointBatch(
+        rng.integers(-900, 900, point_count) / 10.0,
+        rng.integers(0, 3600, point_count) / 10.0,
+        rng.uniform(20, 12000, point_count),
+        rng.integers(0, 256, point_count),
+    )
+
+
+def convert_scalar_loop(batch, wheel_base=main.WHEEL_BASE):
+    """Conversión original: seis llamadas a ``math`` y un dict por punto"""
+    points = []
+    for inclination, pan_angle, distance, intensity in zip(
+        batch.inclination.tolist(),
+        batch.pan_angle.tolist(),
+        batch.distance.tolist(),
+        batch.intensity.tolist(),
+    ):
+        x, y, z = main.convert_to_cartesian(inclination, pan_angle, distance, wheel_base)
+        points.append(
+            {"intensity": intensity, "x": round(x, 2), "y": round(y, 2), "z": round(z, 2)}
+        )
+    return points
+
+
+def process_quietly(batch):
+    """``process_sensor_points`` sin la salida por consola"""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return main.process_sensor_points(batch)
+
+
+def make_stage_batches(batch_size, count, scan_id):
+    batches = []
+    for sequence in range(count):
+        batch = process_quietly(make_point_batch(batch_size, seed=sequence))
+        batch.device = "192.168.1.50:51234"
+        batch.device_sequence = sequence
+        batch.received_at = 1_700_000_000.0 + sequence
+        batch.scan_id = scan_id
+        batches.append(batch)
+    return batches
+
+
+def make_binary_payload(point_count, inclination_tenths=450, seed=DEFAULT_SEED):
+    rng = random.Random(seed)
+    payload = bytearray(
+        struct.pack(
+            "<2sBBhH",
+            sensor_protocol.BINARY_BATCH_MAGIC,
+            sensor_protocol.BINARY_BATCH_VERSION,
+            0,
+            inclination_tenths,
+            point_count,
+        )
+    )
+    for _ in range(point_count):
+        payload += struct.pack(
+            "<HBH", rng.randrange(20, 12000), rng.randrange(256), rng.randrange(3600)
+        )
+    return bytes(payload)
+
+
+def format_text_value(rng, value):
+    """Número como lo podría escribir el firmware (entero, decimal, exponente)"""
+    style = rng.randrange(4)
+    if style == 0:
+        return str(int(value))
+    if style == 1:
+        return f"{value:.1f}"
+    if style == 2:
+        return f"{value:.3f}"
+    return f"{value:g}"
+
+
+def make_text_message(point_count, groups=4, seed=DEFAULT_SEED, rng=None):
+    """Mensaje de texto legado con ``groups`` cambios de inclinación"""
+    rng = rng or random.Random(seed)
+    inclination = rng.uniform(-90, 90)
+    tokens = [[format_text_value(rng, inclination)]]
+    per_group = point_count // groups
+    for group_index in range(groups):
+        group = []
+        count = per_group if group_index < groups - 1 else point_count - per_group * (
+            groups - 1
+        )
+        for _ in range(count):
+            group += [
+                format_text_value(rng, rng.uniform(20, 12000)),
+                format_text_value(rng, rng.randrange(256)),
+                format_text_value(rng, rng.uniform(0, 360)),
+            ]
+        if group_index < groups - 1:
+            group.append(format_text_value(rng, rng.uniform(-90, 90)))
+        tokens.append(group)
+    return "|".join(";".join(group) for group in tokens)
+
+
+def make_fuzz_text_message(rng):
+    """Mensaje aleatorio: casi siempre válido, a veces con tokens rotos"""
+    groups = []
+    for group_index in range(rng.randrange(1, 6)):
+        group = [
+            format_text_value(rng, rng.uniform(-1e4, 1e4))
+            for _ in range(rng.randrange(0 if group_index else 1, 14))
+        ]
+        groups.append(group)
+    if rng.random() < 0.3:
+        group = rng.choice(groups)
+        position = rng.randrange(len(group) + 1)
+        group.insert(
+            position,
+            rng.choice(["", " ", "\t", "abc", "1e", "nan", " 7 ", "1_0", "-"]),
+        )
+    message = "|".join(";".join(group) for group in groups)
+    if rng.random() < 0.1:
+        message = rng.choice(["|", " ", "\n", ";"]) + message
+    if rng.random() < 0.1:
+        message += rng.choice(["|", " ", "\n", ";"])
+    return message
+
+
+def make_json_message(point_count, seed=DEFAULT_SEED):
+    """Mensaje JSON del sensor como lo arma ``experiments/ld19/network_exp.py``"""
+    rng = random.Random(seed)
+    points = [
+        {
+            "a": round(rng.uniform(0, 360), 1),
+            "d": rng.randrange(20, 12000),
+            "i": rng.randrange(256),
+        }
+        for _ in range(point_count)
+    ]
+    return json.dumps({"inclination": round(rng.uniform(-90, 90), 1), "points": points})
+
+
+def make_mixed_traffic(message_count=1000, points=100, seed=DEFAULT_SEED):
+    """Tramas mezcladas como las que recibe ``server()``: texto, binario, JSON"""
+    rng = random.Random(seed)
+    kinds = ["text"] * 4 + ["binary"] * 3 + ["json"] * 2 + ["web"]
+    messages = []
+    for index in range(message_count):
+        kind = rng.choice(kinds)
+        if kind == "text":
+            messages.append(make_text_message(points, seed=index))
+        elif kind == "binary":
+            messages.append(make_binary_payload(points, seed=index))
+        elif kind == "json":
+            messages.append(make_json_message(points, seed=index))
+        else:
+            messages.append(json.dumps({"type": "list_scans"}))
+    return messages
+
+
+def route_speculative(message, decode):
+    """Ruteo original: todo texto intenta decodificarse como JSON primero"""
+    if isinstance(message, bytes):
+        return "binary"
+    try:
+        data = decode(message)
+    except ValueError:
+        data = None
+    if parse.is_sensor_json(data):
+        return "json"
+    if data and isinstance(data, dict):
+        return "web"
+    if ";" in message:
+        return "text"
+    return "unknown"
+
+
+def route_sniffed(message, decode):
+    message_format = main.classify_message(message)
+    if message_format != "json":
+        return message_format
+    data = decode(message)
+    return "json" if parse.is_sensor_json(data) else "web"
+
+
+def _fuzz_json_value(rng):
+    return rng.choice(
+        [rng.uniform(-1e3, 1e3), rng.randrange(1000), None, "12.5", "x", True]
+    )
+
+
+def make_fuzz_json_message(rng):
+    """Mensaje JSON del sensor con valores a veces nulos, de otro tipo o faltantes"""
+    message = {}
+    for key in ("inclination", "servo_deg"):
+        if rng.random() < 0.5:
+            message[key] = (
+                _fuzz_json_value(rng) if rng.random() < 0.3 else rng.uniform(-90, 90)
+            )
+    points = []
+    for _ in range(rng.randrange(5)):
+        point = {}
+        for key in ("a", "d", "i"):
+            if rng.random() < 0.95:
+                point[key] = (
+                    _fuzz_json_value(rng) if rng.random() < 0.1 else rng.uniform(0, 360)
+                )
+        if rng.random() < 0.05:
+            key = rng.choice(["pan_angle", "distance", "intensity", "inclination"])
+            point[key] = _fuzz_json_value(rng)
+        points.append(point)
+    message["points"] = points
+    return json.dumps(message)
+
+
+def parse_text_v2(message):
+    """Variante alternativa que vivía en ``parse.py`` (lista de dicts)"""
+    try:
+        all_points = []
+        current_inclination = None
+
+        groups = message.strip().split("|")
+
+        for group in groups:
+            if not group:
+                continue
+
+            parts = group.split(";")
+
+            if current_inclination is None:
+                current_inclination = float(parts[0])
+                parts = parts[1:]
+
+            i = 0
+            while i + 2 < len(parts):
+                try:
+                    distance = float(parts[i])
+                    intensity = float(parts[i + 1])
+                    angle = float(parts[i + 2])
+
+                    all_points.append(
+                        {
+                            "inclination": current_inclination,
+                            "distance": distance,
+                            "intensity": intensity,
+                            "pan_angle": angle,
+                        }
+                    )
+
+                    i += 3
+                except ValueError:
+                    i += 1
+                    continue
+
+            if i < len(parts):
+                try:
+                    current_inclination = float(parts[i])
+                except ValueError:
+                    pass
+
+        return all_points
+
+    except Exception as e:
+        print(f"Error parseando datos del sensor: {e}")
+        return []
+
+
+class NullSocket:
+    """WebSocket en memoria que descarta lo enviado"""
+
+    remote_address = ("127.0.0.1", 0)
+
+    def __init__(self):
+        self.sent_bytes = 0
+
+    async def send(self, message):
+        self.sent_bytes += len(message)
+
+    async def close(self, code=None, reason=""):
+        pass
+
+
+class RecordingSocket(NullSocket):
+    """``NullSocket`` que además guarda lo enviado"""
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    async def send(self, message):
+        await super().send(message)
+        self.messages.append(message)
+
+
+def decode_web_frames(messages):
+    """``(resync, tipos, registros, última secuencia)`` de una suscripción binaria"""
+    frame_types = {value: name for name, value in WEB_FRAME_TYPES.items()}
+    resync = None
+    types = []
+    records = []
+    last_sequence = None
+    for message in messages:
+        if isinstance(message, str):
+            data = json.loads(message)
+            if data["type"] == "scan_subscribed":
+                resync = data["data"]["resync"]
+            continue
+        _, _, frame_type, count, sequence = WEB_FRAME_HEADER.unpack_from(message, 0)
+        offset = WEB_FRAME_HEADER.size
+        if frame_types[frame_type] != "new_points":
+            offset += WEB_FRAME_PROGRESS.size
+        types.append(frame_types[frame_type])
+        records.append(
+            np.frombuffer(message, dtype=POINT_RECORD_DTYPE, count=count, offset=offset)
+        )
+        last_sequence = sequence
+    records = np.concatenate(records) if records else np.empty(0, POINT_RECORD_DTYPE)
+    return resync, types, records, last_sequence
+
+
+async def reconnect(scan_id, since):
+    """Suscribe un cliente binario con ``since`` y espera a que se ponga al día"""
+    ws = RecordingSocket()
+    client = WebClient(ws, "binary")
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        await main.subscribe_web_client(client, scan_id, since=since)
+    client.start()
+    while client.snapshot is not None or client.pending:
+        await asyncio.sleep(0)
+    await client.close()
+    return ws
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+import main
+from point_batch import CARTESIAN_COLUMNS
+from tests.helpers import convert_scalar_loop, make_point_batch
+
+POINT_COUNT = 100000
+
+
+@pytest.mark.parametrize("wheel_base", [0.0, main.WHEEL_BASE, 42.5])
+def test_batch_matches_scalar_conversion(wheel_base):
+    batch = make_point_batch(POINT_COUNT)
+    x, y, z = main.convert_to_cartesian_batch(
+        batch.inclination, batch.pan_angle, batch.distance, wheel_base
+    )
+    expected = np.array(
+        [
+            main.convert_to_cartesian(inclination, pan_angle, distance, wheel_base)
+            for inclination, pan_angle, distance in zip(
+                batch.inclination.tolist(),
+                batch.pan_angle.tolist(),
+                batch.distance.tolist(),
+            )
+        ]
+    )
+    assert np.abs(np.column_stack((x, y, z)) - expected).max() < 1e-6
+
+
+def test_quantized_points_match_rounded_dicts():
+    # La cuantización sólo puede diferir de round() en el último decimal.
+    scalar = convert_scalar_loop(make_point_batch(POINT_COUNT))
+    processed = main.process_sensor_points(make_point_batch(POINT_COUNT))
+    for axis in CARTESIAN_COLUMNS:
+        expected = np.array([point[axis] for point in scalar])
+        assert np.abs(getattr(processed, axis) - expected).max() <= 0.01 + 1e-9
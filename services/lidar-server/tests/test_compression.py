@@ -0,0 +1,91 @@
+import asyncio
+import zlib
+
+import numpy as np
+import pytest
+
+import main
+import sensor_protocol
+from payload_codecs import (
+    CODEC_IDS,
+    PayloadDecompressor,
+    available_codecs,
+    compress,
+)
+from tests.helpers import RecordingSocket, make_binary_payload
+
+CODECS = available_codecs()
+HEADER_SIZE = sensor_protocol.BINARY_BATCH_HEADER_SIZE
+
+
+def decode_frame(payload):
+    ws = RecordingSocket()
+    frame = main.SensorFrame(ws, "device", 0, 0.0, "binary", payload, "test-scan")
+    return ws, main.decode_sensor_frame(frame)
+
+
+def assert_rejected(payload):
+    """La trama se descarta y el dispositivo recibe ERROR:PARSE_FAILED"""
+
+    async def run():
+        ws, frame = decode_frame(payload)
+        assert frame is None
+        await main.error_replies.pop(ws)
+        return ws.messages
+
+    assert asyncio.run(run()) == ["ERROR:PARSE_FAILED"]
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_compressed_batch_round_trips(codec):
+    payload = make_binary_payload(500)
+    compressed = sensor_protocol.compress_binary_batch(payload, CODEC_IDS[codec])
+    assert sensor_protocol.binary_batch_codec(compressed) == CODEC_IDS[codec]
+    assert bytes(sensor_protocol.decompress_binary_batch(compressed)) == payload
+
+    _, frame = decode_frame(compressed)
+    expected = sensor_protocol.parse_binary_sensor_data(payload)
+    assert np.array_equal(frame.batch.distance, expected.distance)
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_output_over_max_size_is_rejected(codec):
+    decompressor = PayloadDecompressor()
+    data = compress(CODEC_IDS[codec], bytes(1001))
+    assert len(decompressor.decompress(CODEC_IDS[codec], data, 1001)) == 1001
+    with pytest.raises(ValueError):
+        decompressor.decompress(CODEC_IDS[codec], data, 1000)
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_decompression_bomb_gets_error_reply(codec, capsys):
+    header = make_binary_payload(0)
+    body = bytes(sensor_protocol.BINARY_BATCH_MAX_BODY_SIZE + 1)
+    assert_rejected(sensor_protocol.compress_binary_batch(header + body, CODEC_IDS[codec]))
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_truncated_payload_gets_error_reply(codec, capsys):
+    compressed = sensor_protocol.compress_binary_batch(
+        make_binary_payload(500), CODEC_IDS[codec]
+    )
+    assert_rejected(compressed[: len(compressed) - 10])
+    assert_rejected(compressed[:HEADER_SIZE])
+    assert_rejected(compressed[: HEADER_SIZE - 1])
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_corrupt_payload_gets_error_reply(codec, capsys):
+    compressed = bytearray(
+        sensor_protocol.compress_binary_batch(make_binary_payload(500), CODEC_IDS[codec])
+    )
+    compressed[HEADER_SIZE:] = bytes(len(compressed) - HEADER_SIZE)
+    assert_rejected(bytes(compressed))
+
+
+@pytest.mark.parametrize("codec_id", [4, 9, 15])
+def test_unknown_codec_nibble_gets_error_reply(codec_id, capsys):
+    payload = make_binary_payload(10)
+    body = zlib.compress(payload[HEADER_SIZE:])
+    flags = codec_id << sensor_protocol.BINARY_FLAG_CODEC_SHIFT
+    assert_rejected(payload[:3] + bytes([flags]) + payload[4:HEADER_SIZE] + body)
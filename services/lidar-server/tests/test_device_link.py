@@ -0,0 +1,83 @@
+import pytest
+
+from device_link import LINK_MISSING_WINDOW, SEQUENCE_MODULUS, DeviceLink
+
+
+def observe(sequences):
+    link = DeviceLink()
+    for sequence in sequences:
+        link.observe(sequence, 0, 0.0)
+    return link
+
+
+def counters(link):
+    stats = link.stats()
+    return stats["lost"], stats["reordered"], stats["duplicated"], stats["resets"]
+
+
+def test_in_order_sequences_count_nothing():
+    link = observe(range(100))
+    assert link.stats()["received"] == 100
+    assert counters(link) == (0, 0, 0, 0)
+
+
+def test_gap_counts_lost_frames():
+    assert counters(observe([0, 1, 5, 6])) == (3, 0, 0, 0)
+
+
+def test_late_frame_is_reordered_not_lost():
+    link = observe([0, 1, 4, 2, 3, 5])
+    assert counters(link) == (0, 2, 0, 0)
+    assert not link.missing
+
+
+def test_repeated_sequences_are_duplicates():
+    # Repetida enseguida, repetida tarde y una tardía que llega dos veces
+    link = observe([10, 11, 11, 13, 12, 12, 11])
+    assert counters(link) == (0, 1, 3, 0)
+
+
+def test_zero_after_progress_is_a_reset():
+    link = observe([5, 6, 7, 0, 1, 2])
+    assert counters(link) == (0, 0, 0, 1)
+
+
+@pytest.mark.parametrize(
+    "sequences",
+    [
+        [SEQUENCE_MODULUS - 2, SEQUENCE_MODULUS - 1, 0, 1],
+        [SEQUENCE_MODULUS - 1, 0, 1, 2],
+    ],
+)
+def test_wraparound_is_not_a_reset_or_loss(sequences):
+    assert counters(observe(sequences)) == (0, 0, 0, 0)
+
+
+def test_gap_across_wraparound():
+    # Faltan M-2, M-1 y 0; llegan tarde las dos últimas
+    link = observe([SEQUENCE_MODULUS - 3, 1, SEQUENCE_MODULUS - 1, 0, 2])
+    assert counters(link) == (1, 2, 0, 0)
+    assert link.missing == {SEQUENCE_MODULUS - 2}
+
+
+def test_sequence_far_behind_is_a_duplicate():
+    link = observe([1000, 1001, 3])
+    assert counters(link) == (0, 0, 1, 0)
+
+
+def test_long_gap_only_remembers_recent_sequences():
+    gap = 3 * LINK_MISSING_WINDOW
+    link = observe([0, gap + 1, 1, gap])
+    assert len(link.missing) <= LINK_MISSING_WINDOW
+    # La más vieja del hueco ya se olvidó: cuenta como duplicada
+    assert counters(link) == (gap - 1, 1, 1, 0)
+
+
+def test_clock_offset_uses_fastest_frame():
+    link = DeviceLink()
+    assert link.observe(0, 1_000_000, 10.5) == pytest.approx(10.5)
+    # Llega con 200 ms más de demora que la anterior
+    assert link.observe(1, 1_100_000, 10.8) == pytest.approx(10.6)
+    # Una más rápida corrige el desfase hacia abajo
+    assert link.observe(2, 1_200_000, 10.6) == pytest.approx(10.6)
+    assert link.clock_offset_us == pytest.approx(9_400_000, abs=1)
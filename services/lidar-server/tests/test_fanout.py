@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from fanout import BroadcastMessage, WebClient
+from point_batch import POINT_RECORD_DTYPE
+
+MAX_QUEUE = 4
+
+
+def points(sequence):
+    return BroadcastMessage(
+        "new_points", np.zeros(10, dtype=POINT_RECORD_DTYPE), sequence=sequence
+    )
+
+
+def control(message_type):
+    return BroadcastMessage(message_type, {"scan_id": "test"})
+
+
+def queued_types(client):
+    return [message.message_type for message in client.pending]
+
+
+@pytest.mark.parametrize("policy", ["drop_oldest", "coalesce"])
+def test_full_queue_drops_points_before_control_messages(policy):
+    client = WebClient(None, max_queue=MAX_QUEUE, overflow_policy=policy)
+    assert client.enqueue(control("scan_cleared"))
+    assert client.enqueue(points(0))
+    assert client.enqueue(control("scan_started"))
+    assert client.enqueue(points(1))
+
+    assert client.enqueue(control("scan_subscribed"))
+    assert len(client.pending) <= MAX_QUEUE
+    types = queued_types(client)
+    assert types[0] == "scan_cleared" and "scan_started" in types
+    assert types[-1] == "scan_subscribed"
+    assert client.pending[types.index("new_points")].sequence == 1
+
+
+@pytest.mark.parametrize("policy", ["drop_oldest", "coalesce"])
+def test_queue_full_of_control_messages_disconnects(policy):
+    client = WebClient(None, max_queue=MAX_QUEUE, overflow_policy=policy)
+    for _ in range(MAX_QUEUE):
+        assert client.enqueue(control("scan_started"))
+
+    assert not client.enqueue(points(0))
+    assert queued_types(client) == ["scan_started"] * MAX_QUEUE
+    assert client.dropped == 0
+
+
+def test_drop_oldest_counts_dropped_points():
+    stats = {}
+    client = WebClient(None, max_queue=MAX_QUEUE, shared_stats=stats)
+    for sequence in range(MAX_QUEUE + 2):
+        assert client.enqueue(points(sequence))
+
+    assert [message.sequence for message in client.pending] == [2, 3, 4, 5]
+    assert client.dropped == stats["web_dropped_messages"] == 2
+
+
+def test_disconnect_policy_never_drops():
+    client = WebClient(None, max_queue=MAX_QUEUE, overflow_policy="disconnect")
+    for sequence in range(MAX_QUEUE):
+        assert client.enqueue(points(sequence))
+    assert not client.enqueue(points(MAX_QUEUE))
+
+
+async def empty_snapshot():
+    return
+    yield
+
+
+def held_points(client):
+    return sum(len(message.data) for message in client.pending)
+
+
+@pytest.mark.parametrize("policy", ["drop_oldest", "coalesce", "disconnect"])
+def test_live_messages_held_during_snapshot_are_not_dropped(policy):
+    client = WebClient(None, max_queue=MAX_QUEUE, overflow_policy=policy)
+    client.attach_snapshot(empty_snapshot(), live_from_sequence=2)
+    for sequence in range(10 * MAX_QUEUE):
+        assert client.enqueue(points(sequence))
+
+    assert len(client.pending) <= MAX_QUEUE
+    assert client.dropped == 0
+    # Los dos primeros ya vienen en el snapshot
+    assert held_points(client) == 10 * (10 * MAX_QUEUE - 2)
+    assert client.pending[-1].sequence == 10 * MAX_QUEUE - 1
+
+
+def test_held_points_over_cap_disconnect():
+    client = WebClient(None, max_queue=MAX_QUEUE, max_held_points=100)
+    client.attach_snapshot(empty_snapshot(), live_from_sequence=0)
+    for sequence in range(10):
+        assert client.enqueue(points(sequence))
+
+    assert not client.enqueue(points(10))
+    assert client.dropped == 0
@@ -0,0 +1,35 @@
+import asyncio
+
+import main
+
+
+class StalledSocket:
+    """Dispositivo que nunca termina de recibir lo que se le envía"""
+
+    remote_address = ("127.0.0.1", 0)
+
+    def __init__(self):
+        self.attempts = 0
+
+    async def send(self, message):
+        self.attempts += 1
+        await asyncio.Event().wait()
+
+
+def bad_frame(ws):
+    return main.SensorFrame(ws, "device", 0, 0.0, "text", "x;y;z", "test-scan")
+
+
+def test_parse_failure_reply_does_not_block_decode():
+    async def run():
+        ws = StalledSocket()
+        for _ in range(3):
+            assert main.decode_sensor_frame(bad_frame(ws)) is None
+        await asyncio.sleep(0)
+        # Una sola respuesta en vuelo por conexión
+        assert ws.attempts == 1
+        reply = main.error_replies.pop(ws)
+        assert not reply.done()
+        reply.cancel()
+
+    asyncio.run(asyncio.wait_for(run(), timeout=5))
@@ -0,0 +1,132 @@
+import json
+import random
+
+import numpy as np
+import pytest
+
+import parse
+from point_batch import MEASUREMENT_COLUMNS
+from tests.helpers import (
+    make_json_message,
+    make_fuzz_json_message,
+    make_fuzz_text_message,
+    make_text_message,
+    parse_text_v2,
+)
+
+FUZZ_SEED = 1234
+FUZZ_MESSAGES = 5000
+JSON_DECODERS = parse.available_json_decoders()
+
+
+def assert_same_batch(left, right, message):
+    for name in MEASUREMENT_COLUMNS:
+        assert np.array_equal(
+            getattr(left, name), getattr(right, name), equal_nan=True
+        ), f"{name}: {message!r}"
+
+
+def test_bulk_parser_matches_token_parser_on_fuzz():
+    rng = random.Random(FUZZ_SEED)
+    for _ in range(FUZZ_MESSAGES):
+        message = make_fuzz_text_message(rng)
+        assert_same_batch(
+            parse.parse_sensor_data(message),
+            parse.parse_sensor_data_tokens(message),
+            message,
+        )
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "10;100;5;90; ;200;6;91",
+        "10;100;5;90;\t",
+        " ;10;100;5;90",
+        "10;100;5;90;;200;6;91",
+        "10;100;5;90|;200;6;91",
+        "10; 100 ;5;90",
+    ],
+)
+def test_blank_tokens_fall_back_to_token_parser(message):
+    batch = parse.parse_sensor_data(message)
+    assert_same_batch(batch, parse.parse_sensor_data_tokens(message), message)
+    assert not (batch.distance == -1.0).any()
+
+
+@pytest.mark.parametrize("point_count", [100, 1000, 10000])
+def test_valid_message_matches_v2(point_count):
+    message = make_text_message(point_count)
+    batch = parse.parse_sensor_data(message)
+    assert len(batch) == point_count
+    assert_same_batch(batch, parse.parse_sensor_data_tokens(message), message)
+    assert [point["distance"] for point in parse_text_v2(message)] == (
+        batch.distance.tolist()
+    )
+
+
+def parse_json_fields(message):
+    """Camino original: ``json.loads`` y ``float()`` por campo de cada punto"""
+    return parse.parse_json_sensor_data_fields(json.loads(message))
+
+
+@pytest.mark.parametrize("backend", JSON_DECODERS)
+def test_json_columns_match_field_parser_on_fuzz(backend, capsys):
+    decoder = parse.JsonMessageDecoder(backend)
+    rng = random.Random(FUZZ_SEED)
+    for _ in range(FUZZ_MESSAGES):
+        message = make_fuzz_json_message(rng)
+        assert_same_batch(
+            parse.parse_json_sensor_data(decoder.decode(message)),
+            parse_json_fields(message),
+            message,
+        )
+
+
+@pytest.mark.parametrize("backend", JSON_DECODERS)
+@pytest.mark.parametrize(
+    "message",
+    [
+        {"inclination": 5, "points": [{"a": None, "d": 7245, "i": 167}]},
+        {
+            "inclination": 5,
+            "points": [{"a": 1, "d": 2, "i": 3}, {"a": 1, "d": None, "i": 3}],
+        },
+        {"inclination": None, "points": [{"a": 1, "d": 2, "i": 3}]},
+        {"inclination": None, "servo_deg": 12, "points": [{"a": 1, "d": 2, "i": 3}]},
+        {"servo_deg": None, "points": [{"a": 1, "d": 2, "i": 3}]},
+    ],
+)
+def test_json_nulls_reject_the_message(backend, message, capsys):
+    decoder = parse.JsonMessageDecoder(backend)
+    batch = parse.parse_json_sensor_data(decoder.decode(json.dumps(message)))
+    assert len(batch) == 0
+    assert "Error parseando payload JSON" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("backend", JSON_DECODERS)
+@pytest.mark.parametrize(
+    "message",
+    [
+        make_json_message(50),
+        json.dumps({"servo_deg": 12, "points": [{"a": 1, "d": 2, "i": 3}]}),
+        json.dumps({"inclination": 5, "points": [{"pan_angle": 1, "d": 2, "i": 3}]}),
+        json.dumps({"points": [{"a": 1, "d": 2, "i": 3, "inclination": 7}]}),
+        json.dumps({"points": [{"a": "1.5", "d": 2, "i": 3}]}),
+        json.dumps({"points": [{"a": 1, "d": 2}]}),
+        json.dumps({"points": []}),
+    ],
+)
+def test_json_variants_match_field_parser(backend, message, capsys):
+    decoder = parse.JsonMessageDecoder(backend)
+    data = decoder.decode(message)
+    assert parse.is_sensor_json(data)
+    assert_same_batch(
+        parse.parse_json_sensor_data(data), parse_json_fields(message), message
+    )
+
+
+@pytest.mark.parametrize("backend", JSON_DECODERS)
+def test_web_client_json_is_not_sensor_json(backend):
+    decoder = parse.JsonMessageDecoder(backend)
+    assert not parse.is_sensor_json(decoder.decode('{"type": "register"}'))
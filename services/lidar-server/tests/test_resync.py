@@ -0,0 +1,113 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+import main
+from fanout import BroadcastMessage, WebClient
+from storage import MemoryScanStore
+from tests.helpers import (
+    RecordingSocket,
+    decode_web_frames,
+    make_stage_batches,
+    reconnect,
+)
+
+SCAN_ID = "test-resync"
+BATCH_SIZE = 100
+BATCH_COUNT = 60
+RESYNC_MAX_BATCHES = 20
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    monkeypatch.setattr(main, "RESYNC_MAX_BATCHES", RESYNC_MAX_BATCHES)
+    monkeypatch.setattr(main, "scan_store", MemoryScanStore())
+    batches = make_stage_batches(BATCH_SIZE, BATCH_COUNT, SCAN_ID)
+    asyncio.run(main.scan_store.append_batches(batches))
+    yield batches
+    main.scan_cache.scans.pop(SCAN_ID, None)
+
+
+def use_source(source, batches, first_sequence=0):
+    if source == "cache":
+        scan = main.scan_cache.reset(SCAN_ID, first_sequence)
+        main.scan_cache.append_batches(scan, batches)
+    else:
+        main.scan_cache.scans.pop(SCAN_ID, None)
+
+
+def resubscribe(since):
+    ws = asyncio.run(reconnect(SCAN_ID, since))
+    return decode_web_frames(ws.messages)
+
+
+@pytest.mark.parametrize("source", ["cache", "store"])
+@pytest.mark.parametrize("missed", [0, 10, RESYNC_MAX_BATCHES])
+def test_short_gap_resyncs_incrementally(batches, source, missed):
+    use_source(source, batches)
+    last = BATCH_COUNT - 1
+    resync, types, received, sequence = resubscribe(last - missed)
+    assert resync == "incremental"
+    assert set(types) <= {"new_points"}
+    records = np.concatenate([batch.to_records() for batch in batches])
+    assert np.array_equal(received, records[BATCH_SIZE * (BATCH_COUNT - missed) :])
+    if missed:
+        assert sequence == last
+
+
+@pytest.mark.parametrize("source", ["cache", "store"])
+@pytest.mark.parametrize(
+    "since",
+    # Demasiado atrás, o una secuencia que el escaneo no tiene
+    [BATCH_COUNT - RESYNC_MAX_BATCHES - 2, BATCH_COUNT + 5],
+)
+def test_unknown_gap_falls_back_to_snapshot(batches, source, since):
+    use_source(source, batches)
+    resync, types, received, sequence = resubscribe(since)
+    assert resync == "snapshot" and types[0] == "initial_state"
+    records = np.concatenate([batch.to_records() for batch in batches])
+    assert np.array_equal(received, records)
+    assert sequence == BATCH_COUNT - 1
+
+
+@pytest.mark.parametrize("source", ["cache", "store"])
+def test_client_that_missed_a_clear_gets_snapshot(batches, source):
+    # Aunque el escaneo ya tenga más batches que su ``since``
+    first_sequence = asyncio.run(main.scan_store.clear(SCAN_ID))
+    assert first_sequence == BATCH_COUNT
+    fresh = make_stage_batches(BATCH_SIZE, 20, SCAN_ID)
+    asyncio.run(main.scan_store.append_batches(fresh))
+    use_source(source, fresh, first_sequence)
+
+    resync, types, received, sequence = resubscribe(10)
+    assert resync == "snapshot" and types[0] == "initial_state"
+    assert np.array_equal(received, np.concatenate([b.to_records() for b in fresh]))
+    assert sequence == first_sequence + len(fresh) - 1
+
+
+@pytest.mark.parametrize("source", ["cache", "store"])
+def test_live_batches_during_snapshot_survive_a_full_queue(batches, source):
+    use_source(source, batches)
+    live = make_stage_batches(BATCH_SIZE, 30, SCAN_ID)
+
+    async def subscribe():
+        ws = RecordingSocket()
+        client = WebClient(ws, "binary", max_queue=4)
+        await main.subscribe_web_client(client, SCAN_ID)
+        # Llegan en vivo antes de que el cliente reciba su initial_state
+        await main.scan_store.append_batches(live)
+        for batch in live:
+            assert client.enqueue(BroadcastMessage("new_points", batch))
+        client.start()
+        while client.snapshot is not None or client.pending:
+            await asyncio.sleep(0)
+        await client.close()
+        return ws, client
+
+    ws, client = asyncio.run(subscribe())
+    resync, types, received, sequence = decode_web_frames(ws.messages)
+    assert client.dropped == 0
+    expected = np.concatenate([batch.to_records() for batch in batches + live])
+    assert np.array_equal(received, expected)
+    assert sequence == BATCH_COUNT + len(live) - 1
@@ -0,0 +1,110 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+import main
+from point_batch import POINT_RECORD_DTYPE
+from scan_cache import ScanCache
+from storage import MemoryScanStore
+from tests.helpers import make_stage_batches
+from voxel_lod import VoxelLods
+
+RECORDS = np.zeros(1000, dtype=POINT_RECORD_DTYPE)
+
+
+def fill(cache, scan_id, sequences):
+    scan = cache.scan(scan_id)
+    for sequence in sequences:
+        assert scan.append(sequence, RECORDS)
+    cache.enforce_limit()
+    return scan
+
+
+def test_appending_keeps_the_live_scan_from_eviction():
+    cache = ScanCache(max_bytes=10**9)
+    fill(cache, "live", range(4))
+    fill(cache, "old", range(4))
+    assert cache.get("old") is not None
+
+    # Sólo se anexa al escaneo en vivo; nadie lo lee con get()
+    cache.max_bytes = cache.nbytes + RECORDS.nbytes
+    live = fill(cache, "live", range(4, 6))
+    assert live.complete
+    assert list(cache.scans) == ["live"]
+    assert cache.evictions == 1
+
+
+def test_get_marks_scan_as_recent():
+    cache = ScanCache(max_bytes=10**9)
+    fill(cache, "a", range(2))
+    fill(cache, "b", range(2))
+    assert cache.get("a") is not None
+    assert list(cache.scans) == ["b", "a"]
+
+
+def test_lods_count_toward_the_limit_and_leave_with_their_scan():
+    cache = ScanCache(max_bytes=10**9)
+    fill(cache, "old", range(2))
+    cache.lods["old"] = VoxelLods((20.0,))
+    cache.lods["old"].add(make_stage_batches(1000, 1, "old")[0].to_records())
+    fill(cache, "live", range(2))
+    assert cache.stats()["lod_bytes"] == cache.lods["old"].nbytes > 0
+
+    cache.max_bytes = cache.nbytes - 1
+    cache.enforce_limit()
+    assert list(cache.scans) == ["live"]
+    assert cache.lods == {}
+    assert cache.evictions == 1
+
+
+def test_disabled_cache_keeps_lods():
+    cache = ScanCache(max_bytes=0)
+    cache.scan("a")
+    cache.lods["a"] = VoxelLods((20.0,))
+    cache.lods["a"].add(RECORDS)
+    cache.enforce_limit()
+    assert "a" in cache.lods
+
+
+@pytest.fixture
+def stored_scan(monkeypatch):
+    scan_id = "test-lods"
+    monkeypatch.setattr(main, "VOXEL_LOD_SIZES_MM", (20.0,))
+    monkeypatch.setattr(main, "scan_store", MemoryScanStore())
+    batches = make_stage_batches(500, 8, scan_id)
+    asyncio.run(main.scan_store.append_batches(batches))
+    records = np.concatenate([batch.to_records() for batch in batches])
+    expected = VoxelLods((20.0,))
+    expected.add(records)
+    yield scan_id, expected.grids[20.0].centroids()
+    main.scan_cache.scans.pop(scan_id, None)
+    main.scan_lods.pop(scan_id, None)
+
+
+def restored_centroids(scan_id):
+    asyncio.run(main.restore_scan_lods(scan_id))
+    return main.scan_lods[scan_id].grids[20.0].centroids()
+
+
+def same_centroids(a, b):
+    # El orden de los vóxeles depende de cómo se agruparon los batches
+    a, b = np.sort(a, order=["x", "y", "z"]), np.sort(b, order=["x", "y", "z"])
+    return len(a) == len(b) and all(
+        np.allclose(a[name], b[name], atol=0.01) for name in ("x", "y", "z")
+    )
+
+
+def test_resumed_scan_rebuilds_lods_from_the_cache(stored_scan, capsys):
+    scan_id, expected = stored_scan
+    asyncio.run(main.load_scan(scan_id))
+    main.scan_lods.pop(scan_id)
+    assert same_centroids(restored_centroids(scan_id), expected)
+    assert "reconstruidos desde la caché" in capsys.readouterr().out
+
+
+def test_resumed_scan_rebuilds_lods_from_the_store(stored_scan):
+    scan_id, expected = stored_scan
+    main.scan_cache.scans.pop(scan_id, None)
+    assert same_centroids(restored_centroids(scan_id), expected)
+    assert main.scan_cache.get(scan_id) is not None
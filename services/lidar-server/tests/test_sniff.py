@@ -0,0 +1,31 @@
+import pytest
+
+import main
+import parse
+from tests.helpers import make_mixed_traffic, route_sniffed, route_speculative
+
+
+@pytest.mark.parametrize("backend", parse.available_json_decoders())
+def test_sniffing_routes_like_speculative_json(backend):
+    decode = parse.JsonMessageDecoder(backend).decode
+    messages = make_mixed_traffic()
+    routes = [route_sniffed(message, decode) for message in messages]
+    assert routes == [route_speculative(message, decode) for message in messages]
+    assert set(routes) == {"text", "binary", "json", "web"}
+
+
+@pytest.mark.parametrize(
+    ("message", "message_format"),
+    [
+        (b"PS\x01\x00", "binary"),
+        (b"\x00\x01", "unknown"),
+        ('  {"type": "list_scans"}', "json"),
+        ("12.5;100;5;90", "text"),
+        ("-3;100;5;90", "text"),
+        (".5;100;5;90", "text"),
+        ("hola", "unknown"),
+        ("", "unknown"),
+    ],
+)
+def test_classify_message(message, message_format):
+    assert main.classify_message(message) == message_format
@@ -0,0 +1,174 @@
+import asyncio
+
+import fakeredis
+import numpy as np
+import pytest
+
+from point_batch import encode_chunk
+from storage import (
+    FILE_STORE_SUFFIX,
+    STORAGE_BACKENDS,
+    RedisScanStore,
+    create_scan_store,
+)
+from tests.helpers import make_stage_batches
+
+BATCH_SIZE = 100
+
+
+async def collect_chunks(store, scan_id, start=0, stop=None, batch_size=None):
+    return [
+        chunk
+        async for chunk in store.iter_chunks(scan_id, start, stop, batch_size)
+    ]
+
+
+async def open_store(backend, directory):
+    if backend == "redis":
+        store = RedisScanStore(fakeredis.aioredis.FakeRedis())
+    else:
+        store = create_scan_store(backend, directory=directory)
+    await store.open()
+    return store
+
+
+async def close_store(store):
+    await store.close()
+    if isinstance(store, RedisScanStore):
+        await store.client.aclose()
+
+
+def run_with_store(backend, directory, check):
+    async def run():
+        store = await open_store(backend, directory)
+        try:
+            await check(store)
+        finally:
+            await close_store(store)
+
+    asyncio.run(run())
+
+
+@pytest.fixture(params=STORAGE_BACKENDS)
+def with_store(request, tmp_path):
+    return lambda check: run_with_store(request.param, tmp_path, check)
+
+
+@pytest.fixture
+def batches_a():
+    return make_stage_batches(BATCH_SIZE, 10, "test-a")
+
+
+@pytest.fixture
+def batches_b():
+    return make_stage_batches(BATCH_SIZE, 1, "test-b")
+
+
+def test_register_scan_keeps_start_order(with_store):
+    async def check(store):
+        assert await store.register_scan("test-a", 1_700_000_000.0)
+        assert await store.register_scan("test-b", 1_700_000_001.0)
+        assert not await store.register_scan("test-a", 1_700_000_002.0)
+        scans = [scan_id for scan_id, _ in await store.list_scans()]
+        assert scans.index("test-a") < scans.index("test-b")
+
+    with_store(check)
+
+
+def test_append_assigns_sequences_per_scan(with_store, batches_a, batches_b):
+    async def check(store):
+        # Escaneos intercalados en la misma escritura
+        await store.append_batches([batches_a[0], batches_b[0], batches_a[1]])
+        assert (batches_a[0].sequence, batches_b[0].sequence) == (0, 0)
+        assert batches_a[1].sequence == 1
+        for batch in batches_a[2:]:
+            assert await store.append_batch(batch) == batch.sequence
+        assert [batch.sequence for batch in batches_a] == list(range(10))
+
+        points = sum(len(batch) for batch in batches_a)
+        assert await store.extent("test-a") == (0, 10, points)
+        assert await store.extent("test-b") == (0, 1, len(batches_b[0]))
+        assert await store.extent("test-missing") == (0, 0, 0)
+
+    with_store(check)
+
+
+def test_iter_chunks_returns_records_and_metadata(with_store, batches_a):
+    async def check(store):
+        await store.append_batches(batches_a)
+        chunks = await collect_chunks(store, "test-a", batch_size=3)
+        assert [sequence for sequence, _, _ in chunks] == list(range(10))
+        for (_, metadata, records), batch in zip(chunks, batches_a):
+            assert np.array_equal(records, batch.to_records())
+            assert metadata["device"] == batch.device
+            assert metadata["device_sequence"] == batch.device_sequence
+            assert metadata["point_count"] == len(batch)
+            assert abs(metadata["received_at"] - batch.received_at) < 1e-5
+
+        ranged = await collect_chunks(store, "test-a", 2, 7, batch_size=2)
+        assert [sequence for sequence, _, _ in ranged] == list(range(2, 7))
+        assert await collect_chunks(store, "test-a", 10) == []
+
+    with_store(check)
+
+
+def test_sequences_continue_after_clear(with_store, batches_a, batches_b):
+    async def check(store):
+        await store.append_batches(batches_a + batches_b)
+        assert await store.clear("test-a") == 10
+        assert await store.extent("test-a") == (10, 0, 0)
+        assert await collect_chunks(store, "test-a") == []
+
+        assert await store.append_batch(batches_a[0]) == 10
+        assert await store.append_batch(batches_a[1]) == 11
+        points = len(batches_a[0]) + len(batches_a[1])
+        assert await store.extent("test-a") == (10, 2, points)
+        chunks = await collect_chunks(store, "test-a")
+        assert [sequence for sequence, _, _ in chunks] == [10, 11]
+        assert np.array_equal(chunks[1][2], batches_a[1].to_records())
+        ranged = await collect_chunks(store, "test-a", 0, 11)
+        assert [sequence for sequence, _, _ in ranged] == [10]
+
+        # Limpiar un escaneo no toca los demás
+        assert await store.extent("test-b") == (0, 1, len(batches_b[0]))
+        assert await store.clear("test-a") == 12
+        assert await store.clear("test-b") == 1
+        # Limpiar un escaneo vacío no falla ni retrocede
+        assert await store.clear("test-b") == 1
+        assert await store.clear("test-missing") == 0
+
+    with_store(check)
+
+
+def test_file_store_survives_reopen(tmp_path):
+    batches = make_stage_batches(BATCH_SIZE, 5, "test-reopen")
+    points = sum(len(batch) for batch in batches)
+
+    async def check():
+        store = create_scan_store("file", directory=tmp_path)
+        await store.open()
+        await store.register_scan("test-reopen", 1_700_000_000.0)
+        await store.append_batches(batches)
+        await store.close()
+        # Un chunk escrito a medias se descarta al reabrir
+        with (tmp_path / f"test-reopen{FILE_STORE_SUFFIX}").open("ab") as fh:
+            fh.write(encode_chunk(batches[0])[:-5])
+
+        reopened = create_scan_store("file", directory=tmp_path)
+        await reopened.open()
+        assert await reopened.extent("test-reopen") == (0, 5, points)
+        assert ("test-reopen", 1_700_000_000.0) in await reopened.list_scans()
+        chunks = await collect_chunks(reopened, "test-reopen")
+        assert np.array_equal(chunks[-1][2], batches[-1].to_records())
+        assert await reopened.append_batch(batches[0]) == 5
+        assert await reopened.clear("test-reopen") == 6
+        await reopened.close()
+
+        # La primera secuencia tras limpiar también sobrevive al reinicio
+        reopened = create_scan_store("file", directory=tmp_path)
+        await reopened.open()
+        assert await reopened.extent("test-reopen") == (6, 0, 0)
+        assert await reopened.append_batch(batches[0]) == 6
+        await reopened.close()
+
+    asyncio.run(check())
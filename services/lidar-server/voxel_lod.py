@@ -0,0 +1,173 @@
+from itertools import repeat
+
+import numpy as np
+
+from point_batch import POINT_RECORD_DTYPE
+
+# Índice de vóxel empaquetado en un int64: 21 bits por eje, desplazados para
+# admitir negativos (±2^20 vóxeles por eje, ±5 km con vóxeles de 5 mm).
+VOXEL_AXIS_BITS = 21
+VOXEL_AXIS_OFFSET = 1 << (VOXEL_AXIS_BITS - 1)
+VOXEL_AXIS_MASK = (1 << VOXEL_AXIS_BITS) - 1
+VOXEL_GRID_INITIAL_CAPACITY = 1024
+# Bytes por vóxel del dict ``slots``: tabla, clave int64 y slot como int de Python
+VOXEL_SLOT_OVERHEAD_BYTES = 112
+CENTROID_COLUMNS = ("x", "y", "z", "intensity")
+
+
+def centroid_columns(records):
+    """``x, y, z, intensity`` de registros ``POINT_RECORD_DTYPE`` en float64 contiguo.
+
+    Se arma una vez por batch y lo comparten todas las grillas.
+    """
+    columns = np.empty((len(records), len(CENTROID_COLUMNS)))
+    for index, name in enumerate(CENTROID_COLUMNS):
+        columns[:, index] = records[name]
+    return columns
+
+
+def voxel_keys(xyz, voxel_size):
+    """Clave int64 del vóxel de cada fila ``(x, y, z)`` para ``voxel_size``"""
+    index = np.floor(xyz * (1.0 / voxel_size)).astype(np.int64)
+    index += VOXEL_AXIS_OFFSET
+    index &= VOXEL_AXIS_MASK
+    return (
+        (index[:, 0] << (2 * VOXEL_AXIS_BITS))
+        | (index[:, 1] << VOXEL_AXIS_BITS)
+        | index[:, 2]
+    )
+
+
+class VoxelGrid:
+    """Submuestreo incremental por grilla de vóxeles.
+
+    Cada vóxel ocupado tiene un slot con la suma de ``x, y, z, intensity`` y
+    la cantidad de puntos, así que su centroide se mantiene al día sin
+    guardar los puntos. ``add`` devuelve sólo los centroides de los vóxeles
+    que el batch ocupó por primera vez.
+    """
+
+    __slots__ = ("voxel_size", "slots", "sums", "counts")
+
+    def __init__(self, voxel_size, capacity=VOXEL_GRID_INITIAL_CAPACITY):
+        self.voxel_size = voxel_size
+        # clave de vóxel -> slot
+        self.slots = {}
+        self.sums = np.zeros((capacity, len(CENTROID_COLUMNS)))
+        self.counts = np.zeros(capacity, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.slots)
+
+    @property
+    def nbytes(self):
+        return (
+            self.sums.nbytes
+            + self.counts.nbytes
+            + len(self.slots) * VOXEL_SLOT_OVERHEAD_BYTES
+        )
+
+    def _reserve(self, size):
+        if size <= len(self.counts):
+            return
+
+        capacity = max(len(self.counts) * 2, size)
+        sums = np.zeros((capacity, len(CENTROID_COLUMNS)))
+        sums[: len(self.sums)] = self.sums
+        counts = np.zeros(capacity, dtype=np.int64)
+        counts[: len(self.counts)] = self.counts
+        self.sums, self.counts = sums, counts
+
+    def add(self, records, columns=None):
+        """Acumula registros ``POINT_RECORD_DTYPE``; devuelve los vóxeles nuevos.
+
+        ``columns`` es ``centroid_columns(records)`` si ya se calculó.
+        """
+        if not len(records):
+            return np.empty(0, dtype=POINT_RECORD_DTYPE)
+        if columns is None:
+            columns = centroid_columns(records)
+
+        keys = voxel_keys(columns[:, :3], self.voxel_size)
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        batch_counts = np.bincount(inverse, minlength=len(unique_keys))
+        batch_sums = np.column_stack(
+            [
+                np.bincount(inverse, weights=column, minlength=len(unique_keys))
+                for column in columns.T
+            ]
+        )
+
+        # Búsqueda y alta en el dict con map/update: sin bucle Python por vóxel
+        slots = self.slots
+        first_new_slot = len(slots)
+        batch_slots = np.fromiter(
+            map(slots.get, unique_keys.tolist(), repeat(-1)),
+            dtype=np.int64,
+            count=len(unique_keys),
+        )
+        missing = batch_slots < 0
+        new_count = int(missing.sum())
+        if new_count:
+            new_slots = np.arange(first_new_slot, first_new_slot + new_count)
+            batch_slots[missing] = new_slots
+            slots.update(zip(unique_keys[missing].tolist(), new_slots.tolist()))
+        self._reserve(len(slots))
+        self.sums[batch_slots] += batch_sums
+        self.counts[batch_slots] += batch_counts
+
+        new_slots = batch_slots[missing]
+        return self._to_records(self.sums[new_slots], self.counts[new_slots])
+
+    def centroids(self):
+        """Copia de los centroides de todos los vóxeles ocupados"""
+        size = len(self.slots)
+        return self._to_records(self.sums[:size], self.counts[:size])
+
+    @staticmethod
+    def _to_records(sums, counts):
+        centroids = sums / counts[:, None]
+        records = np.empty(len(centroids), dtype=POINT_RECORD_DTYPE)
+        for index, name in enumerate(CENTROID_COLUMNS[:3]):
+            records[name] = centroids[:, index]
+        records["intensity"] = np.clip(np.rint(centroids[:, 3]), 0, 255)
+        return records
+
+
+def find_voxel_size(voxel_sizes, value):
+    """Resolución de ``voxel_sizes`` igual a ``value`` o None"""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value in voxel_sizes else None
+
+
+class VoxelLods:
+    """Una ``VoxelGrid`` por resolución (mm) para un escaneo"""
+
+    def __init__(self, voxel_sizes):
+        self.voxel_sizes = tuple(voxel_sizes)
+        self.grids = {}
+        # Cambia en cada reset para cortar los snapshots en curso
+        self.generation = 0
+        self.reset()
+
+    def reset(self):
+        self.generation += 1
+        self.grids = {size: VoxelGrid(size) for size in self.voxel_sizes}
+
+    def add(self, records):
+        """``{voxel_size: centroides nuevos}`` tras acumular ``records``"""
+        columns = centroid_columns(records)
+        return {size: grid.add(records, columns) for size, grid in self.grids.items()}
+
+    @property
+    def nbytes(self):
+        return sum(grid.nbytes for grid in self.grids.values())
+
+    def stats(self):
+        return {
+            f"{size:g}": {"voxels": len(grid), "bytes": grid.nbytes}
+            for size, grid in self.grids.items()
+        }
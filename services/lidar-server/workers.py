@@ -0,0 +1,83 @@
+import json
+import multiprocessing
+import signal
+import struct
+import sys
+import time
+from multiprocessing.connection import wait
+
+# Canal de Redis pub/sub por el que los workers comparten lo que ingieren.
+BUS_CHANNEL = "lidar:fanout"
+BUS_BATCH = b"B"
+BUS_EVENT = b"E"
+# tipo, pid del worker de origen, secuencia, largo del scan_id; luego el
+# scan_id y el chunk almacenado tal cual (ver point_batch.encode_chunk).
+BUS_BATCH_HEADER = struct.Struct("<cIQB")
+# tipo, pid del worker de origen; luego el evento en JSON.
+BUS_EVENT_HEADER = struct.Struct("<cI")
+WORKER_RESTART_DELAY_S = 1.0
+
+
+def encode_bus_batch(origin, scan_id, sequence, chunk):
+    scan = scan_id.encode("utf-8")
+    return BUS_BATCH_HEADER.pack(BUS_BATCH, origin, sequence, len(scan)) + scan + chunk
+
+
+def encode_bus_event(origin, event):
+    return BUS_EVENT_HEADER.pack(BUS_EVENT, origin) + json.dumps(event).encode("utf-8")
+
+
+def decode_bus_message(data):
+    """Devuelve ``(origin, "batch", (scan_id, sequence, chunk))`` u
+    ``(origin, "event", evento)``; ``chunk`` es una vista sobre ``data``.
+    """
+    kind = data[:1]
+    if kind == BUS_BATCH:
+        _, origin, sequence, scan_size = BUS_BATCH_HEADER.unpack_from(data, 0)
+        offset = BUS_BATCH_HEADER.size
+        scan_id = bytes(data[offset : offset + scan_size]).decode("utf-8")
+        chunk = memoryview(data)[offset + scan_size :]
+        return origin, "batch", (scan_id, sequence, chunk)
+
+    if kind == BUS_EVENT:
+        _, origin = BUS_EVENT_HEADER.unpack_from(data, 0)
+        return origin, "event", json.loads(bytes(data[BUS_EVENT_HEADER.size :]))
+
+    raise ValueError(f"unknown bus message kind: {kind!r}")
+
+
+def run_workers(count, target):
+    """Lanza ``count`` procesos ``target(index)`` y reinicia los que terminen.
+
+    Cada worker abre su propio socket en el mismo puerto con
+    ``SO_REUSEPORT`` y el kernel reparte las conexiones entre ellos.
+    """
+    processes = {}
+    # docker stop envía SIGTERM: salir por el finally y terminar los workers
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    def launch(index):
+        process = multiprocessing.Process(
+            target=target, args=(index,), name=f"lidar-worker-{index}", daemon=True
+        )
+        process.start()
+        processes[process.sentinel] = (index, process)
+        print(f"Worker {index} iniciado (pid {process.pid})")
+
+    for index in range(count):
+        launch(index)
+
+    try:
+        while True:
+            for sentinel in wait(list(processes)):
+                index, process = processes.pop(sentinel)
+                print(f"Worker {index} terminó ({process.exitcode}); reiniciando")
+                time.sleep(WORKER_RESTART_DELAY_S)
+                launch(index)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for _, process in processes.values():
+            process.terminate()
+        for _, process in processes.values():
+            process.join()